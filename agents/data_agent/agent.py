@@ -32,6 +32,7 @@ from google.adk.tools import FunctionTool
 
 sys.path.append(str(Path(__file__).parent.parent.parent))
 from src.shared.config_env import prepare_environment
+from src.shared.llm_cache import default_llm_cache
 
 from agents.data_agent.prompts.root_agent import system_instruction as root_agent_instruction
 from agents.data_agent.tools.bi_engineer import bi_engineer_tool
@@ -71,8 +72,10 @@ root_agent = Agent(
     output_key="output",
     description="Data Analytics Consultant",
     instruction=root_agent_instruction,
-    before_model_callback=before_model_callback,
-    after_model_callback=after_model_callback,
+    **default_llm_cache().model_callbacks(
+        before_model_callback=before_model_callback,
+        after_model_callback=after_model_callback,
+    ),
     before_agent_callback=before_agent_callback,
     tools=[
         AgentTool(crm_business_analyst_agent),
@@ -38,6 +38,7 @@ import pandas as pd
 
 from prompts.bi_engineer import prompt as bi_engineer_prompt
 from tools.chart_evaluator import evaluate_chart
+from src.shared.llm_cache import default_llm_cache
 
 
 MAX_RESULT_ROWS_DISPLAY = 50
@@ -106,11 +107,11 @@ def _enhance_parameters(vega_chart: dict, df: pd.DataFrame) -> dict:
 
 
 def _create_chat(model: str, history: list, max_thinking: bool = False):
-    genai_client = GenaiClient(
+    genai_client = default_llm_cache().wrap_client(GenaiClient(
         vertexai=True,
         project="probable-summer-238718",
         location="global",
-    )
+    ))
     return genai_client.chats.create(
         model=model,
         config=GenerateContentConfig(
@@ -20,6 +20,7 @@ from google.genai.types import Content, GenerateContentConfig, Part, SafetySetti
 from pydantic import BaseModel
 
 from prompts.chart_evaluator import prompt as chart_evaluator_prompt
+from src.shared.llm_cache import default_llm_cache
 
 
 CHART_EVALUATOR_MODEL_ID =  "gemini-2.0-flash-001"
@@ -49,11 +50,11 @@ def evaluate_chart(png_image: bytes,
                                             question=question)
 
     image_part = Part.from_bytes(mime_type="image/png", data=png_image)
-    genai_client = GenaiClient(
+    genai_client = default_llm_cache().wrap_client(GenaiClient(
         vertexai=True,
         project="probable-summer-238718",
         location="global",
-    )
+    ))
     eval_result = genai_client.models.generate_content(
         model=CHART_EVALUATOR_MODEL_ID,
         contents=Content(
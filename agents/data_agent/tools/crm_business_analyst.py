@@ -29,6 +29,7 @@ from google.genai.types import (
 
 from prompts.crm_business_analyst import (system_instruction
                                           as crm_business_analyst_instruction)
+from src.shared.llm_cache import default_llm_cache
 
 
 BUSINESS_ANALYST_AGENT_MODEL_ID = "gemini-2.5-pro"
@@ -82,5 +83,6 @@ crm_business_analyst_agent = LlmAgent(
     planner=BuiltInPlanner(
         thinking_config=ThinkingConfig(thinking_budget=32768)
     ),
-    after_model_callback=after_model_callback
+    **default_llm_cache().model_callbacks(
+        after_model_callback=after_model_callback)
 )
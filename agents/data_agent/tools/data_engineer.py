@@ -37,6 +37,7 @@ from prompts.data_engineer import (system_instruction
                                    prompt as data_engineer_prompt)
 from prompts.sql_correction import (instruction as sql_correction_instruction,
                                     prompt as sql_correction_prompt)
+from src.shared.llm_cache import default_llm_cache
 
 # "gemini-2.5-pro-preview-05-06"
 DATA_ENGINEER_AGENT_MODEL_ID = "gemini-2.5-pro"
@@ -141,11 +142,11 @@ async def data_engineer(request: str, tool_context: ToolContext) -> SQLResult:
         sfdc_metadata=_sfdc_metadata
     )
 
-    genai_client = GenaiClient(
+    genai_client = default_llm_cache().wrap_client(GenaiClient(
         vertexai=True,
         project="probable-summer-238718",
         location="global",
-    )
+    ))
     sql_code_result = genai_client.models.generate_content(
         model=DATA_ENGINEER_AGENT_MODEL_ID,
         contents=Content(
@@ -0,0 +1,377 @@
+#!/usr/bin/env python
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Latency and throughput of the agent server at increasing concurrency.
+
+Starts the server (server.py) in a child process with a fake model whose
+latency is known, then drives /run, /run_sse and /run_live with one
+session per concurrent client. Whatever a turn takes beyond the model's
+own time (`model_time_ms`) is server overhead.
+
+    python -m benchmarks.server_load --concurrency 1,8,32,128 \\
+        --requests 400 --output bench.json
+    python -m benchmarks.server_load --baseline bench.json \\
+        --max-regression 0.10
+
+Results are one JSON document; with --baseline, each metric is compared
+with the same endpoint and concurrency in an earlier run, and the exit
+status is 1 when one got worse by more than --max-regression. At high
+concurrency the client itself can become the bottleneck: compare
+`client_cpu_s` with `duration_s`.
+"""
+
+import argparse
+import asyncio
+from datetime import datetime, timezone
+import json
+import os
+from pathlib import Path
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from typing import Optional
+
+import httpx
+from websockets.asyncio.client import connect as websocket_connect
+
+from benchmarks.server_load.fake_model import FakeLlm
+
+APP_NAME = "bench_agent"
+ENDPOINTS = ("run", "run_sse", "run_live")
+REPO_ROOT = Path(__file__).parent.parent.parent
+MESSAGE = {"role": "user", "parts": [{"text": "Which products are in stock?"}]}
+# (metric, True if higher is better) compared against a baseline.
+COMPARED_METRICS = (
+    ("latency_p50_ms", False),
+    ("latency_p99_ms", False),
+    ("ttfe_p50_ms", False),
+    ("throughput_rps", True),
+)
+
+
+def _percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _memory_mb(pid: int) -> dict[str, Optional[float]]:
+    """Current and peak resident memory of a process, on Linux."""
+    values: dict[str, Optional[float]] = {"VmRSS": None, "VmHWM": None}
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                key, _, value = line.partition(":")
+                if key in values:
+                    values[key] = int(value.split()[0]) / 1024
+    except OSError:
+        pass
+    return {"rss_mb": values["VmRSS"], "peak_rss_mb": values["VmHWM"]}
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+            text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def start_server(port: int, model: FakeLlm, tool_result_bytes: int) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        BENCH_LATENCY_MS=str(model.latency_ms),
+        BENCH_TOKENS_PER_SECOND=str(model.tokens_per_second),
+        BENCH_RESPONSE_TOKENS=str(model.response_tokens),
+        BENCH_TOOL_CALLS=str(model.tool_calls),
+        BENCH_TOOL_RESULT_BYTES=str(tool_result_bytes),
+    )
+    server = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.server_load.server", "--port", str(port)],
+        cwd=REPO_ROOT, env=env,
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited with {server.returncode}")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/ready").status_code == 200:
+                return server
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("Server did not become ready")
+
+
+class _Client:
+    """One simulated user with its own session."""
+
+    def __init__(self, http: httpx.AsyncClient, user_id: str, streaming: bool):
+        self.http = http
+        self.user_id = user_id
+        self.streaming = streaming
+        self.session_id: Optional[str] = None
+        self.websocket = None
+
+    async def open(self, endpoint: str):
+        response = await self.http.post(
+            f"/apps/{APP_NAME}/users/{self.user_id}/sessions")
+        response.raise_for_status()
+        self.session_id = response.json()["id"]
+        if endpoint == "run_live":
+            url = str(self.http.base_url.copy_with(scheme="ws", path="/run_live"))
+            self.websocket = await websocket_connect(
+                f"{url}?app_name={APP_NAME}&user_id={self.user_id}"
+                f"&session_id={self.session_id}&modalities=TEXT")
+
+    async def close(self):
+        if self.websocket is not None:
+            await self.websocket.send(json.dumps({"close": True}))
+            await self.websocket.close()
+
+    def _request(self, streaming: bool = False) -> dict:
+        return {
+            "app_name": APP_NAME,
+            "user_id": self.user_id,
+            "session_id": self.session_id,
+            "new_message": MESSAGE,
+            "streaming": streaming,
+        }
+
+    async def turn(self, endpoint: str) -> tuple[float, int]:
+        """Runs one turn; returns time to its first event and event count."""
+        started = time.perf_counter()
+        if endpoint == "run":
+            response = await self.http.post("/run", json=self._request())
+            response.raise_for_status()
+            return time.perf_counter() - started, len(response.json())
+        if endpoint == "run_sse":
+            first_event, events = None, 0
+            async with self.http.stream(
+                "POST", "/run_sse", json=self._request(self.streaming)
+            ) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if line.startswith('data: {"error"'):
+                        raise RuntimeError(line)
+                    if line.startswith("data:"):
+                        first_event = first_event or time.perf_counter() - started
+                        events += 1
+            return first_event or time.perf_counter() - started, events
+        await self.websocket.send(json.dumps({"content": MESSAGE}))
+        first_event, events = None, 0
+        while True:
+            event = json.loads(await self.websocket.recv())
+            first_event = first_event or time.perf_counter() - started
+            events += 1
+            if event.get("turnComplete"):
+                return first_event, events
+
+
+async def run_level(base_url: str, endpoint: str, concurrency: int,
+                    requests: int, streaming: bool, server_pid: int) -> dict:
+    async with httpx.AsyncClient(
+        base_url=base_url,
+        timeout=httpx.Timeout(300.0),
+        limits=httpx.Limits(max_connections=concurrency,
+                            max_keepalive_connections=concurrency),
+    ) as http:
+        clients = [
+            _Client(http, f"bench_user_{index}", streaming)
+            for index in range(concurrency)
+        ]
+        await asyncio.gather(*(client.open(endpoint) for client in clients))
+        # One untimed turn per client loads the runner and the sessions.
+        await asyncio.gather(*(client.turn(endpoint) for client in clients))
+
+        latencies, ttfes, event_counts = [], [], []
+        errors = 0
+        remaining = iter(range(requests))
+        peak_rss = 0.0
+
+        async def drive(client: _Client):
+            nonlocal errors
+            for _ in remaining:
+                started = time.perf_counter()
+                try:
+                    ttfe, events = await client.turn(endpoint)
+                except Exception:
+                    errors += 1
+                    continue
+                latencies.append((time.perf_counter() - started) * 1000)
+                ttfes.append(ttfe * 1000)
+                event_counts.append(events)
+
+        async def sample_memory():
+            nonlocal peak_rss
+            while True:
+                peak_rss = max(peak_rss, _memory_mb(server_pid)["rss_mb"] or 0.0)
+                await asyncio.sleep(0.1)
+
+        sampler = asyncio.create_task(sample_memory())
+        cpu_started, started = time.process_time(), time.perf_counter()
+        await asyncio.gather(*(drive(client) for client in clients))
+        duration = time.perf_counter() - started
+        client_cpu = time.process_time() - cpu_started
+        sampler.cancel()
+        await asyncio.gather(*(client.close() for client in clients))
+
+    result = {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "duration_s": duration,
+        "throughput_rps": len(latencies) / duration if duration else 0.0,
+        "client_cpu_s": client_cpu,
+        "server_rss_max_mb": peak_rss or None,
+        **{f"server_{key}": value for key, value in _memory_mb(server_pid).items()},
+    }
+    if latencies:
+        result.update({
+            "latency_mean_ms": statistics.fmean(latencies),
+            "latency_p50_ms": _percentile(latencies, 0.50),
+            "latency_p95_ms": _percentile(latencies, 0.95),
+            "latency_p99_ms": _percentile(latencies, 0.99),
+            "ttfe_p50_ms": _percentile(ttfes, 0.50),
+            "ttfe_p95_ms": _percentile(ttfes, 0.95),
+            "ttfe_p99_ms": _percentile(ttfes, 0.99),
+            "events_per_request": statistics.fmean(event_counts),
+        })
+    return result
+
+
+def compare(results: list[dict], baseline: dict) -> list[dict]:
+    """Relative change of each metric against the baseline's same level."""
+    previous = {
+        (result["endpoint"], result["concurrency"]): result
+        for result in baseline["results"]
+    }
+    changes = []
+    for result in results:
+        old = previous.get((result["endpoint"], result["concurrency"]))
+        if old is None:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS:
+            if not old.get(metric) or metric not in result:
+                continue
+            change = result[metric] / old[metric] - 1
+            changes.append({
+                "endpoint": result["endpoint"],
+                "concurrency": result["concurrency"],
+                "metric": metric,
+                "baseline": old[metric],
+                "current": result[metric],
+                "change": change,
+                # Positive when the metric got worse.
+                "regression": -change if higher_is_better else change,
+            })
+    return changes
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--endpoint", action="append", choices=ENDPOINTS,
+                        help="Endpoint to drive; repeat for several (default all).")
+    parser.add_argument("--concurrency", default="1,8,32,128",
+                        help="Comma-separated concurrent clients per level.")
+    parser.add_argument("--requests", type=int, default=200,
+                        help="Timed turns per endpoint and level.")
+    parser.add_argument("--streaming", action=argparse.BooleanOptionalAction,
+                        default=True, help="Ask /run_sse for partial events.")
+    parser.add_argument("--latency-ms", type=float, default=50.0,
+                        help="Fake model latency per call.")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--response-tokens", type=int, default=40)
+    parser.add_argument("--tool-calls", type=int, default=1,
+                        help="Tool calls per turn, each one more model call.")
+    parser.add_argument("--tool-result-bytes", type=int, default=256)
+    parser.add_argument("--output", help="Write the results here, not stdout.")
+    parser.add_argument("--baseline", help="Results of an earlier run to compare.")
+    parser.add_argument("--max-regression", type=float, default=None,
+                        help="Fail when a metric is worse by more than this fraction.")
+    args = parser.parse_args()
+    endpoints = args.endpoint or list(ENDPOINTS)
+    levels = [int(level) for level in args.concurrency.split(",")]
+    model = FakeLlm(
+        latency_ms=args.latency_ms,
+        tokens_per_second=args.tokens_per_second,
+        response_tokens=args.response_tokens,
+        tool_calls=args.tool_calls,
+    )
+
+    port = _free_port()
+    server = start_server(port, model, args.tool_result_bytes)
+    results = []
+    try:
+        for endpoint in endpoints:
+            for concurrency in levels:
+                result = await run_level(
+                    f"http://127.0.0.1:{port}", endpoint, concurrency,
+                    args.requests, args.streaming, server.pid)
+                if "latency_p50_ms" in result:
+                    result["overhead_p50_ms"] = (
+                        result["latency_p50_ms"] - model.model_time_ms())
+                print(json.dumps(result), file=sys.stderr)
+                results.append(result)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    report = {
+        "commit": _git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "requests": args.requests,
+            "streaming": args.streaming,
+            "latency_ms": args.latency_ms,
+            "tokens_per_second": args.tokens_per_second,
+            "response_tokens": args.response_tokens,
+            "tool_calls": args.tool_calls,
+            "tool_result_bytes": args.tool_result_bytes,
+            "model_time_ms": model.model_time_ms(),
+        },
+        "results": results,
+    }
+    status = 0
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            report["comparison"] = compare(results, json.load(baseline_file))
+        if args.max_regression is not None and any(
+            change["regression"] > args.max_regression
+            for change in report["comparison"]
+        ):
+            status = 1
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,48 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Benchmark agent: the fake model with two cheap tools.
+
+The model is configured from the BENCH_* variables set by the load test.
+"""
+
+import os
+
+from google.adk.agents import Agent
+
+from benchmarks.server_load.fake_model import FakeLlm
+
+TOOL_RESULT_BYTES = int(os.environ.get("BENCH_TOOL_RESULT_BYTES", "256"))
+
+
+def search_catalog(query: str) -> dict:
+    """Searches the product catalog."""
+    return {"query": query, "results": "x" * TOOL_RESULT_BYTES}
+
+
+def get_inventory(query: str) -> dict:
+    """Returns the stock level of a product."""
+    return {"query": query, "in_stock": len(query)}
+
+
+root_agent = Agent(
+    name="bench_agent",
+    model=FakeLlm(
+        latency_ms=float(os.environ.get("BENCH_LATENCY_MS", "50")),
+        tokens_per_second=float(os.environ.get("BENCH_TOKENS_PER_SECOND", "200")),
+        response_tokens=int(os.environ.get("BENCH_RESPONSE_TOKENS", "40")),
+        tool_calls=int(os.environ.get("BENCH_TOOL_CALLS", "1")),
+    ),
+    instruction="Answer questions about the catalog.",
+    tools=[search_catalog, get_inventory],
+)
@@ -0,0 +1,129 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Deterministic stand-in for Gemini with a fixed latency and token rate.
+
+Each model call waits `latency_ms`, then streams `response_tokens` tokens
+at `tokens_per_second`. A turn first calls the agent's tools
+`tool_calls` times (one model call each, without tokens), then answers.
+"""
+
+import asyncio
+import contextlib
+from typing import AsyncGenerator, Optional
+
+from google.adk.models import BaseLlm, LlmRequest, LlmResponse
+from google.adk.models.base_llm_connection import BaseLlmConnection
+from google.genai import types
+from websockets.exceptions import ConnectionClosedOK
+
+
+class FakeLlm(BaseLlm):
+    model: str = "fake-model"
+    latency_ms: float = 50.0
+    tokens_per_second: float = 200.0
+    response_tokens: int = 40
+    tool_calls: int = 1
+
+    def model_time_ms(self) -> float:
+        """Time one turn spends in the model, the floor of its latency."""
+        token_ms = self.response_tokens / self.tokens_per_second * 1000
+        return (self.tool_calls + 1) * self.latency_ms + token_ms
+
+    def _function_call(self, tool_names: list[str], index: int) -> types.Content:
+        return types.Content(role="model", parts=[types.Part(
+            function_call=types.FunctionCall(
+                name=tool_names[index % len(tool_names)],
+                args={"query": f"item {index}"},
+            )
+        )])
+
+    async def _respond(
+        self, tool_names: list[str], calls_made: int, stream: bool
+    ) -> AsyncGenerator[LlmResponse, None]:
+        await asyncio.sleep(self.latency_ms / 1000)
+        if tool_names and calls_made < self.tool_calls:
+            yield LlmResponse(content=self._function_call(tool_names, calls_made))
+            return
+        tokens = [f"token{i} " for i in range(self.response_tokens)]
+        delay = 1 / self.tokens_per_second
+        if stream:
+            for token in tokens:
+                await asyncio.sleep(delay)
+                yield LlmResponse(
+                    content=types.Content(role="model", parts=[types.Part(text=token)]),
+                    partial=True,
+                )
+        else:
+            await asyncio.sleep(delay * len(tokens))
+        yield LlmResponse(
+            content=types.Content(role="model", parts=[types.Part(text="".join(tokens))]))
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        # Tool results since the user's last message.
+        calls_made = 0
+        for content in reversed(llm_request.contents):
+            parts = content.parts or []
+            if any(part.function_response for part in parts):
+                calls_made += 1
+            elif content.role == "user":
+                break
+        async for response in self._respond(
+            sorted(llm_request.tools_dict), calls_made, stream):
+            yield response
+
+    @contextlib.asynccontextmanager
+    async def connect(self, llm_request: LlmRequest):
+        connection = FakeLlmConnection(self, sorted(llm_request.tools_dict))
+        try:
+            yield connection
+        finally:
+            await connection.close()
+
+
+class FakeLlmConnection(BaseLlmConnection):
+    """Answers each content sent over the live connection as one turn."""
+
+    def __init__(self, model: FakeLlm, tool_names: list[str]):
+        self.model = model
+        self.tool_names = tool_names
+        self._calls_made = 0
+        self._inbox: asyncio.Queue[Optional[types.Content]] = asyncio.Queue()
+
+    async def send_history(self, history: list[types.Content]):
+        pass
+
+    async def send_content(self, content: types.Content):
+        await self._inbox.put(content)
+
+    async def send_realtime(self, blob: types.Blob):
+        pass
+
+    async def receive(self) -> AsyncGenerator[LlmResponse, None]:
+        content = await self._inbox.get()
+        if content is None:
+            raise ConnectionClosedOK(None, None)
+        if any(part.function_response for part in content.parts or []):
+            self._calls_made += 1
+        else:
+            self._calls_made = 0
+        async for response in self.model._respond(
+            self.tool_names, self._calls_made, stream=True):
+            yield response
+        if self._calls_made >= self.model.tool_calls or not self.tool_names:
+            yield LlmResponse(turn_complete=True)
+
+    async def close(self):
+        self._inbox.put_nowait(None)
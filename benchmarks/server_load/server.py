@@ -0,0 +1,49 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""The server under test: get_fast_api_app over the benchmark agents.
+
+Sessions and artifacts are kept in memory so that only the server's own
+work is measured. Runs in its own process, started by the load test.
+"""
+
+import argparse
+from pathlib import Path
+
+import uvicorn
+
+from src.app.fast_api_app import get_fast_api_app
+
+AGENTS_DIR = str(Path(__file__).parent / "agents")
+
+
+def create_app():
+    return get_fast_api_app(
+        agent_dir=AGENTS_DIR,
+        session_service_uri="memory://",
+        artifact_service_uri="memory://",
+        preload_apps=["bench_agent"],
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    uvicorn.run(create_app(), host=args.host, port=args.port,
+                log_level="warning", access_log=False)
+
+
+if __name__ == "__main__":
+    main()
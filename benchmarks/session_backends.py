@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Per-turn session overhead across session service backends.
+
+A "turn" replays the session traffic the FastAPI server generates for one
+`/run` call: the endpoint's existence check, the Runner's load, and the
+appended user and model events.
+
+    python benchmarks/session_backends.py \\
+        --uri memory:// --uri sqlite:///bench_sessions.db \\
+        --uri postgresql://user:pw@localhost/sessions --turns 200
+"""
+
+import argparse
+import asyncio
+import json
+from pathlib import Path
+import statistics
+import sys
+import time
+
+sys.path.append(str(Path(__file__).parent.parent))
+from google.adk.events import Event
+from google.genai import types
+
+from src.app.session_cache import CachedSessionService
+from src.app.session_services import build_session_service
+
+APP_NAME = "session_benchmark"
+USER_ID = "benchmark_user"
+
+
+def _event(author: str, text: str) -> Event:
+    return Event(
+        author=author,
+        invocation_id="benchmark",
+        content=types.Content(role=author, parts=[types.Part(text=text)]),
+    )
+
+
+def _percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def run_backend(uri: str, turns: int, cached: bool) -> dict:
+    service = build_session_service(uri)
+    if cached:
+        service = CachedSessionService(service)
+    session = await service.create_session(app_name=APP_NAME, user_id=USER_ID)
+    timings = []
+    for turn in range(turns):
+        started = time.perf_counter()
+        # Endpoint existence check, then the Runner's own load.
+        await service.get_session(
+            app_name=APP_NAME, user_id=USER_ID, session_id=session.id)
+        session = await service.get_session(
+            app_name=APP_NAME, user_id=USER_ID, session_id=session.id)
+        await service.append_event(session, _event("user", f"question {turn}"))
+        await service.append_event(session, _event("model", f"answer {turn}"))
+        timings.append((time.perf_counter() - started) * 1000)
+    await service.delete_session(
+        app_name=APP_NAME, user_id=USER_ID, session_id=session.id)
+    result = {
+        "uri": uri.split("@")[-1],
+        "cached": cached,
+        "turns": turns,
+        "mean_ms": statistics.fmean(timings),
+        "p50_ms": _percentile(timings, 0.50),
+        "p95_ms": _percentile(timings, 0.95),
+        "p99_ms": _percentile(timings, 0.99),
+    }
+    if cached:
+        result["hit_ratio"] = service.stats()["hit_ratio"]
+    return result
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--uri", action="append",
+                        help="Session service URI; repeat to compare backends.")
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--cache", action="store_true",
+                        help="Also measure each backend behind the session cache.")
+    args = parser.parse_args()
+    uris = args.uri or ["memory://", "sqlite:///bench_sessions.db"]
+
+    for uri in uris:
+        for cached in ([False, True] if args.cache else [False]):
+            result = await run_backend(uri, args.turns, cached)
+            print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
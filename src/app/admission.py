@@ -0,0 +1,226 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Admission control and priority lanes for agent runs"""
+
+import asyncio
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+import math
+import time
+from typing import AsyncIterator, Optional
+
+from src.app.metrics import ServerMetrics
+
+LANE_INTERACTIVE = "interactive"
+LANE_BATCH = "batch"
+DEFAULT_LANE_WEIGHTS = {LANE_INTERACTIVE: 4, LANE_BATCH: 1}
+
+
+class AdmissionRejected(Exception):
+    """Raised when a run can neither start nor wait for a slot."""
+
+    def __init__(self, reason: str, retry_after_seconds: float):
+        super().__init__(f"Agent run rejected: {reason}")
+        self.reason = reason
+        self.retry_after_seconds = retry_after_seconds
+
+
+@dataclass
+class _Waiter:
+    app_name: str
+    user_id: str
+    lane: str
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class RunSlot:
+    """A granted run slot; release it exactly once when the run ends."""
+
+    def __init__(self, controller: Optional["AdmissionController"],
+                 app_name: str, user_id: str):
+        self._controller = controller
+        self.app_name = app_name
+        self.user_id = user_id
+        self._started = time.monotonic()
+
+    def release(self):
+        if self._controller is not None:
+            controller, self._controller = self._controller, None
+            controller._release(self, time.monotonic() - self._started)
+
+
+class AdmissionController:
+    """Limits concurrent runs per app and per user, queueing the overflow.
+
+    Runs that cannot start wait in a bounded queue split into priority
+    lanes. Freed slots go to the lanes by smooth weighted round-robin, so
+    batch callers keep making progress without starving interactive ones.
+    A limit of 0 means unlimited; with both limits at 0 every run is
+    admitted immediately.
+    """
+
+    def __init__(self,
+                 max_runs_per_app: int = 0,
+                 max_runs_per_user: int = 0,
+                 max_queued: int = 100,
+                 queue_timeout_seconds: float = 30.0,
+                 lane_weights: Optional[dict[str, int]] = None,
+                 metrics: Optional[ServerMetrics] = None):
+        self.max_runs_per_app = max_runs_per_app
+        self.max_runs_per_user = max_runs_per_user
+        self.max_queued = max_queued
+        self.queue_timeout_seconds = queue_timeout_seconds
+        self.lane_weights = lane_weights or dict(DEFAULT_LANE_WEIGHTS)
+        self.metrics = metrics
+        self._running_per_app: defaultdict[str, int] = defaultdict(int)
+        self._running_per_user: defaultdict[str, int] = defaultdict(int)
+        self._lanes: dict[str, deque[_Waiter]] = {
+            lane: deque() for lane in self.lane_weights
+        }
+        self._lane_credit: dict[str, int] = {lane: 0 for lane in self.lane_weights}
+        self._queued = 0
+        # Moving average of run duration, used to suggest Retry-After.
+        self._avg_run_seconds = 1.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_runs_per_app > 0 or self.max_runs_per_user > 0
+
+    def _has_capacity(self, app_name: str, user_id: str) -> bool:
+        return (
+            (self.max_runs_per_app <= 0
+             or self._running_per_app.get(app_name, 0) < self.max_runs_per_app)
+            and (self.max_runs_per_user <= 0
+                 or self._running_per_user.get(user_id, 0) < self.max_runs_per_user)
+        )
+
+    def _start(self, app_name: str, user_id: str) -> RunSlot:
+        self._running_per_app[app_name] += 1
+        self._running_per_user[user_id] += 1
+        return RunSlot(self, app_name, user_id)
+
+    def _retry_after(self) -> float:
+        capacity = max(1, self.max_runs_per_app or self.max_runs_per_user)
+        return max(1.0, self._avg_run_seconds * (self._queued + 1) / capacity)
+
+    def _observe_queue(self, lane: str):
+        if self.metrics:
+            self.metrics.admission_queue_depth.labels(lane).set(len(self._lanes[lane]))
+
+    def _reject(self, app_name: str, lane: str, reason: str) -> AdmissionRejected:
+        if self.metrics:
+            self.metrics.admission_rejections.labels(app_name, lane, reason).inc()
+        return AdmissionRejected(reason, self._retry_after())
+
+    async def acquire(self, app_name: str, user_id: str,
+                      lane: str = LANE_INTERACTIVE) -> RunSlot:
+        """Waits for a run slot, or raises AdmissionRejected."""
+        if not self.enabled:
+            return RunSlot(None, app_name, user_id)
+        if lane not in self._lanes:
+            lane = LANE_INTERACTIVE
+        if self._queued == 0 and self._has_capacity(app_name, user_id):
+            self._observe_wait(app_name, lane, 0.0)
+            return self._start(app_name, user_id)
+        if self._queued >= self.max_queued:
+            raise self._reject(app_name, lane, "queue_full")
+
+        waiter = _Waiter(app_name, user_id, lane,
+                         asyncio.get_running_loop().create_future())
+        self._lanes[lane].append(waiter)
+        self._queued += 1
+        self._observe_queue(lane)
+        # Runs queued ahead may be blocked on other apps or users only.
+        self._dispatch()
+        try:
+            slot = await asyncio.wait_for(
+                asyncio.shield(waiter.future), self.queue_timeout_seconds)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # The slot was granted just as we gave up; hand it back.
+                waiter.future.result().release()
+            else:
+                waiter.future.cancel()
+                self._lanes[lane].remove(waiter)
+                self._queued -= 1
+                self._observe_queue(lane)
+            if isinstance(e, asyncio.TimeoutError):
+                raise self._reject(app_name, lane, "queue_timeout") from None
+            raise
+        self._observe_wait(app_name, lane, time.monotonic() - waiter.enqueued_at)
+        return slot
+
+    def _observe_wait(self, app_name: str, lane: str, seconds: float):
+        if self.metrics:
+            self.metrics.admission_wait_seconds.labels(app_name, lane).observe(seconds)
+
+    def _release(self, slot: RunSlot, run_seconds: float):
+        self._avg_run_seconds += 0.1 * (run_seconds - self._avg_run_seconds)
+        self._running_per_app[slot.app_name] -= 1
+        if not self._running_per_app[slot.app_name]:
+            del self._running_per_app[slot.app_name]
+        self._running_per_user[slot.user_id] -= 1
+        if not self._running_per_user[slot.user_id]:
+            del self._running_per_user[slot.user_id]
+        self._dispatch()
+
+    def _next_eligible(self, lane: str) -> Optional[_Waiter]:
+        for waiter in self._lanes[lane]:
+            if self._has_capacity(waiter.app_name, waiter.user_id):
+                return waiter
+        return None
+
+    def _dispatch(self):
+        """Starts queued runs while any of them fits under the limits."""
+        while self._queued:
+            eligible = {
+                lane: waiter for lane in self._lanes
+                if (waiter := self._next_eligible(lane)) is not None
+            }
+            if not eligible:
+                return
+            # Smooth weighted round-robin over the lanes that can start a run.
+            total_weight = 0
+            for lane in eligible:
+                self._lane_credit[lane] += self.lane_weights[lane]
+                total_weight += self.lane_weights[lane]
+            lane = max(eligible, key=lambda name: self._lane_credit[name])
+            self._lane_credit[lane] -= total_weight
+
+            waiter = eligible[lane]
+            self._lanes[lane].remove(waiter)
+            self._queued -= 1
+            self._observe_queue(lane)
+            waiter.future.set_result(self._start(waiter.app_name, waiter.user_id))
+
+    def stats(self) -> dict:
+        return {
+            "running_per_app": dict(self._running_per_app),
+            "queued": {lane: len(waiters) for lane, waiters in self._lanes.items()},
+            "avg_run_seconds": self._avg_run_seconds,
+        }
+
+
+def retry_after_header(error: AdmissionRejected) -> dict[str, str]:
+    return {"Retry-After": str(math.ceil(error.retry_after_seconds))}
+
+
+async def release_after(stream: AsyncIterator, slot: RunSlot) -> AsyncIterator:
+    """Passes a response stream through and releases the slot when it ends."""
+    try:
+        async for chunk in stream:
+            yield chunk
+    finally:
+        slot.release()
@@ -0,0 +1,122 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Agent discovery index"""
+
+import ast
+import logging
+import os
+from pathlib import Path
+import sys
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+_SKIPPED_DIRS = {"__pycache__", "node_modules", "static", "prompts", "tools", "utils"}
+
+
+def _defines_root_agent(agent_file: Path) -> bool:
+    """Checks whether a module binds `root_agent` at top level, without importing it."""
+    try:
+        tree = ast.parse(agent_file.read_text(encoding="utf-8"), str(agent_file))
+    except (OSError, SyntaxError, UnicodeDecodeError) as e:
+        logger.warning("Skipping %s: %s", agent_file, e)
+        return False
+    for node in tree.body:
+        if isinstance(node, ast.Assign):
+            targets = node.targets
+        elif isinstance(node, ast.AnnAssign):
+            targets = [node.target]
+        elif isinstance(node, ast.ImportFrom):
+            if any((alias.asname or alias.name) == "root_agent" for alias in node.names):
+                return True
+            continue
+        else:
+            continue
+        if any(isinstance(t, ast.Name) and t.id == "root_agent" for t in targets):
+            return True
+    return False
+
+
+class AgentIndex:
+    """Maps app names to the module that defines their `root_agent`.
+
+    `agents_dir` is either a single agent package (a directory with an
+    `agent.py`) or a tree of them, such as the repo's `agents/` directory.
+    In a tree, each child directory is one app named after it; its agent
+    module is either `<app>/agent.py` or, for apps laid out for their own
+    Cloud Run container, `<app>/<package>/agent.py`.
+
+    The index is built from the file system alone. Agent modules are only
+    imported when an app is first used.
+    """
+
+    def __init__(self, agents_dir: str):
+        self.agents_dir = Path(agents_dir).resolve()
+        self._base_dir = self._import_base(self.agents_dir)
+        self._modules: dict[str, str] = {}
+        self.rescan()
+
+    @staticmethod
+    def _import_base(agents_dir: Path) -> Path:
+        """Returns the sys.path entry that agent module names are relative to."""
+        cwd = Path(os.getcwd()).resolve()
+        if agents_dir.is_relative_to(cwd) and agents_dir != cwd:
+            # Agents such as data_agent import themselves as `agents.<app>`.
+            return cwd
+        base_dir = agents_dir.parent
+        if str(base_dir) not in sys.path:
+            sys.path.append(str(base_dir))
+        return base_dir
+
+    def _module_name(self, agent_file: Path) -> str:
+        return ".".join(agent_file.with_suffix("").relative_to(self._base_dir).parts)
+
+    def _find_agent_file(self, app_dir: Path) -> Optional[Path]:
+        agent_file = app_dir / "agent.py"
+        if agent_file.is_file() and _defines_root_agent(agent_file):
+            return agent_file
+        for child in sorted(app_dir.iterdir()):
+            if not child.is_dir() or child.name in _SKIPPED_DIRS:
+                continue
+            agent_file = child / "agent.py"
+            if agent_file.is_file() and _defines_root_agent(agent_file):
+                return agent_file
+        return None
+
+    def rescan(self) -> dict[str, str]:
+        """Rebuilds the index from disk and returns it."""
+        modules = {}
+        if (self.agents_dir / "agent.py").is_file():
+            app_dirs = [self.agents_dir]
+        else:
+            app_dirs = [
+                d for d in sorted(self.agents_dir.iterdir())
+                if d.is_dir() and not d.name.startswith((".", "_"))
+                and d.name not in _SKIPPED_DIRS
+            ]
+        for app_dir in app_dirs:
+            agent_file = self._find_agent_file(app_dir)
+            if agent_file:
+                modules[app_dir.name] = self._module_name(agent_file)
+        self._modules = modules
+        logger.info("Discovered %s agent apps in %s: %s",
+                    len(modules), self.agents_dir, sorted(modules))
+        return modules
+
+    def app_names(self) -> list[str]:
+        return sorted(self._modules)
+
+    def module_for(self, app_name: str) -> Optional[str]:
+        """Returns the dotted name of the app's agent module, if it is indexed."""
+        return self._modules.get(app_name)
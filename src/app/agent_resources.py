@@ -0,0 +1,330 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Lifecycle of root agents and their tool connections"""
+
+import asyncio
+from collections import defaultdict
+from contextlib import AsyncExitStack, asynccontextmanager
+from dataclasses import dataclass, field
+import inspect
+import logging
+import time
+from types import ModuleType
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+
+from google.adk.agents import BaseAgent
+from google.adk.tools.base_toolset import BaseToolset
+
+logger = logging.getLogger(__name__)
+
+AgentFactory = Callable[[], Awaitable[tuple[BaseAgent, AsyncExitStack]]]
+
+
+class _Generation:
+    """Counts the runs using one build of an agent and its connections."""
+
+    def __init__(self):
+        self.runs = 0
+        self.idle = asyncio.Event()
+        self.idle.set()
+
+    def acquire(self):
+        self.runs += 1
+        self.idle.clear()
+
+    def release(self):
+        self.runs -= 1
+        if not self.runs:
+            self.idle.set()
+
+
+@dataclass
+class _AgentResource:
+    app_name: str
+    agent: BaseAgent
+    exit_stack: Optional[AsyncExitStack] = None
+    # Rebuilds (agent, exit_stack) for agents defined by a coroutine.
+    factory: Optional[AgentFactory] = None
+    toolsets: list[BaseToolset] = field(default_factory=list)
+    healthy: bool = True
+    failures: int = 0
+    reconnects: int = 0
+    last_error: Optional[str] = None
+    last_check: Optional[float] = None
+    reconnect_task: Optional[asyncio.Task] = None
+    generation: _Generation = field(default_factory=_Generation)
+
+
+def _find_toolsets(agent: BaseAgent) -> list[BaseToolset]:
+    """Returns the toolsets (MCP, toolbox, ...) used anywhere in an agent tree."""
+    toolsets: dict[int, BaseToolset] = {}
+    seen: set[int] = set()
+    pending = [agent]
+    while pending:
+        current = pending.pop()
+        if id(current) in seen:
+            continue
+        seen.add(id(current))
+        pending.extend(getattr(current, "sub_agents", None) or [])
+        for tool in getattr(current, "tools", None) or []:
+            if isinstance(tool, BaseToolset):
+                toolsets[id(tool)] = tool
+            elif isinstance(getattr(tool, "agent", None), BaseAgent):
+                pending.append(tool.agent)  # an AgentTool
+    return list(toolsets.values())
+
+
+async def _close_toolsets(app_name: str, toolsets: list[BaseToolset]):
+    for toolset in toolsets:
+        try:
+            await toolset.close()
+        except Exception as e:
+            logger.warning("Error closing toolset of %s: %s", app_name, e)
+
+
+async def _close_stack(app_name: str, exit_stack: Optional[AsyncExitStack]):
+    if exit_stack is None:
+        return
+    try:
+        await exit_stack.aclose()
+    except Exception as e:
+        logger.warning("Error closing resources of %s: %s", app_name, e)
+
+
+class AgentResourcePool:
+    """Owns root agents, their exit stacks and their toolset connections.
+
+    Each app's root agent is loaded once and reused by every run. A
+    background loop lists the tools of each toolset (MCP, toolbox) to check
+    its connection. A failed check starts a reconnect in the background:
+    requests keep getting the current agent instead of waiting on it.
+    Agents returned by an awaitable `root_agent` are rebuilt by calling
+    the module's coroutine function of the same name again; others only
+    have their toolsets' sessions closed, so the next call reconnects.
+    `on_rebuild(app_name)` is called after an agent is replaced.
+
+    Runs hold a `lease` on the agent they use. Replaced resources, and the
+    sessions of toolsets that are reconnected in place, are closed once
+    their runs have finished, or after `drain_timeout_seconds`.
+    """
+
+    def __init__(self,
+                 load_module: Callable[[str], Awaitable[ModuleType]],
+                 on_rebuild: Optional[Callable[[str], None]] = None,
+                 health_check_interval_seconds: float = 30.0,
+                 health_check_timeout_seconds: float = 10.0,
+                 max_reconnect_delay_seconds: float = 60.0,
+                 drain_timeout_seconds: float = 60.0):
+        self.load_module = load_module
+        self.on_rebuild = on_rebuild
+        self.health_check_interval_seconds = health_check_interval_seconds
+        self.health_check_timeout_seconds = health_check_timeout_seconds
+        self.max_reconnect_delay_seconds = max_reconnect_delay_seconds
+        self.drain_timeout_seconds = drain_timeout_seconds
+        self._resources: dict[str, _AgentResource] = {}
+        self._locks: defaultdict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+        self._health_task: Optional[asyncio.Task] = None
+        # Closing agents that were replaced, once their runs finish.
+        self._retiring: set[asyncio.Task] = set()
+
+    async def get(self, app_name: str) -> BaseAgent:
+        """Returns the app's root agent, loading it on first use."""
+        resource = self._resources.get(app_name)
+        if resource is not None:
+            return resource.agent
+        async with self._locks[app_name]:
+            if app_name not in self._resources:
+                self._resources[app_name] = await self._load(app_name)
+            return self._resources[app_name].agent
+
+    @asynccontextmanager
+    async def lease(self, app_name: str) -> AsyncIterator[None]:
+        """Marks a run as using the app's current agent until it exits.
+
+        Take the lease before looking up the runner, so the run counts
+        against the build of the agent it ends up using, or a newer one.
+        """
+        await self.get(app_name)
+        generation = self._resources[app_name].generation
+        generation.acquire()
+        try:
+            yield
+        finally:
+            generation.release()
+
+    async def _drain(self, app_name: str, generation: _Generation):
+        try:
+            await asyncio.wait_for(
+                generation.idle.wait(), self.drain_timeout_seconds)
+        except asyncio.TimeoutError:
+            logger.warning("%s runs of %s still in progress after %.0fs; "
+                           "closing their connections", generation.runs,
+                           app_name, self.drain_timeout_seconds)
+
+    async def _retire(self, app_name: str, generation: _Generation,
+                      toolsets: list[BaseToolset],
+                      exit_stack: Optional[AsyncExitStack]):
+        try:
+            await self._drain(app_name, generation)
+        finally:
+            await _close_toolsets(app_name, toolsets)
+            await _close_stack(app_name, exit_stack)
+
+    async def _load(self, app_name: str) -> _AgentResource:
+        module = await self.load_module(app_name)
+        root_agent = getattr(module, "root_agent", None)
+        if not root_agent:
+            raise ValueError(f'Unable to find "root_agent" from {app_name}.')
+        if not inspect.isawaitable(root_agent):
+            return _AgentResource(
+                app_name, root_agent, toolsets=_find_toolsets(root_agent))
+
+        # `root_agent = create_agent()` leaves a coroutine named after the
+        # function that made it; keep the function to rebuild the agent.
+        factory = getattr(module, getattr(root_agent, "__name__", ""), None)
+        if not inspect.iscoroutinefunction(factory):
+            factory = None
+        try:
+            agent, exit_stack = await root_agent
+        except Exception as e:
+            raise RuntimeError(f"error getting root agent, {e}") from e
+        return _AgentResource(
+            app_name, agent, exit_stack, factory, _find_toolsets(agent))
+
+    async def _check(self, resource: _AgentResource):
+        """Raises if any toolset of the agent cannot list its tools."""
+        resource.last_check = time.time()
+        await asyncio.gather(*(
+            asyncio.wait_for(
+                toolset.get_tools(), self.health_check_timeout_seconds)
+            for toolset in resource.toolsets
+        ))
+
+    async def check_health(self):
+        """Checks every loaded agent, reconnecting the unhealthy ones."""
+        resources = [
+            resource for resource in self._resources.values()
+            if resource.reconnect_task is None
+        ]
+        results = await asyncio.gather(
+            *(self._check(resource) for resource in resources),
+            return_exceptions=True,
+        )
+        for resource, result in zip(resources, results):
+            if isinstance(result, BaseException):
+                logger.warning(
+                    "Health check of %s failed: %r", resource.app_name, result)
+                resource.healthy = False
+                resource.failures += 1
+                resource.last_error = repr(result)
+                resource.reconnect_task = asyncio.create_task(
+                    self._reconnect(resource))
+            else:
+                resource.healthy = True
+
+    async def _reconnect(self, resource: _AgentResource):
+        delay = 1.0
+        try:
+            while True:
+                try:
+                    if resource.factory is not None:
+                        agent, exit_stack = await resource.factory()
+                        old = (resource.generation, resource.toolsets,
+                               resource.exit_stack)
+                        resource.agent, resource.exit_stack = agent, exit_stack
+                        resource.toolsets = _find_toolsets(agent)
+                        resource.generation = _Generation()
+                        if self.on_rebuild:
+                            self.on_rebuild(resource.app_name)
+                        # Runs on the old agent keep its connections open
+                        # until they finish.
+                        task = asyncio.create_task(
+                            self._retire(resource.app_name, *old))
+                        self._retiring.add(task)
+                        task.add_done_callback(self._retiring.discard)
+                    else:
+                        # The toolsets are shared with the runs in progress,
+                        # so their sessions are closed only once those end.
+                        # Runs starting from now on count separately and are
+                        # not waited for. Listing tools then opens new ones.
+                        old_generation = resource.generation
+                        resource.generation = _Generation()
+                        await self._drain(resource.app_name, old_generation)
+                        for toolset in resource.toolsets:
+                            await toolset.close()
+                    await self._check(resource)
+                except Exception as e:
+                    resource.last_error = repr(e)
+                    logger.warning(
+                        "Reconnecting %s failed, retrying in %.0fs: %r",
+                        resource.app_name, delay, e)
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, self.max_reconnect_delay_seconds)
+                    continue
+                logger.info("Reconnected %s", resource.app_name)
+                resource.healthy = True
+                resource.reconnects += 1
+                return
+        finally:
+            resource.reconnect_task = None
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_check_interval_seconds)
+            try:
+                await self.check_health()
+            except Exception as e:
+                logger.exception("Error checking agent health: %s", e)
+
+    def start(self):
+        if self._health_task is None and self.health_check_interval_seconds > 0:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def close(self):
+        """Stops checking and closes every toolset and exit stack."""
+        tasks = [self._health_task] if self._health_task else []
+        tasks += [
+            resource.reconnect_task for resource in self._resources.values()
+            if resource.reconnect_task
+        ]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._health_task = None
+        # Replaced agents are closed now instead of after their drain.
+        retiring = list(self._retiring)
+        for task in retiring:
+            task.cancel()
+        await asyncio.gather(*retiring, return_exceptions=True)
+        resources = list(self._resources.values())
+        self._resources.clear()
+        for resource in resources:
+            await _close_toolsets(resource.app_name, resource.toolsets)
+            await _close_stack(resource.app_name, resource.exit_stack)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            app_name: {
+                "healthy": resource.healthy,
+                "toolsets": len(resource.toolsets),
+                "rebuildable": resource.factory is not None,
+                "reconnecting": resource.reconnect_task is not None,
+                "failures": resource.failures,
+                "reconnects": resource.reconnects,
+                "runs": resource.generation.runs,
+                "last_error": resource.last_error,
+                "last_check": resource.last_check,
+            }
+            for app_name, resource in self._resources.items()
+        }
@@ -14,12 +14,26 @@
 """Agent Runtime Client"""
 
 from abc import ABC, abstractmethod
+import asyncio
+from dataclasses import asdict, dataclass
+import hashlib
 import json
 import logging
-from typing import AsyncGenerator, Union, Optional
+import os
+import random
+import re
+import threading
+import time
+from typing import (Any, AsyncGenerator, AsyncIterator, Callable, Iterable,
+                    Union, Optional)
 from typing_extensions import override
+from urllib.parse import urlsplit
+import uuid
+import weakref
 
-import requests
+import google.auth
+import google.auth.transport.requests
+import httpx
 
 from google.adk.events import Event
 from google.adk.sessions import Session
@@ -29,12 +43,21 @@ from pydantic import ValidationError
 
 
 MAX_RUN_RETRIES = 10
+RETRY_BASE_DELAY_SECONDS = 0.5
+RETRY_MAX_DELAY_SECONDS = 30.0
+RETRYABLE_STATUS_CODES = {429, 502, 503, 504}
+# Agent turns can take very long between events; connecting cannot.
+SSE_TIMEOUT = httpx.Timeout(60.0, read=60 * 60 * 24 * 7)
+SSE_POOL_LIMITS = httpx.Limits(max_connections=200, max_keepalive_connections=50)
+CLOUD_PLATFORM_SCOPE = "https://www.googleapis.com/auth/cloud-platform"
 
 logger = logging.getLogger(__name__)
 
 class AgentRuntime(ABC):
     def __init__(self, session: Session):
         self.session = session
+        # Error reported by the agent or the transport in the last query.
+        self.last_error: Optional[str] = None
 
     @abstractmethod
     async def stream_query(self, message: str) -> AsyncGenerator[Event, None]:
@@ -45,79 +68,328 @@ class AgentRuntime(ABC):
         pass
 
 
-async def sse_client(url, request, headers):
+@dataclass
+class SseMessage:
+    data: str
+    id: Optional[str] = None
+    event: Optional[str] = None
+
+
+class SseParser:
+    """Incremental Server-Sent Events parser over raw byte chunks.
+
+    Chunks may split lines, and lines may end in CRLF, LF or CR. Multi-line
+    'data:' fields are joined with newlines. `last_event_id` follows the
+    'id:' fields as the SSE spec defines it, for Last-Event-ID.
     """
-    A very minimal SSE client using only the requests library.
-    Yields the data content from SSE messages.
-    Handles multi-line 'data:' fields for a single event.
+
+    _LINE_END = re.compile(rb"\r\n|\r|\n")
+
+    def __init__(self, last_event_id: Optional[str] = None):
+        self.last_event_id = last_event_id
+        self._buffer = bytearray()
+        self._data: list[str] = []
+        self._event: Optional[str] = None
+
+    def feed(self, chunk: bytes) -> list[SseMessage]:
+        """Adds a chunk; returns the messages it completed."""
+        self._buffer += chunk
+        messages = []
+        start = 0
+        while match := self._LINE_END.search(self._buffer, start):
+            if match.group() == b"\r" and match.end() == len(self._buffer):
+                break  # may be the first half of a CRLF
+            message = self._line(bytes(self._buffer[start:match.start()]))
+            if message is not None:
+                messages.append(message)
+            start = match.end()
+        del self._buffer[:start]
+        return messages
+
+    def flush(self) -> Optional[SseMessage]:
+        """Ends the stream; returns a message left without a blank line."""
+        if self._buffer:
+            self._line(bytes(self._buffer))
+            self._buffer.clear()
+        return self._line(b"")
+
+    def _line(self, line: bytes) -> Optional[SseMessage]:
+        if not line:
+            if not self._data:
+                self._event = None
+                return None
+            message = SseMessage("\n".join(self._data), self.last_event_id,
+                                 self._event)
+            self._data, self._event = [], None
+            return message
+        if line.startswith(b":"):
+            return None  # comment
+        field, _, value = line.partition(b":")
+        if value.startswith(b" "):
+            value = value[1:]
+        if field == b"data":
+            self._data.append(value.decode("utf-8"))
+        elif field == b"id" and b"\0" not in value:
+            self.last_event_id = value.decode("utf-8")
+        elif field == b"event":
+            self._event = value.decode("utf-8")
+        return None
+
+
+# One keep-alive pool per event loop; connections cannot move across loops.
+_http_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = (
+    weakref.WeakKeyDictionary())
+
+
+def shared_http_client() -> httpx.AsyncClient:
+    """Returns the running loop's pooled client, creating it on first use."""
+    loop = asyncio.get_running_loop()
+    client = _http_clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(timeout=SSE_TIMEOUT, limits=SSE_POOL_LIMITS)
+        _http_clients[loop] = client
+    return client
+
+
+async def sse_messages(
+    url: str,
+    request: dict,
+    headers: Optional[dict] = None,
+    *,
+    last_event_id: Optional[str] = None,
+    http_client: Optional[httpx.AsyncClient] = None,
+) -> AsyncGenerator[SseMessage, None]:
+    """POSTs `request` and yields the SSE messages of the response.
+
+    Runs on a pooled keep-alive connection and never blocks the event
+    loop. `last_event_id` is sent as Last-Event-ID, to resume a stream.
     """
-    if not headers:
-        headers = {}
+    headers = dict(headers or {})
     headers["Accept"] = "text/event-stream"
     headers["Cache-Control"] = "no-cache"
-    try:
-        # stream=True is essential for SSE
-        # timeout=None can be used for very long-lived connections,
-        # but be aware of potential indefinite blocking if server misbehaves.
-        # A specific timeout (e.g., (3.05, 60)) for connect and read can be safer.
-        with requests.post(url, json=request, stream=True, headers=headers, timeout=(60, 60*60*24*7)) as response:
-            response.raise_for_status()  # Raise an exception for HTTP error codes (4xx or 5xx)
-            logger.info(f"Connected to SSE stream at {url}")
-
-            current_event_data_lines = []
-            for line_bytes in response.iter_lines(): # iter_lines gives bytes
-                if not line_bytes: # An empty line signifies the end of an event
-                    if current_event_data_lines:
-                        # Join accumulated data lines for the event
-                        full_data_string = "\n".join(current_event_data_lines)
-                        yield full_data_string
-                        current_event_data_lines = [] # Reset for the next event
-                    continue # Skip further processing for this empty line
-
-                # Decode bytes to string (SSE is typically UTF-8)
-                line = line_bytes.decode('utf-8')
-
-                if line.startswith(':'): # Comment line, ignore
-                    continue
-
-                # We are only interested in 'data:' lines for this minimal client
-                if line.startswith('data:'):
-                    # Strip "data:" prefix and any leading/trailing whitespace from the value part
-                    data_value = line[len('data:'):].lstrip()
-                    current_event_data_lines.append(data_value)
+    if last_event_id:
+        headers["Last-Event-ID"] = last_event_id
+    client = http_client or shared_http_client()
+    parser = SseParser(last_event_id)
+    async with client.stream("POST", url, json=request, headers=headers) as response:
+        response.raise_for_status()
+        logger.info("Connected to SSE stream at %s", url)
+        async for chunk in response.aiter_bytes():
+            for message in parser.feed(chunk):
+                yield message
+    if message := parser.flush():
+        yield message
 
-                # Other SSE fields like 'event:', 'id:', 'retry:' are ignored here.
 
-            # If the stream ends and there's pending data (no final empty line)
-            if current_event_data_lines:
-                full_data_string = "\n".join(current_event_data_lines)
-                yield full_data_string
-
-    except requests.exceptions.RequestException as e:
+async def sse_client(url, request, headers, **kwargs):
+    """Yields the data of each SSE message; see sse_messages."""
+    try:
+        async for message in sse_messages(url, request, headers, **kwargs):
+            yield message.data
+    except httpx.HTTPError as e:
         logger.error(f"Error connecting or streaming SSE: {e}")
-    except KeyboardInterrupt:
-        logging.warning("SSE stream manually interrupted.")
     finally:
         logging.info("SSE client finished.")
 
+def _is_retryable(e: httpx.HTTPError) -> bool:
+    if isinstance(e, httpx.HTTPStatusError):
+        return e.response.status_code in RETRYABLE_STATUS_CODES
+    return isinstance(e, httpx.TransportError)
+
+
+def _backoff_delay(failures: int) -> float:
+    """Exponential backoff with full jitter for the n-th failure in a row."""
+    return random.uniform(0, min(
+        RETRY_MAX_DELAY_SECONDS, RETRY_BASE_DELAY_SECONDS * 2 ** (failures - 1)))
+
+
+class LazyEvent:
+    """An event parsed from JSON once and validated only when needed.
+
+    The cheap fields (id, author, partial, text, ...) are read from the
+    parsed dict. Anything else materializes the full Event on first use,
+    so a LazyEvent can stand in for an Event.
+    """
+
+    __slots__ = ("data", "_event")
+
+    def __init__(self, data: dict):
+        self.data = data
+        self._event: Optional[Event] = None
+
+    @property
+    def id(self) -> str:
+        return self.data.get("id", "")
+
+    @property
+    def author(self) -> str:
+        return self.data.get("author", "")
+
+    @property
+    def invocation_id(self) -> str:
+        return self.data.get("invocationId", "")
+
+    @property
+    def partial(self) -> bool:
+        return bool(self.data.get("partial"))
+
+    @property
+    def turn_complete(self) -> bool:
+        return bool(self.data.get("turnComplete"))
+
+    @property
+    def parts(self) -> list[dict]:
+        return (self.data.get("content") or {}).get("parts") or []
+
+    @property
+    def text(self) -> str:
+        """The event's text, without thoughts."""
+        return "".join(
+            part.get("text", "") for part in self.parts if not part.get("thought"))
+
+    def is_final_response(self) -> bool:
+        """Event.is_final_response, computed on the dict."""
+        actions = self.data.get("actions") or {}
+        if actions.get("skipSummarization") or self.data.get("longRunningToolIds"):
+            return True
+        parts = self.parts
+        return (
+            not any("functionCall" in part or "functionResponse" in part
+                    for part in parts)
+            and not self.partial
+            and not (parts and "codeExecutionResult" in parts[-1])
+        )
+
+    def to_event(self) -> Event:
+        if self._event is None:
+            self._event = Event.model_validate(self.data)
+        return self._event
+
+    def __getattr__(self, name: str):
+        return getattr(self.to_event(), name)
+
+
+def event_text(event: Union[Event, LazyEvent]) -> str:
+    """Text of an Event or LazyEvent, without thoughts."""
+    if isinstance(event, LazyEvent):
+        return event.text
+    if not event.content or not event.content.parts:
+        return ""
+    return "".join(
+        part.text for part in event.content.parts if part.text and not part.thought)
+
+
+@dataclass
+class TextDelta:
+    """Text an author streamed since the previous delta."""
+    author: str
+    text: str
+
+
+class PartialTextAggregator:
+    """Folds partial text events into per-author buffers.
+
+    Partial events are never emitted. Every other event is, after the text
+    buffered for its author is dropped: ADK's non-partial event repeats the
+    whole text. With emit="delta", the buffered text is also emitted as
+    TextDelta once at least `min_delta_chars` are pending, and whatever is
+    pending before a non-partial event.
+    """
+
+    def __init__(self, emit: str = "final", min_delta_chars: int = 1):
+        if emit not in ("final", "delta"):
+            raise ValueError(f"Unknown emit mode: {emit}")
+        self.emit = emit
+        self.min_delta_chars = min_delta_chars
+        self.buffers: dict[str, list[str]] = {}
+        # Chunks not emitted as a delta yet, and their length.
+        self._pending: dict[str, list[str]] = {}
+        self._pending_chars: dict[str, int] = {}
+
+    def text(self, author: str) -> str:
+        """Partial text streamed by `author` so far."""
+        return "".join(self.buffers.get(author, []))
+
+    def _delta(self, author: str) -> Optional[TextDelta]:
+        self._pending_chars.pop(author, None)
+        pending = self._pending.pop(author, None)
+        return TextDelta(author, "".join(pending)) if pending else None
+
+    def feed(self, event: Union[Event, LazyEvent]) -> list:
+        """Returns what to emit for `event`, in order."""
+        author = event.author
+        if event.partial:
+            text = event_text(event)
+            if not text:
+                return []
+            self.buffers.setdefault(author, []).append(text)
+            if self.emit != "delta":
+                return []
+            self._pending.setdefault(author, []).append(text)
+            self._pending_chars[author] = self._pending_chars.get(author, 0) + len(text)
+            if self._pending_chars[author] < self.min_delta_chars:
+                return []
+            return [self._delta(author)]
+        emitted = []
+        if self.emit == "delta" and (delta := self._delta(author)):
+            emitted.append(delta)
+        self.buffers.pop(author, None)
+        emitted.append(event)
+        return emitted
+
+    def flush(self) -> list[TextDelta]:
+        """Pending deltas of a stream that ended mid-text."""
+        deltas = [self._delta(author) for author in list(self._pending)]
+        self.buffers.clear()
+        return [delta for delta in deltas if delta]
+
+
+async def aggregate_partial_text(
+    events: AsyncIterator[Union[Event, LazyEvent]],
+    emit: str = "final",
+    min_delta_chars: int = 1,
+) -> AsyncGenerator[Union[Event, LazyEvent, TextDelta], None]:
+    """Streams `events` through a PartialTextAggregator."""
+    aggregator = PartialTextAggregator(emit, min_delta_chars)
+    async for event in events:
+        for item in aggregator.feed(event):
+            yield item
+    for item in aggregator.flush():
+        yield item
+
+
 class FastAPIEngineRuntime(AgentRuntime):
     def __init__(self,
                  session: Session,
-                 server_url: Optional[str] = None ):
+                 server_url: Optional[str] = None,
+                 http_client: Optional[httpx.AsyncClient] = None):
         super().__init__(session)
         if not server_url:
             server_url = "http://127.0.0.1:8000"
         self.server_url = server_url
         self.streaming = False
-        self.connection = None
+        # None: share the loop's pooled client with other runtimes.
+        self.http_client = http_client
+        self.last_event_id: Optional[str] = None
 
 
     @override
     async def stream_query(
         self,
-        message: Union[str, Content]
-    ) -> AsyncGenerator[Event, None]:
+        message: Union[str, Content],
+        *,
+        lazy: bool = False,
+        partial_events: bool = False,
+    ) -> AsyncGenerator[Union[Event, LazyEvent], None]:
+        """Runs the agent on `message` and yields its events.
+
+        With `lazy`, events are LazyEvent: their JSON is parsed once and the
+        Event is only validated when a field beyond the cheap ones is read.
+        `partial_events` asks the server for partial text events, e.g. to
+        feed aggregate_partial_text.
+        """
         self.streaming = True
+        self.last_error = None
         try:
             if not message:
                 content = None
@@ -139,29 +411,491 @@ class FastAPIEngineRuntime(AgentRuntime):
                 "user_id": self.session.user_id,
                 "session_id": self.session.id,
                 "new_message": content_dict,
-                "streaming": False
+                "streaming": partial_events
             }
 
-            async for event_str in sse_client(f"{self.server_url}/run_sse",
-                                          request=request,
-                                          headers=None):
+            async for message in self._messages(request):
+                event_str = message.data
+                if lazy:
+                    try:
+                        data = json.loads(event_str)
+                    except json.JSONDecodeError:
+                        logger.error("Undecodable event: %s", event_str)
+                        continue
+                    if "error" in data:
+                        logger.error("Runtime error: %s", data["error"])
+                        self.last_error = str(data["error"])
+                        continue
+                    yield LazyEvent(data)
+                    continue
                 try:
                     yield Event.model_validate_json(event_str)
                 except ValidationError as e:
                     try:
                         # trying to parse as if it was a json with "error" field.
                         err_json = json.loads(event_str)
-                        if "error" in err_json:
-                            print(f"#### RUNTIME ERROR: {err_json['error']}")
-                            continue
                     except json.JSONDecodeError:
-                        print(f"VALIDATION ERROR: {e}")
-                        print("### DATA ###:\n" + event_str)
-                        print("\n\n######################################\n\n")
-                        pass
+                        err_json = None
+                    if isinstance(err_json, dict) and "error" in err_json:
+                        logger.error("Runtime error: %s", err_json["error"])
+                        self.last_error = str(err_json["error"])
+                        continue
+                    logger.error("Invalid event: %s\n%s", e, event_str)
+        finally:
+            self.streaming = False
+
+    async def _messages(self, request: dict) -> AsyncGenerator[SseMessage, None]:
+        """Streams the run, reconnecting when the connection drops.
+
+        Every query carries its own Idempotency-Key, so a reconnect with
+        Last-Event-ID gets the events it missed, from the run in progress
+        or from the session, instead of running the agent again. Retries
+        back off exponentially with full jitter, at most MAX_RUN_RETRIES
+        times in a row; events already received are not yielded twice.
+        """
+        headers = {"Idempotency-Key": uuid.uuid4().hex}
+        self.last_event_id = None
+        seen: set[str] = set()
+        failures = 0
+        while True:
+            try:
+                async for message in sse_messages(f"{self.server_url}/run_sse",
+                                                  request=request,
+                                                  headers=headers,
+                                                  last_event_id=self.last_event_id,
+                                                  http_client=self.http_client):
+                    failures = 0
+                    if message.id:
+                        if message.id in seen:
+                            continue
+                        seen.add(message.id)
+                        self.last_event_id = message.id
+                    yield message
+                return
+            except httpx.HTTPError as e:
+                failures += 1
+                if not _is_retryable(e) or failures > MAX_RUN_RETRIES:
+                    logger.error(f"Error connecting or streaming SSE: {e}")
+                    self.last_error = f"{type(e).__name__}: {e}"
+                    return
+                delay = _backoff_delay(failures)
+                logger.warning("SSE stream failed (%s), reconnecting in %.2fs "
+                               "after event %s", e, delay, self.last_event_id)
+                await asyncio.sleep(delay)
+
+    @override
+    def is_streaming(self) -> bool:
+        return self.streaming
+
+class GoogleCredentialsAuth(httpx.Auth):
+    """Bearer auth from Application Default Credentials.
+
+    The token is refreshed in a worker thread, once for all the requests
+    that find it expired, so refreshing never blocks the event loop.
+    """
+
+    def __init__(self, credentials: Optional[google.auth.credentials.Credentials] = None):
+        self._credentials = credentials
+        self._lock = threading.Lock()
+
+    def _refresh(self) -> str:
+        with self._lock:
+            if self._credentials is None:
+                self._credentials, _ = google.auth.default(
+                    scopes=[CLOUD_PLATFORM_SCOPE])
+            if not self._credentials.valid:
+                self._credentials.refresh(google.auth.transport.requests.Request())
+            return self._credentials.token
+
+    async def async_auth_flow(self, request: httpx.Request):
+        credentials = self._credentials
+        if credentials is not None and credentials.valid:
+            token = credentials.token
+        else:
+            token = await asyncio.to_thread(self._refresh)
+        request.headers["Authorization"] = f"Bearer {token}"
+        yield request
+
+
+_default_auth: Optional[GoogleCredentialsAuth] = None
+
+
+def default_google_auth() -> GoogleCredentialsAuth:
+    """The process-wide auth, so every runtime shares one token."""
+    global _default_auth
+    if _default_auth is None:
+        _default_auth = GoogleCredentialsAuth()
+    return _default_auth
+
+
+class AgentEngineRuntime(AgentRuntime):
+    """Runs queries on an Agent Engine deployment over its REST API.
+
+    Streams `:streamQuery` on the loop's pooled client with shared
+    credentials, so hundreds of concurrent conversations need neither a
+    thread nor a connection setup each. `resource_name` is the reasoning
+    engine's "projects/.../locations/.../reasoningEngines/..." path.
+    """
+
+    def __init__(self,
+                 session: Session,
+                 resource_name: str,
+                 *,
+                 api_endpoint: Optional[str] = None,
+                 class_method: str = "stream_query",
+                 http_client: Optional[httpx.AsyncClient] = None,
+                 auth: Optional[httpx.Auth] = None):
+        super().__init__(session)
+        if not api_endpoint:
+            location = resource_name.split("/")[3]
+            api_endpoint = f"https://{location}-aiplatform.googleapis.com"
+        self.url = f"{api_endpoint}/v1/{resource_name}:streamQuery?alt=sse"
+        self.class_method = class_method
+        self.streaming = False
+        # None: share the loop's pooled client with other runtimes.
+        self.http_client = http_client
+        self.auth = auth or default_google_auth()
+
+    @override
+    async def stream_query(
+        self, message: Union[str, Content]
+    ) -> AsyncGenerator[Event, None]:
+        """Runs the agent on `message` and yields its events as they arrive.
+
+        Failures to connect are retried with backoff. A stream that breaks
+        after the first event cannot be resumed, since Agent Engine has no
+        Last-Event-ID; it ends with last_error set.
+        """
+        self.streaming = True
+        self.last_error = None
+        if isinstance(message, Content):
+            message = message.model_dump(mode="json", exclude_none=True)
+        request = {
+            "class_method": self.class_method,
+            "input": {
+                "user_id": self.session.user_id,
+                "session_id": self.session.id,
+                "message": message,
+            },
+        }
+        client = self.http_client or shared_http_client()
+        failures = 0
+        received = False
+        try:
+            while True:
+                try:
+                    async with client.stream("POST", self.url, json=request,
+                                             auth=self.auth) as response:
+                        response.raise_for_status()
+                        async for line in response.aiter_lines():
+                            event = self._parse_line(line)
+                            if event is not None:
+                                received = True
+                                yield event
+                    return
+                except httpx.HTTPError as e:
+                    failures += 1
+                    if (received or not _is_retryable(e)
+                            or failures > MAX_RUN_RETRIES):
+                        logger.error("Error streaming from Agent Engine: %s", e)
+                        self.last_error = f"{type(e).__name__}: {e}"
+                        return
+                    delay = _backoff_delay(failures)
+                    logger.warning("Agent Engine query failed (%s), retrying "
+                                   "in %.2fs", e, delay)
+                    await asyncio.sleep(delay)
         finally:
             self.streaming = False
 
+    def _parse_line(self, line: str) -> Optional[Event]:
+        """One streamed line: a JSON event, possibly framed as SSE data."""
+        line = line.strip()
+        if line.startswith("data:"):
+            line = line[5:].strip()
+        if not line:
+            return None
+        try:
+            data = json.loads(line)
+        except json.JSONDecodeError:
+            logger.error("Undecodable event: %s", line)
+            return None
+        if isinstance(data, dict) and "error" in data:
+            logger.error("Runtime error: %s", data["error"])
+            self.last_error = str(data["error"])
+            return None
+        try:
+            return Event.model_validate(data)
+        except ValidationError as e:
+            logger.error("Invalid event: %s", e)
+            return None
+
     @override
     def is_streaming(self) -> bool:
-        return self.streaming
\ No newline at end of file
+        return self.streaming
+
+@dataclass
+class BatchResult:
+    """Outcome of one question of a batch."""
+    key: str
+    app_name: str
+    user_id: str
+    session_id: str
+    message: str
+    started_at: float
+    latency_ms: float
+    first_event_ms: Optional[float]
+    events: int
+    response: str
+    error: Optional[str] = None
+
+
+def batch_item_key(session: Session, message: Union[str, Content]) -> str:
+    """Stable id of a (session, message) pair, for checkpoints."""
+    text = message if isinstance(message, str) else message.model_dump_json()
+    identity = json.dumps([session.app_name, session.user_id, session.id, text])
+    return hashlib.sha256(identity.encode()).hexdigest()[:32]
+
+
+class _JsonlSink:
+    def __init__(self, path: str):
+        self._file = open(path, "a", encoding="utf-8")
+
+    async def write(self, result: BatchResult) -> list[BatchResult]:
+        self._file.write(json.dumps(asdict(result)) + "\n")
+        self._file.flush()
+        return [result]
+
+    async def close(self) -> list[BatchResult]:
+        self._file.close()
+        return []
+
+
+class _ParquetSink:
+    """Parquet parts of `rows_per_part` rows in the `path` directory.
+
+    Each part is written whole, so an interrupted run leaves only complete
+    files; the directory reads as one table (pandas.read_parquet).
+    """
+
+    def __init__(self, path: str, rows_per_part: int):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.rows_per_part = rows_per_part
+        self._rows: list[BatchResult] = []
+        self._prefix = f"part-{int(time.time() * 1000)}"
+        self._parts = 0
+
+    def _write_part(self, rows: list[BatchResult]):
+        import pandas as pd
+
+        path = os.path.join(self.path, f"{self._prefix}-{self._parts:05d}.parquet")
+        self._parts += 1
+        temp_path = path + ".tmp"
+        pd.DataFrame([asdict(row) for row in rows]).to_parquet(temp_path, index=False)
+        os.replace(temp_path, path)
+
+    async def write(self, result: BatchResult) -> list[BatchResult]:
+        self._rows.append(result)
+        if len(self._rows) < self.rows_per_part:
+            return []
+        return await self.close()
+
+    async def close(self) -> list[BatchResult]:
+        rows, self._rows = self._rows, []
+        if rows:
+            await asyncio.to_thread(self._write_part, rows)
+        return rows
+
+
+class BatchDriver:
+    """Runs many (session, message) pairs through agent runtimes at once.
+
+    At most `concurrency` questions run at a time, and at most
+    `max_per_host` of them against one server. Results are written as they
+    complete: to a JSONL file, or to a directory of parquet parts when
+    `output_path` ends in ".parquet". Keys of written results go to
+    `checkpoint_path`, and a rerun with the same checkpoint skips them;
+    failed questions run again unless `retry_errors` is False.
+
+        driver = BatchDriver(server_url, concurrency=32,
+                             output_path="results.jsonl",
+                             checkpoint_path="results.checkpoint")
+        stats = await driver.run(pairs)
+    """
+
+    def __init__(self,
+                 server_url: Optional[str] = None,
+                 *,
+                 output_path: str,
+                 checkpoint_path: Optional[str] = None,
+                 concurrency: int = 8,
+                 max_per_host: int = 8,
+                 runtime_factory: Optional[Callable[[Session], AgentRuntime]] = None,
+                 retry_errors: bool = True,
+                 parquet_rows_per_part: int = 500):
+        self.server_url = server_url
+        self.output_path = output_path
+        self.checkpoint_path = checkpoint_path
+        self.concurrency = concurrency
+        self.max_per_host = max_per_host
+        self.runtime_factory = runtime_factory
+        self.retry_errors = retry_errors
+        self.parquet_rows_per_part = parquet_rows_per_part
+        self._host_slots: dict[str, asyncio.Semaphore] = {}
+        self._results: list[BatchResult] = []
+        self._skipped = 0
+        self._duration = 0.0
+
+    def _load_checkpoint(self) -> set[str]:
+        done: set[str] = set()
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return done
+        with open(self.checkpoint_path, encoding="utf-8") as checkpoint:
+            for line in checkpoint:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # last line of an interrupted write
+                if entry.get("ok") or not self.retry_errors:
+                    done.add(entry["key"])
+                else:
+                    done.discard(entry["key"])
+        return done
+
+    def _host_slot(self, runtime: AgentRuntime) -> asyncio.Semaphore:
+        host = urlsplit(getattr(runtime, "server_url", "") or "").netloc
+        if host not in self._host_slots:
+            self._host_slots[host] = asyncio.Semaphore(self.max_per_host)
+        return self._host_slots[host]
+
+    async def _run_one(self, runtime: AgentRuntime, key: str,
+                       message: Union[str, Content]) -> BatchResult:
+        session = runtime.session
+        started_at = time.time()
+        started = time.perf_counter()
+        first_event_ms = None
+        events = 0
+        response = ""
+        error = None
+        try:
+            async with self._host_slot(runtime):
+                started = time.perf_counter()
+                if isinstance(runtime, FastAPIEngineRuntime):
+                    stream = runtime.stream_query(message, lazy=True)
+                else:
+                    stream = runtime.stream_query(message)
+                async for event in stream:
+                    if first_event_ms is None:
+                        first_event_ms = (time.perf_counter() - started) * 1000
+                    events += 1
+                    if event.is_final_response() and (text := event_text(event)):
+                        response = text
+            error = runtime.last_error
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        return BatchResult(
+            key=key,
+            app_name=session.app_name,
+            user_id=session.user_id,
+            session_id=session.id,
+            message=message if isinstance(message, str) else "".join(
+                part.text for part in message.parts or [] if part.text),
+            started_at=started_at,
+            latency_ms=(time.perf_counter() - started) * 1000,
+            first_event_ms=first_event_ms,
+            events=events,
+            response=response,
+            error=error,
+        )
+
+    async def run(self, items: Iterable[tuple[Session, Union[str, Content]]]
+                  ) -> dict[str, Any]:
+        """Runs every pair not in the checkpoint; returns stats()."""
+        done = self._load_checkpoint()
+        if self.output_path.endswith(".parquet"):
+            sink = _ParquetSink(self.output_path, self.parquet_rows_per_part)
+        else:
+            sink = _JsonlSink(self.output_path)
+        checkpoint = (open(self.checkpoint_path, "a", encoding="utf-8")
+                      if self.checkpoint_path else None)
+        if checkpoint and checkpoint.tell():
+            # Start past a line torn by an interrupted write, so the first
+            # key written now is not lost with it.
+            checkpoint.write("\n")
+        pending = iter(items)
+        http_client = None
+        if self.runtime_factory is None:
+            http_client = httpx.AsyncClient(
+                timeout=SSE_TIMEOUT,
+                limits=httpx.Limits(max_connections=self.concurrency,
+                                    max_keepalive_connections=self.concurrency))
+
+        def record(results: list[BatchResult]):
+            self._results.extend(results)
+            if checkpoint:
+                for result in results:
+                    checkpoint.write(json.dumps(
+                        {"key": result.key, "ok": result.error is None}) + "\n")
+                checkpoint.flush()
+
+        async def worker():
+            for session, message in pending:
+                key = batch_item_key(session, message)
+                if key in done:
+                    self._skipped += 1
+                    continue
+                runtime = (self.runtime_factory(session) if self.runtime_factory
+                           else FastAPIEngineRuntime(session, self.server_url,
+                                                     http_client=http_client))
+                result = await self._run_one(runtime, key, message)
+                if result.error:
+                    logger.warning("Question %s failed: %s", key, result.error)
+                record(await sink.write(result))
+
+        started = time.perf_counter()
+        workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            # An interrupted batch stops every question in flight; they
+            # are not checkpointed and run again on resume.
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            self._duration += time.perf_counter() - started
+            record(await sink.close())
+            if checkpoint:
+                checkpoint.close()
+            if http_client:
+                await http_client.aclose()
+        return self.stats()
+
+    def stats(self) -> dict[str, Any]:
+        """Latency, event count and error totals of the results written."""
+        latencies = sorted(r.latency_ms for r in self._results if r.error is None)
+        errors: dict[str, int] = {}
+        for result in self._results:
+            if result.error:
+                kind = result.error.split(":", 1)[0]
+                errors[kind] = errors.get(kind, 0) + 1
+
+        def percentile(q: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+        return {
+            "completed": len(self._results),
+            "succeeded": len(latencies),
+            "failed": len(self._results) - len(latencies),
+            "skipped": self._skipped,
+            "errors": errors,
+            "duration_s": self._duration,
+            "throughput_qps": (len(self._results) / self._duration
+                               if self._duration else 0.0),
+            "latency_p50_ms": percentile(0.50),
+            "latency_p95_ms": percentile(0.95),
+            "latency_p99_ms": percentile(0.99),
+            "mean_events": (sum(r.events for r in self._results) / len(self._results)
+                            if self._results else 0.0),
+        }
@@ -0,0 +1,523 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tiered, content-addressed artifact storage"""
+
+from abc import ABC, abstractmethod
+import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from typing import AsyncIterator, Callable, Optional
+from urllib.parse import quote, unquote
+
+from google.adk.artifacts import BaseArtifactService, InMemoryArtifactService
+from google.genai import types
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ARTIFACT_DIR = os.path.join(tempfile.gettempdir(), "adk_artifacts")
+STREAM_CHUNK_BYTES = 256 * 1024
+
+# Manifests list the versions of one artifact:
+#   {"versions": [{"digest": ..., "mime_type": ..., "size": ..., "kind": ...}]}
+# where kind is "bytes" for inline data and "text" for text parts.
+ManifestUpdate = Callable[[Optional[dict]], Optional[dict]]
+
+
+class InvalidArtifactKey(ValueError):
+    """An app, user, session or file name that cannot name an artifact."""
+
+
+def _quote_part(part: str) -> str:
+    """Quotes one key component for use as a path segment.
+
+    Quoting escapes "/", but not "." and "..", which are rejected so a key
+    cannot step out of its directory.
+    """
+    if part in ("", ".", ".."):
+        raise InvalidArtifactKey(f"Invalid artifact key component: {part!r}")
+    return quote(part, safe="")
+
+
+class BlobStore(ABC):
+    """Durable tier: blobs keyed by sha256 digest, plus artifact manifests.
+
+    Methods are blocking; TieredArtifactService calls them in threads.
+    Manifest keys are (app_name, user_id, scope, filename) tuples.
+    """
+
+    @abstractmethod
+    def has_blob(self, digest: str) -> bool:
+        ...
+
+    @abstractmethod
+    def put_blob(self, digest: str, data: bytes, mime_type: str):
+        ...
+
+    @abstractmethod
+    def read_blob(self, digest: str, start: int = 0,
+                  end: Optional[int] = None) -> bytes:
+        """Reads bytes [start, end) of a blob."""
+
+    @abstractmethod
+    def read_manifest(self, key: tuple[str, ...]) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    def update_manifest(self, key: tuple[str, ...],
+                        update: ManifestUpdate) -> Optional[dict]:
+        """Atomically replaces a manifest with update(manifest); None deletes it."""
+
+    @abstractmethod
+    def list_manifests(self, prefix: tuple[str, ...]) -> list[str]:
+        """Returns the filenames with a manifest under (app, user, scope)."""
+
+
+class LocalBlobStore(BlobStore):
+    """Blobs and manifests in a local directory, shareable by processes.
+
+    Writes go to a temporary file that is renamed into place, and manifest
+    updates hold an flock, so several workers can use one directory.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(os.path.join(root, "blobs"), exist_ok=True)
+        os.makedirs(os.path.join(root, "manifests"), exist_ok=True)
+        self._real_root = os.path.realpath(root)
+
+    def _path(self, *parts: str) -> str:
+        """Joins parts under the root, refusing paths that resolve outside it."""
+        path = os.path.join(self.root, *parts)
+        real_path = os.path.realpath(path)
+        if os.path.commonpath([real_path, self._real_root]) != self._real_root:
+            raise InvalidArtifactKey(f"Path outside the artifact store: {path}")
+        return path
+
+    def _blob_path(self, digest: str) -> str:
+        return self._path("blobs", _quote_part(digest[:2]), _quote_part(digest))
+
+    def _manifest_path(self, key: tuple[str, ...]) -> str:
+        *dirs, filename = (_quote_part(part) for part in key)
+        return self._path("manifests", *dirs, filename + ".json")
+
+    def _write_atomic(self, path: str, data: bytes):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def has_blob(self, digest: str) -> bool:
+        return os.path.exists(self._blob_path(digest))
+
+    def put_blob(self, digest: str, data: bytes, mime_type: str):
+        if not self.has_blob(digest):
+            self._write_atomic(self._blob_path(digest), data)
+
+    def read_blob(self, digest: str, start: int = 0,
+                  end: Optional[int] = None) -> bytes:
+        with open(self._blob_path(digest), "rb") as f:
+            f.seek(start)
+            return f.read() if end is None else f.read(max(0, end - start))
+
+    def read_manifest(self, key: tuple[str, ...]) -> Optional[dict]:
+        try:
+            with open(self._manifest_path(key), "rb") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def update_manifest(self, key: tuple[str, ...],
+                        update: ManifestUpdate) -> Optional[dict]:
+        path = self._manifest_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            manifest = update(self.read_manifest(key))
+            if manifest is None:
+                if os.path.exists(path):
+                    os.unlink(path)
+            else:
+                self._write_atomic(path, json.dumps(manifest).encode())
+            return manifest
+
+    def list_manifests(self, prefix: tuple[str, ...]) -> list[str]:
+        directory = self._path(
+            "manifests", *(_quote_part(part) for part in prefix))
+        try:
+            names = os.listdir(directory)
+        except FileNotFoundError:
+            return []
+        return [unquote(name[:-5]) for name in names if name.endswith(".json")]
+
+
+class GcsBlobStore(BlobStore):
+    """Blobs and manifests in a GCS bucket under an optional prefix.
+
+    Manifest updates use generation preconditions, so concurrent writers
+    retry instead of overwriting each other.
+    """
+
+    def __init__(self, bucket_name: str, prefix: str = "", **client_kwargs):
+        from google.cloud import storage
+
+        self.client = storage.Client(**client_kwargs)
+        self.bucket = self.client.bucket(bucket_name)
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+
+    def _blob_name(self, digest: str) -> str:
+        return f"{self.prefix}blobs/{digest}"
+
+    def _manifest_name(self, key: tuple[str, ...]) -> str:
+        return self.prefix + "manifests/" + "/".join(
+            _quote_part(part) for part in key) + ".json"
+
+    def has_blob(self, digest: str) -> bool:
+        return self.bucket.blob(self._blob_name(digest)).exists()
+
+    def put_blob(self, digest: str, data: bytes, mime_type: str):
+        from google.api_core.exceptions import PreconditionFailed
+
+        try:
+            # Content-addressed: an existing blob already has these bytes.
+            self.bucket.blob(self._blob_name(digest)).upload_from_string(
+                data, content_type=mime_type, if_generation_match=0)
+        except PreconditionFailed:
+            pass
+
+    def read_blob(self, digest: str, start: int = 0,
+                  end: Optional[int] = None) -> bytes:
+        blob = self.bucket.blob(self._blob_name(digest))
+        if end is not None and end <= start:
+            return b""
+        # GCS ranges are inclusive.
+        return blob.download_as_bytes(
+            start=start or None, end=None if end is None else end - 1)
+
+    def _read_manifest(self, key: tuple[str, ...]) -> tuple[Optional[dict], int]:
+        from google.api_core.exceptions import NotFound
+
+        blob = self.bucket.blob(self._manifest_name(key))
+        try:
+            data = blob.download_as_bytes()
+        except NotFound:
+            return None, 0
+        return json.loads(data), blob.generation
+
+    def read_manifest(self, key: tuple[str, ...]) -> Optional[dict]:
+        return self._read_manifest(key)[0]
+
+    def update_manifest(self, key: tuple[str, ...],
+                        update: ManifestUpdate) -> Optional[dict]:
+        from google.api_core.exceptions import NotFound, PreconditionFailed
+
+        blob = self.bucket.blob(self._manifest_name(key))
+        while True:
+            manifest, generation = self._read_manifest(key)
+            manifest = update(manifest)
+            try:
+                if manifest is None:
+                    if generation:
+                        blob.delete(if_generation_match=generation)
+                else:
+                    blob.upload_from_string(
+                        json.dumps(manifest),
+                        content_type="application/json",
+                        if_generation_match=generation,
+                    )
+                return manifest
+            except (PreconditionFailed, NotFound):
+                continue
+
+    def list_manifests(self, prefix: tuple[str, ...]) -> list[str]:
+        name_prefix = self.prefix + "manifests/" + "".join(
+            _quote_part(part) + "/" for part in prefix)
+        names = []
+        for blob in self.client.list_blobs(
+                self.bucket, prefix=name_prefix, delimiter="/"):
+            name = blob.name[len(name_prefix):]
+            if name.endswith(".json"):
+                names.append(unquote(name[:-5]))
+        return names
+
+
+@dataclass
+class ArtifactInfo:
+    """Where the bytes of one artifact version live."""
+
+    digest: str
+    mime_type: str
+    size: int
+    version: int
+
+
+class TieredArtifactService(BaseArtifactService):
+    """Artifact service with a bounded memory tier over a BlobStore.
+
+    Payloads are stored once per sha256 digest however many artifacts or
+    versions refer to them. Recently used payloads up to
+    `max_memory_item_bytes` each are kept in an LRU of at most
+    `max_memory_bytes`. Manifests are always read from the store, so
+    processes sharing the store see each other's artifacts.
+
+    Deleting an artifact removes its manifest; its blobs may still be
+    referenced by other artifacts and are left in the store.
+    """
+
+    def __init__(self,
+                 store: BlobStore,
+                 max_memory_bytes: int = 64 * 1024 * 1024,
+                 max_memory_item_bytes: int = 8 * 1024 * 1024):
+        self.store = store
+        self.max_memory_bytes = max_memory_bytes
+        self.max_memory_item_bytes = max_memory_item_bytes
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        self._memory_bytes = 0
+
+    @staticmethod
+    def _user_prefix(app_name: str, user_id: str) -> tuple[str, ...]:
+        return (app_name, user_id, "user")
+
+    @staticmethod
+    def _session_prefix(app_name: str, user_id: str,
+                        session_id: str) -> tuple[str, ...]:
+        # Sessions get their own tree, so no session id can name the
+        # user-scoped one.
+        return (app_name, user_id, "sessions", session_id)
+
+    @classmethod
+    def _key(cls, app_name: str, user_id: str, session_id: str,
+             filename: str) -> tuple[str, ...]:
+        if filename.startswith("user:"):
+            return (*cls._user_prefix(app_name, user_id), filename)
+        return (*cls._session_prefix(app_name, user_id, session_id), filename)
+
+    def _remember(self, digest: str, data: bytes):
+        if len(data) > self.max_memory_item_bytes or digest in self._memory:
+            return
+        self._memory[digest] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    async def _read(self, digest: str) -> bytes:
+        data = self._memory.get(digest)
+        if data is not None:
+            self._memory.move_to_end(digest)
+            return data
+        data = await asyncio.to_thread(self.store.read_blob, digest)
+        self._remember(digest, data)
+        return data
+
+    async def save_artifact(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        filename: str,
+        artifact: types.Part,
+    ) -> int:
+        if artifact.inline_data is not None:
+            data = artifact.inline_data.data or b""
+            mime_type = artifact.inline_data.mime_type or "application/octet-stream"
+            kind = "bytes"
+        elif artifact.text is not None:
+            data = artifact.text.encode()
+            mime_type = "text/plain; charset=utf-8"
+            kind = "text"
+        else:
+            raise ValueError("Artifacts must have inline data or text")
+        digest = hashlib.sha256(data).hexdigest()
+        if digest not in self._memory:
+            await asyncio.to_thread(self.store.put_blob, digest, data, mime_type)
+        self._remember(digest, data)
+        entry = {"digest": digest, "mime_type": mime_type,
+                 "size": len(data), "kind": kind}
+
+        def append_version(manifest: Optional[dict]) -> dict:
+            manifest = manifest or {"versions": []}
+            manifest["versions"].append(entry)
+            return manifest
+
+        manifest = await asyncio.to_thread(
+            self.store.update_manifest,
+            self._key(app_name, user_id, session_id, filename),
+            append_version,
+        )
+        return len(manifest["versions"]) - 1
+
+    async def _entry(self, app_name: str, user_id: str, session_id: str,
+                     filename: str, version: Optional[int]
+                     ) -> Optional[tuple[int, dict]]:
+        manifest = await asyncio.to_thread(
+            self.store.read_manifest,
+            self._key(app_name, user_id, session_id, filename))
+        if not manifest or not manifest["versions"]:
+            return None
+        versions = manifest["versions"]
+        if version is None:
+            version = len(versions) - 1
+        if not 0 <= version < len(versions):
+            return None
+        return version, versions[version]
+
+    async def load_artifact(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        filename: str,
+        version: Optional[int] = None,
+    ) -> Optional[types.Part]:
+        found = await self._entry(app_name, user_id, session_id, filename, version)
+        if found is None:
+            return None
+        _, entry = found
+        data = await self._read(entry["digest"])
+        if entry["kind"] == "text":
+            return types.Part(text=data.decode())
+        return types.Part.from_bytes(data=data, mime_type=entry["mime_type"])
+
+    async def stat_artifact(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        filename: str,
+        version: Optional[int] = None,
+    ) -> Optional[ArtifactInfo]:
+        """Returns where an artifact's bytes live, without reading them."""
+        found = await self._entry(app_name, user_id, session_id, filename, version)
+        if found is None:
+            return None
+        version, entry = found
+        return ArtifactInfo(entry["digest"], entry["mime_type"], entry["size"], version)
+
+    async def iter_bytes(self, digest: str, start: int,
+                         end: int) -> AsyncIterator[bytes]:
+        """Yields bytes [start, end) of a blob in chunks."""
+        data = self._memory.get(digest)
+        if data is not None:
+            self._memory.move_to_end(digest)
+            view = memoryview(data)
+            for offset in range(start, end, STREAM_CHUNK_BYTES):
+                yield bytes(view[offset:min(offset + STREAM_CHUNK_BYTES, end)])
+            return
+        for offset in range(start, end, STREAM_CHUNK_BYTES):
+            yield await asyncio.to_thread(
+                self.store.read_blob, digest, offset,
+                min(offset + STREAM_CHUNK_BYTES, end))
+
+    async def list_artifact_keys(
+        self, *, app_name: str, user_id: str, session_id: str
+    ) -> list[str]:
+        session_names, user_names = await asyncio.gather(
+            asyncio.to_thread(
+                self.store.list_manifests,
+                self._session_prefix(app_name, user_id, session_id)),
+            asyncio.to_thread(
+                self.store.list_manifests, self._user_prefix(app_name, user_id)),
+        )
+        return sorted(set(session_names) | set(user_names))
+
+    async def delete_artifact(
+        self, *, app_name: str, user_id: str, session_id: str, filename: str
+    ) -> None:
+        await asyncio.to_thread(
+            self.store.update_manifest,
+            self._key(app_name, user_id, session_id, filename),
+            lambda manifest: None,
+        )
+
+    async def list_versions(
+        self, *, app_name: str, user_id: str, session_id: str, filename: str
+    ) -> list[int]:
+        manifest = await asyncio.to_thread(
+            self.store.read_manifest,
+            self._key(app_name, user_id, session_id, filename))
+        return list(range(len(manifest["versions"]))) if manifest else []
+
+    def stats(self) -> dict:
+        return {
+            "memory_items": len(self._memory),
+            "memory_bytes": self._memory_bytes,
+        }
+
+
+def build_artifact_service(uri: Optional[str] = None) -> BaseArtifactService:
+    """Builds the artifact service for a URI.
+
+    Supported URIs:
+      memory://                  process-local, unbounded, for tests and dev
+      file:///path/to/dir        tiered over a local (or shared) directory
+      gs://bucket[/prefix]       tiered over a GCS bucket
+
+    Without a URI, ARTIFACT_SERVICE_URI is used, and then a local directory
+    under the system temp dir.
+    """
+    uri = uri or os.environ.get("ARTIFACT_SERVICE_URI") or f"file://{DEFAULT_ARTIFACT_DIR}"
+    scheme, _, rest = uri.partition("://")
+    if scheme == "memory":
+        return InMemoryArtifactService()
+    if scheme == "file":
+        logger.info("Using artifacts in %s", rest)
+        return TieredArtifactService(LocalBlobStore(rest))
+    if scheme == "gs":
+        bucket_name, _, prefix = rest.partition("/")
+        logger.info("Using artifacts in gs://%s/%s", bucket_name, prefix)
+        return TieredArtifactService(GcsBlobStore(bucket_name, prefix))
+    raise ValueError(f"Unsupported artifact service URI: {uri}")
+
+
+def parse_byte_range(header: Optional[str], size: int) -> Optional[tuple[int, int]]:
+    """Parses a single-range Range header into [start, end).
+
+    Returns None to serve the whole body: no header, or one this server
+    does not handle, such as several ranges. Raises ValueError when the
+    range cannot be satisfied.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    try:
+        if not first:
+            # A suffix: the last N bytes.
+            length = int(last)
+        else:
+            start = int(first)
+            end = int(last) + 1 if last else size
+    except ValueError:
+        return None
+    if not first:
+        # A zero-length suffix selects no bytes: unsatisfiable.
+        if length <= 0 or size == 0:
+            raise ValueError(f"Unsatisfiable range: {header}")
+        return max(0, size - length), size
+    if start >= size or end <= start:
+        raise ValueError(f"Unsatisfiable range: {header}")
+    return start, min(end, size)
@@ -13,24 +13,32 @@
 # limitations under the License.
 
 import asyncio
+from collections import defaultdict
 from contextlib import asynccontextmanager
+import hashlib
 import importlib
-import inspect
+import json
 import logging
 import os
-from pathlib import Path
+import signal
 import sys
 import traceback
-import typing
+from types import ModuleType
 from typing import Any
+from typing import AsyncGenerator
+from typing import AsyncIterator
 from typing import List
 from typing import Literal
 from typing import Optional
 
 from fastapi import FastAPI
+from fastapi import Header
 from fastapi import HTTPException
 from fastapi import Query
+from fastapi import Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+from fastapi.responses import Response
 from fastapi.responses import StreamingResponse
 from fastapi.websockets import WebSocket
 from fastapi.websockets import WebSocketDisconnect
@@ -38,10 +46,10 @@ from google.genai import types
 from opentelemetry import trace
 from opentelemetry.exporter.cloud_trace import CloudTraceSpanExporter
 from opentelemetry.sdk.trace import export
-from opentelemetry.sdk.trace import ReadableSpan
 from opentelemetry.sdk.trace import TracerProvider
 from pydantic import BaseModel
 from pydantic import ValidationError
+from starlette.background import BackgroundTasks
 from starlette.types import Lifespan
 
 from google.adk.agents import RunConfig
@@ -49,36 +57,48 @@ from google.adk.agents.live_request_queue import LiveRequest
 from google.adk.agents.live_request_queue import LiveRequestQueue
 from google.adk.agents.llm_agent import Agent
 from google.adk.agents.run_config import StreamingMode
-from google.adk.artifacts import BaseArtifactService, InMemoryArtifactService
+from google.adk.artifacts import BaseArtifactService
 from google.adk.events.event import Event
-from google.adk.memory import InMemoryMemoryService
 from google.adk.runners import Runner
-from google.adk.sessions import Session, VertexAiSessionService as SessionService
+from google.adk.sessions import Session
 
-logger = logging.getLogger(__name__)
-
-class ApiServerSpanExporter(export.SpanExporter):
-
-    def __init__(self, trace_dict):
-      self.trace_dict = trace_dict
-
-    def export(
-        self, spans: typing.Sequence[ReadableSpan]
-    ) -> export.SpanExportResult:
-        for span in spans:
-            if (
-                span.name == "call_llm"
-                or span.name == "send_data"
-                or span.name.startswith("tool_response")
-            ):
-                attributes = dict(span.attributes) # type: ignore
-                attributes["trace_id"] = span.get_span_context().trace_id # type: ignore
-                attributes["span_id"] = span.get_span_context().span_id # type: ignore
-        return export.SpanExportResult.SUCCESS
-
-    def force_flush(self, timeout_millis: int = 30000) -> bool:
-        return True
+from src.app import metrics as server_metrics
+from src.app.admission import (
+    LANE_INTERACTIVE,
+    AdmissionController,
+    AdmissionRejected,
+    RunSlot,
+    release_after,
+    retry_after_header,
+)
+from src.app.agent_index import AgentIndex
+from src.app.agent_resources import AgentResourcePool
+from src.app.artifact_store import (
+    InvalidArtifactKey,
+    TieredArtifactService,
+    build_artifact_service,
+    parse_byte_range,
+)
+from src.app.idempotency import IdempotencyConflict, IdempotencyStore
+from src.app.live_mux import LiveMultiplexer
+from src.app.session_cache import CachedSessionService
+from src.app.ndjson import NDJSON_MEDIA_TYPE, StreamCompressor, negotiate_encoding
+from src.app.session_services import build_session_service
+from src.app.session_views import (
+    SessionSummary,
+    list_session_page,
+    listed,
+    projection,
+    resume_events,
+    session_config,
+    summarize,
+    window_events,
+)
+from src.app.sse import SseEncoder, coalesce_partial_text
+from src.app.trace_store import ApiServerSpanExporter, SpanStore
+from src.shared.vector_memory import VectorMemoryService
 
+logger = logging.getLogger(__name__)
 
 class AgentRunRequest(BaseModel):
     app_name: str
@@ -94,15 +114,38 @@ def get_fast_api_app(
     allow_origins: Optional[list[str]] = None,
     trace_to_cloud: bool = False,
     lifespan: Optional[Lifespan[FastAPI]] = None,
-    artifact_service: Optional[BaseArtifactService] = None
+    artifact_service: Optional[BaseArtifactService] = None,
+    session_service_uri: Optional[str] = None,
+    artifact_service_uri: Optional[str] = None,
+    session_cache_ttl: Optional[float] = None,
+    session_cache_size: int = 1024,
+    preload_apps: Optional[list[str]] = None,
+    trace_store_max_bytes: int = 64 * 1024 * 1024,
+    trace_store_max_age_seconds: float = 3600.0,
+    sse_coalesce_ms: Optional[float] = None,
+    max_runs_per_app: Optional[int] = None,
+    max_runs_per_user: Optional[int] = None,
+    max_queued_runs: Optional[int] = None,
+    run_queue_timeout_seconds: float = 30.0,
+    preload_max_attempts: Optional[int] = None,
+    preload_retry_delay_seconds: float = 1.0,
+    exit_on_preload_failure: Optional[bool] = None,
 ) -> FastAPI:
-    # InMemory tracing dict.
-    trace_dict: dict[str, Any] = {}
+    # InMemory span store behind the /debug/trace endpoints.
+    span_store = SpanStore(
+        max_bytes=trace_store_max_bytes,
+        max_age_seconds=trace_store_max_age_seconds,
+    )
 
-    # Set up tracing in the FastAPI server.
+    # Set up tracing in the FastAPI server. Spans are exported from a
+    # background thread, off the request path.
+    metrics = server_metrics.ServerMetrics()
     provider = TracerProvider()
+    provider.add_span_processor(server_metrics.StageMetricsSpanProcessor(metrics))
     provider.add_span_processor(
-        export.SimpleSpanProcessor(ApiServerSpanExporter(trace_dict))
+        export.BatchSpanProcessor(
+            ApiServerSpanExporter(span_store), schedule_delay_millis=500
+        )
     )
     if trace_to_cloud:
       if project_id := os.environ.get("GOOGLE_CLOUD_PROJECT", None):
@@ -118,19 +161,77 @@ def get_fast_api_app(
 
     trace.set_tracer_provider(provider)
 
-    exit_stacks = []
+    # Apps whose runners are built before the server reports itself ready.
+    # "*" preloads every discovered app.
+    if preload_apps is None:
+        preload_apps = [
+            name.strip()
+            for name in os.environ.get("PRELOAD_APPS", "").split(",")
+            if name.strip()
+        ]
+    # Failed preloads are retried with exponential backoff. After the last
+    # attempt /ready reports "failed", and the server exits if asked to.
+    if preload_max_attempts is None:
+        preload_max_attempts = int(os.environ.get("PRELOAD_MAX_ATTEMPTS", "5"))
+    if exit_on_preload_failure is None:
+        exit_on_preload_failure = os.environ.get(
+            "EXIT_ON_PRELOAD_FAILURE", "").lower() in ("1", "true")
+    warm_up_state: dict[str, Any] = {
+        "ready": False, "failed": False, "attempts": 0, "errors": {}}
+
+    async def _warm_up_runners():
+        pending = (
+            agent_index.app_names() if "*" in preload_apps else preload_apps
+        )
+        delay = preload_retry_delay_seconds
+        while True:
+            warm_up_state["attempts"] += 1
+            results = await asyncio.gather(
+                *(_get_runner_async(app_name) for app_name in pending),
+                return_exceptions=True,
+            )
+            failed = []
+            for app_name, result in zip(pending, results):
+                if isinstance(result, BaseException):
+                    logger.error("Failed to warm up %s (attempt %s): %s",
+                                 app_name, warm_up_state["attempts"], result)
+                    warm_up_state["errors"][app_name] = str(result)
+                    failed.append(app_name)
+                else:
+                    warm_up_state["errors"].pop(app_name, None)
+            if not failed:
+                logger.info("Warmed up runners: %s", sorted(runner_dict))
+                warm_up_state["ready"] = True
+                return
+            if warm_up_state["attempts"] >= preload_max_attempts:
+                warm_up_state["failed"] = True
+                logger.critical("Giving up warming up %s after %s attempts",
+                                failed, warm_up_state["attempts"])
+                if exit_on_preload_failure:
+                    # Lets the server shut down cleanly, then exit.
+                    os.kill(os.getpid(), signal.SIGTERM)
+                return
+            pending = failed
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 60.0)
 
     @asynccontextmanager
     async def internal_lifespan(app: FastAPI):
-        if lifespan:
-            async with lifespan(app) as lifespan_context:
+        # Warm up in the background so /ready can answer while it runs.
+        warm_up_task = asyncio.create_task(_warm_up_runners())
+        agent_resources.start()
+        try:
+            if lifespan:
+                async with lifespan(app) as lifespan_context:
+                    yield
+            else:
                 yield
-
-                if exit_stacks:
-                    for stack in exit_stacks:
-                        await stack.aclose()
-        else:
-            yield
+        finally:
+            warm_up_task.cancel()
+            # Closes MCP/toolbox sessions and the exit stacks of awaited agents.
+            await agent_resources.close()
+            await memory_service.save_snapshots()
+            provider.shutdown()
 
     # Run the FastAPI server.
     app = FastAPI(lifespan=internal_lifespan)
@@ -144,54 +245,202 @@ def get_fast_api_app(
             allow_headers=["*"],
         )
 
+    @app.exception_handler(InvalidArtifactKey)
+    async def invalid_artifact_key(request: Request, e: InvalidArtifactKey) -> Response:
+        return JSONResponse(status_code=400, content={"detail": str(e)})
+
     if agent_dir not in sys.path:
         sys.path.append(agent_dir)
 
+    # Only scans the file system; agents are imported on first use.
+    agent_index = AgentIndex(agent_dir)
+
+    # Partial text events arriving within this window share one SSE frame.
+    if sse_coalesce_ms is None:
+        sse_coalesce_ms = float(os.environ.get("SSE_COALESCE_MS", "0"))
+
+    # Concurrent run limits; 0 means unlimited. Runs over a limit wait in
+    # the interactive or batch lane, chosen with the X-Priority header.
+    admission = AdmissionController(
+        max_runs_per_app=(max_runs_per_app if max_runs_per_app is not None
+                          else int(os.environ.get("MAX_RUNS_PER_APP", "0"))),
+        max_runs_per_user=(max_runs_per_user if max_runs_per_user is not None
+                           else int(os.environ.get("MAX_RUNS_PER_USER", "0"))),
+        max_queued=(max_queued_runs if max_queued_runs is not None
+                    else int(os.environ.get("MAX_QUEUED_RUNS", "100"))),
+        queue_timeout_seconds=run_queue_timeout_seconds,
+        metrics=metrics,
+    )
+
+    # Results of runs started with an Idempotency-Key, for retries to reuse.
+    idempotency_store = IdempotencyStore()
+
+    async def _admit_run(app_name: str, user_id: str,
+                         priority: Optional[str]) -> RunSlot:
+        try:
+            return await admission.acquire(
+                app_name, user_id, priority or LANE_INTERACTIVE)
+        except AdmissionRejected as e:
+            raise HTTPException(
+                status_code=429, detail=str(e), headers=retry_after_header(e))
+
     runner_dict = {}
-    root_agent_dict = {}
+    # Root agents and their tool connections, health-checked in the
+    # background. A rebuilt agent needs a new runner.
+    agent_resources = AgentResourcePool(
+        lambda app_name: _import_agent_module(app_name),
+        on_rebuild=lambda app_name: runner_dict.pop(app_name, None),
+        health_check_interval_seconds=float(
+            os.environ.get("AGENT_HEALTH_CHECK_INTERVAL_SECONDS", "30")),
+    )
+    # Serializes construction so concurrent first requests build each runner once.
+    runner_locks: defaultdict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
 
     # Build the Artifact service
-    artifact_service = artifact_service or InMemoryArtifactService()
-    memory_service = InMemoryMemoryService()
+    artifact_service = artifact_service or build_artifact_service(artifact_service_uri)
+    memory_service = VectorMemoryService(
+        snapshot_dir=os.environ.get("MEMORY_SNAPSHOT_DIR") or None)
 
     # Build the Session service
-    session_service = SessionService(
-        project=os.environ["GOOGLE_CLOUD_PROJECT"],
-        location=os.environ.get("GOOGLE_CLOUD_LOCATION", "global"),
-        agent_engine_id=os.environ["AGENT_ENGINE_ID"], ## TODO: Update to fetch ID dynamically based on {app_name}
+    if session_cache_ttl is None:
+        session_cache_ttl = float(os.environ.get("SESSION_CACHE_TTL_SECONDS", "30"))
+    session_service = CachedSessionService(
+        build_session_service(session_service_uri),
+        ttl_seconds=session_cache_ttl,
+        max_size=session_cache_size,
     )
 
+    metrics.register_session_cache(session_service.stats)
+
+    @app.get("/debug/session_cache")
+    def get_session_cache_stats() -> dict[str, Any]:
+        return session_service.stats()
+
+    @app.get("/debug/agent_resources")
+    def get_agent_resources() -> dict[str, Any]:
+        return agent_resources.stats()
+
+    @app.get("/metrics")
+    def get_metrics() -> Response:
+        return Response(
+            content=metrics.render(),
+            media_type="text/plain; version=0.0.4; charset=utf-8",
+        )
+
+    @app.get("/list-apps")
+    def list_apps() -> list[str]:
+        return agent_index.app_names()
+
+    @app.get("/ready")
+    def ready() -> dict[str, Any]:
+        if not warm_up_state["ready"]:
+            raise HTTPException(
+                status_code=503,
+                detail={
+                    "status": "failed" if warm_up_state["failed"] else "warming_up",
+                    "attempts": warm_up_state["attempts"],
+                    "errors": warm_up_state["errors"],
+                },
+            )
+        return {"status": "ready", "apps": sorted(runner_dict)}
 
     @app.get("/debug/trace/{event_id}")
     def get_trace_dict(event_id: str) -> Any:
-        event_dict = trace_dict.get(event_id, None)
+        event_dict = span_store.get_event_attributes(event_id)
         if event_dict is None:
             raise HTTPException(status_code=404, detail="Trace not found")
         return event_dict
 
+    @app.get("/debug/traces/slowest")
+    def get_slowest_traces(limit: int = Query(10, ge=1, le=100)) -> Any:
+        return span_store.slowest_traces(limit)
+
+    @app.get("/debug/traces/stats")
+    def get_span_store_stats() -> dict[str, Any]:
+        return span_store.stats()
+
+    @app.get("/debug/traces/{trace_id}")
+    def get_trace(trace_id: str) -> Any:
+        try:
+            spans = span_store.get_trace(int(trace_id, 16))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid trace id")
+        if not spans:
+            raise HTTPException(status_code=404, detail="Trace not found")
+        return spans
+
     @app.get(
         "/apps/{app_name}/users/{user_id}/sessions/{session_id}",
         response_model_exclude_none=True,
     )
-    async def get_session(app_name: str, user_id: str, session_id: str) -> Session:
+    async def get_session(
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        events_after: Optional[float] = Query(None),
+        limit: Optional[int] = Query(None, ge=1),
+        fields: Optional[str] = Query(None),
+    ) -> Session:
+      # events_after and limit are pushed down to the session service so only
+      # the requested tail of events is loaded; fields trims the response.
       session = await session_service.get_session(
-          app_name=app_name, user_id=user_id, session_id=session_id
+          app_name=app_name,
+          user_id=user_id,
+          session_id=session_id,
+          config=session_config(events_after, limit),
       )
       if not session:
           raise HTTPException(status_code=404, detail="Session not found")
+      if events_after is not None or limit:
+          session.events = window_events(session.events, events_after, limit)
+      if fields:
+          try:
+              include = projection(fields)
+          except ValueError as e:
+              raise HTTPException(status_code=400, detail=str(e))
+          return Response(
+              content=session.model_dump_json(
+                  include=include, exclude_none=True, by_alias=True),
+              media_type="application/json",
+          )
       return session
 
     @app.get(
         "/apps/{app_name}/users/{user_id}/sessions",
         response_model_exclude_none=True,
     )
-    async def list_sessions(app_name: str, user_id: str) -> list[Session]:
-        return [
-            session
-            for session in (await session_service.list_sessions(
-                app_name=app_name, user_id=user_id
-            )).sessions
-        ]
+    async def list_sessions(
+        app_name: str,
+        user_id: str,
+        response: Response,
+        page_size: Optional[int] = Query(None, ge=1),
+        page_token: Optional[str] = Query(None),
+        view: Literal["full", "summary"] = Query("full"),
+    ) -> list[Session] | list[SessionSummary]:
+        # With page_size, returns one page, most recently updated first; the
+        # token for the next page is in the X-Next-Page-Token header.
+        if page_size or page_token:
+            try:
+                page = await list_session_page(
+                    session_service,
+                    app_name=app_name,
+                    user_id=user_id,
+                    page_size=page_size or 100,
+                    page_token=page_token,
+                )
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            if page.next_page_token:
+                response.headers["X-Next-Page-Token"] = page.next_page_token
+            sessions = page.sessions
+        else:
+            sessions = [listed(session) for session in (
+                await session_service.list_sessions(
+                    app_name=app_name, user_id=user_id
+                )).sessions]
+        if view == "summary":
+            return [summarize(session) for session in sessions]
+        return sessions
 
     @app.post(
         "/apps/{app_name}/users/{user_id}/sessions/{session_id}",
@@ -284,6 +533,99 @@ def get_fast_api_app(
             raise HTTPException(status_code=404, detail="Artifact not found")
         return artifact
 
+    async def _artifact_bytes_response(
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        artifact_name: str,
+        version: Optional[int],
+        range_header: Optional[str],
+        if_none_match: Optional[str],
+    ) -> Response:
+        """Streams an artifact's raw bytes, honoring Range and If-None-Match."""
+        if isinstance(artifact_service, TieredArtifactService):
+            info = await artifact_service.stat_artifact(
+                app_name=app_name,
+                user_id=user_id,
+                session_id=session_id,
+                filename=artifact_name,
+                version=version,
+            )
+            if not info:
+                raise HTTPException(status_code=404, detail="Artifact not found")
+            digest, mime_type, size = info.digest, info.mime_type, info.size
+            read = lambda start, end: artifact_service.iter_bytes(digest, start, end)
+        else:
+            artifact = await artifact_service.load_artifact(
+                app_name=app_name,
+                user_id=user_id,
+                session_id=session_id,
+                filename=artifact_name,
+                version=version,
+            )
+            if not artifact:
+                raise HTTPException(status_code=404, detail="Artifact not found")
+            if artifact.inline_data is not None:
+                data = artifact.inline_data.data or b""
+                mime_type = artifact.inline_data.mime_type or "application/octet-stream"
+            else:
+                data = (artifact.text or "").encode()
+                mime_type = "text/plain; charset=utf-8"
+            digest, size = hashlib.sha256(data).hexdigest(), len(data)
+
+            async def read(start: int, end: int):
+                yield data[start:end]
+
+        etag = f'"{digest}"'
+        headers = {"ETag": etag, "Accept-Ranges": "bytes"}
+        if if_none_match and etag in (tag.strip() for tag in if_none_match.split(",")):
+            return Response(status_code=304, headers=headers)
+        try:
+            byte_range = parse_byte_range(range_header, size)
+        except ValueError:
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+        if byte_range is None:
+            start, end, status_code = 0, size, 200
+        else:
+            (start, end), status_code = byte_range, 206
+            headers["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+        headers["Content-Length"] = str(end - start)
+        return StreamingResponse(
+            read(start, end), status_code=status_code, media_type=mime_type,
+            headers=headers)
+
+    @app.get(
+        "/apps/{app_name}/users/{user_id}/sessions/{session_id}/artifacts/{artifact_name}/raw",
+    )
+    async def load_artifact_bytes(
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        artifact_name: str,
+        version: Optional[int] = Query(None),
+        range: Optional[str] = Header(None),
+        if_none_match: Optional[str] = Header(None),
+    ) -> Response:
+        return await _artifact_bytes_response(
+            app_name, user_id, session_id, artifact_name, version, range,
+            if_none_match)
+
+    @app.get(
+        "/apps/{app_name}/users/{user_id}/sessions/{session_id}/artifacts/{artifact_name}/versions/{version_id}/raw",
+    )
+    async def load_artifact_version_bytes(
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        artifact_name: str,
+        version_id: int,
+        range: Optional[str] = Header(None),
+        if_none_match: Optional[str] = Header(None),
+    ) -> Response:
+        return await _artifact_bytes_response(
+            app_name, user_id, session_id, artifact_name, version_id, range,
+            if_none_match)
+
     @app.get(
         "/apps/{app_name}/users/{user_id}/sessions/{session_id}/artifacts",
         response_model_exclude_none=True,
@@ -322,60 +664,234 @@ def get_fast_api_app(
             filename=artifact_name,
         )
 
-    @app.post("/run", response_model_exclude_none=True)
-    async def agent_run(req: AgentRunRequest) -> list[Event]:
-        session = await session_service.get_session(
-            app_name=req.app_name, user_id=req.user_id, session_id=req.session_id
-        )
-        if not session:
-          raise HTTPException(status_code=404, detail="Session not found")
-        runner = await _get_runner_async(req.app_name)
-        events = [
-            event
-            async for event in runner.run_async(
+    async def _run_agent(req: AgentRunRequest) -> AsyncGenerator[Event, None]:
+        """Runs the agent for a request and yields the events for the client."""
+        server_metrics.current_app_name.set(req.app_name)
+        stream_mode = StreamingMode.SSE if req.streaming else StreamingMode.NONE
+        async with agent_resources.lease(req.app_name):
+            with metrics.stage(req.app_name, server_metrics.STAGE_RUNNER_LOOKUP):
+                runner = await _get_runner_async(req.app_name)
+            events = runner.run_async(
                 user_id=req.user_id,
                 session_id=req.session_id,
                 new_message=req.new_message,
+                run_config=RunConfig(streaming_mode=stream_mode),
             )
-        ]
-        logger.info("Generated %s events in agent run: %s", len(events), events)
+            if req.streaming:
+                events = coalesce_partial_text(events, sse_coalesce_ms / 1000)
+            async for event in events:
+                yield event
+
+    async def _start_run(
+        req: AgentRunRequest,
+        idempotency_key: Optional[str],
+        priority: Optional[str],
+    ) -> tuple[AsyncIterator[Event], Optional[RunSlot]]:
+        """Admits a run and returns its events, plus the slot to release after.
+
+        With an Idempotency-Key the run executes in the background and its
+        events are shared: a retry with the same key attaches to the run in
+        progress, or replays the result of a finished one, without running
+        the agent again. The background run releases its own slot.
+        """
+        if not idempotency_key:
+            slot = await _admit_run(req.app_name, req.user_id, priority)
+            return _run_agent(req), slot
+
+        scope = (req.app_name, req.user_id)
+        fingerprint = req.model_dump_json()
+        try:
+            record, created = idempotency_store.get_or_reserve(
+                scope, idempotency_key, fingerprint)
+            if not created:
+                logger.info("Attaching to run for Idempotency-Key %s", idempotency_key)
+                if not record.can_replay():
+                    raise IdempotencyConflict("Run result is too large to replay")
+                return record.subscribe(), None
+        except IdempotencyConflict as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        try:
+            slot = await _admit_run(req.app_name, req.user_id, priority)
+        except BaseException as e:
+            idempotency_store.discard(scope, idempotency_key)
+            record.fail(str(e))
+            raise
+        idempotency_store.start(scope, idempotency_key, record, _run_agent(req),
+                                on_done=slot.release)
+        return record.subscribe(), None
+
+    async def _iterate(events: list[Event]) -> AsyncGenerator[Event, None]:
+        for event in events:
+            yield event
+
+    def _resume_run(
+        req: AgentRunRequest,
+        session: Session,
+        idempotency_key: Optional[str],
+        last_event_id: str,
+    ) -> Optional[AsyncIterator[Event]]:
+        """Returns the events a client missed after `last_event_id`.
+
+        The run's idempotency record has every event, partial ones included,
+        and follows a run still in progress. Without one, the missed events
+        are read back from the session. None when the run never started.
+        """
+        record = None
+        if idempotency_key:
+            try:
+                record = idempotency_store.get(
+                    (req.app_name, req.user_id), idempotency_key,
+                    req.model_dump_json())
+            except IdempotencyConflict as e:
+                raise HTTPException(status_code=409, detail=str(e))
+            if record is not None and record.can_replay():
+                logger.info("Resuming run for Idempotency-Key %s after %s",
+                            idempotency_key, last_event_id)
+                return record.subscribe(after_event_id=last_event_id)
+        missed = resume_events(session.events, last_event_id, req.new_message)
+        if missed is None:
+            if record is not None:
+                # The run happened but can be neither replayed nor rerun.
+                raise HTTPException(
+                    status_code=409, detail="Run result is too large to replay")
+            return None
+        logger.info("Replaying %s session events after %s", len(missed), last_event_id)
+        return _iterate(missed)
+
+    def _stream_response(
+        stream: AsyncIterator,
+        slot: Optional[RunSlot],
+        tracker: Optional[server_metrics.RunTracker] = None,
+        **kwargs,
+    ) -> StreamingResponse:
+        # The background tasks also run when the client leaves before the
+        # stream is first pulled, when the stream's own cleanup never runs.
+        background = BackgroundTasks()
+        if slot is not None:
+            stream = release_after(stream, slot)
+            background.add_task(slot.release)
+        if tracker is not None:
+            background.add_task(tracker.finish, status="error")
+        return StreamingResponse(stream, background=background, **kwargs)
+
+    @app.post("/run", response_model_exclude_none=True)
+    async def agent_run(
+        req: AgentRunRequest,
+        x_priority: Optional[str] = Header(None),
+        idempotency_key: Optional[str] = Header(None),
+    ) -> list[Event]:
+        server_metrics.current_app_name.set(req.app_name)
+        # Tracked from the request on, session fetch and admission included.
+        with server_metrics.RunTracker(metrics, req.app_name, "run") as tracker:
+            with metrics.stage(req.app_name, server_metrics.STAGE_SESSION_FETCH):
+                session = await session_service.get_session(
+                    app_name=req.app_name, user_id=req.user_id, session_id=req.session_id
+                )
+            if not session:
+              raise HTTPException(status_code=404, detail="Session not found")
+            run_events, slot = await _start_run(req, idempotency_key, x_priority)
+            try:
+                events = []
+                async for event in run_events:
+                    tracker.on_event()
+                    events.append(event)
+            finally:
+                if slot:
+                    slot.release()
+        logger.info("Generated %s events in agent run", len(events))
         return events
 
     @app.post("/run_sse")
-    async def agent_run_sse(req: AgentRunRequest) -> StreamingResponse:
+    async def agent_run_sse(
+        req: AgentRunRequest,
+        x_priority: Optional[str] = Header(None),
+        idempotency_key: Optional[str] = Header(None),
+        last_event_id: Optional[str] = Header(None),
+    ) -> StreamingResponse:
         # SSE endpoint
-        session = await session_service.get_session(
-            app_name=req.app_name, user_id=req.user_id, session_id=req.session_id
-        )
-        if not session:
-            raise HTTPException(status_code=404, detail="Session not found")
+        server_metrics.current_app_name.set(req.app_name)
+        # Tracked from the request on; the stream finishes the tracker.
+        tracker = server_metrics.RunTracker(metrics, req.app_name, "run_sse")
+        with tracker.before_streaming():
+            with metrics.stage(req.app_name, server_metrics.STAGE_SESSION_FETCH):
+                session = await session_service.get_session(
+                    app_name=req.app_name, user_id=req.user_id, session_id=req.session_id
+                )
+            if not session:
+                raise HTTPException(status_code=404, detail="Session not found")
+            # A reconnecting client gets what it missed instead of a new run.
+            run_events = slot = None
+            if last_event_id:
+                run_events = _resume_run(req, session, idempotency_key, last_event_id)
+            if run_events is None:
+                run_events, slot = await _start_run(req, idempotency_key, x_priority)
 
         # Convert the events to properly formatted SSE
         async def event_generator():
-            try:
-                stream_mode = (StreamingMode.SSE if req.streaming
-                               else StreamingMode.NONE)
-                runner = await _get_runner_async(req.app_name)
-                async for event in runner.run_async(
-                    user_id=req.user_id,
-                    session_id=req.session_id,
-                    new_message=req.new_message,
-                    run_config=RunConfig(streaming_mode=stream_mode),
-                ):
-                    # Format as SSE data
-                    sse_event = event.model_dump_json(exclude_none=True, by_alias=True)
-                    logger.info("Generated event in agent run streaming: %s", sse_event)
-                    yield f"data: {sse_event}\n\n"
-            except Exception as e:
-                logger.exception("Error in event_generator: %s", e)
-                # You might want to yield an error event here
-                yield f'data: {{"error": "{str(e)}"}}\n\n'
+            server_metrics.current_app_name.set(req.app_name)
+            with tracker.streaming():
+                try:
+                    encoder = SseEncoder()
+                    async for event in run_events:
+                        # Format as SSE data
+                        with metrics.stage(req.app_name, server_metrics.STAGE_SERIALIZATION):
+                            sse_event = encoder.encode(event)
+                        tracker.on_event()
+                        yield sse_event
+                except Exception as e:
+                    tracker.status = "error"
+                    logger.exception("Error in event_generator: %s", e)
+                    yield SseEncoder.encode_error(e)
 
         # Returns a streaming response with the proper media type for SSE
-        return StreamingResponse(
-            event_generator(),
-            media_type="text/event-stream",
-        )
+        return _stream_response(
+            event_generator(), slot, tracker, media_type="text/event-stream")
+
+    @app.post("/run_ndjson")
+    async def agent_run_ndjson(
+        req: AgentRunRequest,
+        accept_encoding: Optional[str] = Header(None),
+        x_priority: Optional[str] = Header(None),
+        idempotency_key: Optional[str] = Header(None),
+    ) -> StreamingResponse:
+        # Streams one JSON event per line as it is produced. Each chunk is
+        # awaited by the server before the next event is pulled from the
+        # runner, so a slow client slows the run instead of growing a buffer.
+        server_metrics.current_app_name.set(req.app_name)
+        tracker = server_metrics.RunTracker(metrics, req.app_name, "run_ndjson")
+        with tracker.before_streaming():
+            with metrics.stage(req.app_name, server_metrics.STAGE_SESSION_FETCH):
+                session = await session_service.get_session(
+                    app_name=req.app_name, user_id=req.user_id, session_id=req.session_id
+                )
+            if not session:
+                raise HTTPException(status_code=404, detail="Session not found")
+            compressor = StreamCompressor(negotiate_encoding(accept_encoding))
+            run_events, slot = await _start_run(req, idempotency_key, x_priority)
+
+        async def event_generator():
+            server_metrics.current_app_name.set(req.app_name)
+            with tracker.streaming():
+                try:
+                    encoder = SseEncoder()
+                    async for event in run_events:
+                        with metrics.stage(req.app_name, server_metrics.STAGE_SERIALIZATION):
+                            line = encoder.serialize(event).encode() + b"\n"
+                        tracker.on_event()
+                        yield compressor.compress(line)
+                except Exception as e:
+                    tracker.status = "error"
+                    logger.exception("Error in ndjson event_generator: %s", e)
+                    yield compressor.compress(
+                        json.dumps({"error": str(e)}).encode() + b"\n")
+                if tail := compressor.finish():
+                    yield tail
+
+        headers = {"Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+        if compressor.encoding:
+            headers["Content-Encoding"] = compressor.encoding
+        return _stream_response(event_generator(), slot, tracker,
+                                media_type=NDJSON_MEDIA_TYPE, headers=headers)
 
 
     @app.websocket("/run_live")
@@ -387,27 +903,42 @@ def get_fast_api_app(
         modalities: List[Literal["TEXT", "AUDIO"]] = Query(
             default=["TEXT", "AUDIO"]
         ),  # Only allows "TEXT" or "AUDIO"
+        priority: Optional[str] = Query(None),
     ) -> None:
       await websocket.accept()
-      session = await session_service.get_session(
-          app_name=app_name, user_id=user_id, session_id=session_id
-      )
+      server_metrics.current_app_name.set(app_name)
+      with metrics.stage(app_name, server_metrics.STAGE_SESSION_FETCH):
+          session = await session_service.get_session(
+              app_name=app_name, user_id=user_id, session_id=session_id
+          )
       if not session:
           # Accept first so that the client is aware of connection establishment,
           # then close with a specific code.
           await websocket.close(code=1002, reason="Session not found")
           return
+      try:
+          slot = await admission.acquire(
+              app_name, user_id, priority or LANE_INTERACTIVE)
+      except AdmissionRejected as e:
+          WEBSOCKET_TRY_AGAIN_LATER_CODE = 1013
+          await websocket.close(code=WEBSOCKET_TRY_AGAIN_LATER_CODE, reason=str(e))
+          return
 
       live_request_queue = LiveRequestQueue()
 
+      tracker = server_metrics.RunTracker(metrics, app_name, "run_live")
+
       async def forward_events():
-        runner = await _get_runner_async(app_name)
-        async for event in runner.run_live(
-            session=session, live_request_queue=live_request_queue
-        ):
-          await websocket.send_text(
-              event.model_dump_json(exclude_none=True, by_alias=True)
-          )
+        async with agent_resources.lease(app_name):
+          with metrics.stage(app_name, server_metrics.STAGE_RUNNER_LOOKUP):
+              runner = await _get_runner_async(app_name)
+          async for event in runner.run_live(
+              session=session, live_request_queue=live_request_queue
+          ):
+            with metrics.stage(app_name, server_metrics.STAGE_SERIALIZATION):
+                payload = event.model_dump_json(exclude_none=True, by_alias=True)
+            tracker.on_event()
+            await websocket.send_text(payload)
 
       async def process_messages():
           try:
@@ -419,6 +950,7 @@ def get_fast_api_app(
               logger.error("Validation error in process_messages: %s", ve)
 
       # Run both tasks concurrently and cancel all if one fails.
+      tracker.start()
       tasks = [
           asyncio.create_task(forward_events()),
           asyncio.create_task(process_messages()),
@@ -433,6 +965,7 @@ def get_fast_api_app(
       except WebSocketDisconnect:
           logger.info("Client disconnected during process_messages.")
       except Exception as e:
+          tracker.status = "error"
           logger.exception("Error during live websocket communication: %s", e)
           traceback.print_exc()
           WEBSOCKET_INTERNAL_ERROR_CODE = 1011
@@ -444,43 +977,94 @@ def get_fast_api_app(
       finally:
           for task in pending:
               task.cancel()
+          tracker.finish()
+          slot.release()
 
-    async def _get_root_agent_async(app_name: str) -> Agent:
-        """Returns the root agent for the given app."""
-        if app_name in root_agent_dict:
-            return root_agent_dict[app_name]
-        agent_module_name = ".".join(Path(agent_dir).relative_to(os.getcwd()).parts)
-        agent_module = importlib.import_module(agent_module_name)
-        if getattr(agent_module.agent, "root_agent"):
-            root_agent = agent_module.agent.root_agent
-        else:
-            raise ValueError(f'Unable to find "root_agent" from {app_name}.')
+    async def _open_live_channel(
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        priority: Optional[str],
+        live_request_queue: LiveRequestQueue,
+    ) -> AsyncIterator[Event]:
+        """Admits one channel of /run_live_mux and returns its live events."""
+        server_metrics.current_app_name.set(app_name)
+        with metrics.stage(app_name, server_metrics.STAGE_SESSION_FETCH):
+            session = await session_service.get_session(
+                app_name=app_name, user_id=user_id, session_id=session_id
+            )
+        if not session:
+            raise ValueError("Session not found")
+        slot = await admission.acquire(
+            app_name, user_id, priority or LANE_INTERACTIVE)
 
-        # Handle an awaitable root agent and await for the actual agent.
-        if inspect.isawaitable(root_agent):
+        async def live_events():
             try:
-                agent, exit_stack = await root_agent
-                exit_stacks.append(exit_stack)
-                root_agent = agent
-            except Exception as e:
-                raise RuntimeError(f"error getting root agent, {e}") from e
+                with server_metrics.RunTracker(metrics, app_name, "run_live_mux") as tracker:
+                    async with agent_resources.lease(app_name):
+                        with metrics.stage(app_name, server_metrics.STAGE_RUNNER_LOOKUP):
+                            runner = await _get_runner_async(app_name)
+                        async for event in runner.run_live(
+                            session=session, live_request_queue=live_request_queue
+                        ):
+                            tracker.on_event()
+                            yield event
+            finally:
+                slot.release()
 
-        root_agent_dict[app_name] = root_agent
-        return root_agent
+        return live_events()
+
+    @app.websocket("/run_live_mux")
+    async def agent_live_run_mux(websocket: WebSocket) -> None:
+        # Serves several live sessions over one connection; see live_mux for
+        # the message protocol.
+        await websocket.accept()
+        try:
+            await LiveMultiplexer(websocket, _open_live_channel).serve()
+        except WebSocketDisconnect:
+            logger.info("Client disconnected from multiplexed live run.")
+
+    async def _import_agent_module(app_name: str) -> ModuleType:
+        agent_module_name = agent_index.module_for(app_name)
+        if agent_module_name is None:
+            raise HTTPException(status_code=404, detail=f"App not found: {app_name}")
+        # Imports can take seconds; keep them off the event loop.
+        return await asyncio.to_thread(importlib.import_module, agent_module_name)
+
+    async def _get_root_agent_async(app_name: str) -> Agent:
+        """Returns the root agent for the given app."""
+        return await agent_resources.get(app_name)
 
     async def _get_runner_async(app_name: str) -> Runner:
         """Returns the runner for the given app."""
         if app_name in runner_dict:
             return runner_dict[app_name]
-        root_agent = await _get_root_agent_async(app_name)
-        runner = Runner(
-            app_name=app_name,
-            agent=root_agent,
-            artifact_service=artifact_service,
-            session_service=session_service,
-            memory_service=memory_service,
-        )
-        runner_dict[app_name] = runner
-        return runner
+        async with runner_locks[app_name]:
+            if app_name in runner_dict:
+                return runner_dict[app_name]
+            root_agent = await _get_root_agent_async(app_name)
+            runner = Runner(
+                app_name=app_name,
+                agent=root_agent,
+                artifact_service=artifact_service,
+                session_service=session_service,
+                memory_service=memory_service,
+            )
+            runner_dict[app_name] = runner
+            return runner
 
     return app
+
+
+def app_from_env() -> FastAPI:
+    """Builds the server from environment variables, for process managers.
+
+    Used by the workers of src.app.supervisor, e.g. as
+    `uvicorn --factory src.app.fast_api_app:app_from_env`.
+    """
+    allow_origins = os.environ.get("ALLOW_ORIGINS")
+    return get_fast_api_app(
+        agent_dir=os.environ.get("AGENTS_DIR", "agents"),
+        allow_origins=allow_origins.split(",") if allow_origins else None,
+        trace_to_cloud=os.environ.get("TRACE_TO_CLOUD", "").lower() in ("1", "true"),
+    )
@@ -0,0 +1,240 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Idempotency keys for agent runs"""
+
+import asyncio
+from collections import OrderedDict, deque
+import logging
+import time
+from typing import AsyncGenerator, AsyncIterator, Callable, Optional
+
+from google.adk.events.event import Event
+
+logger = logging.getLogger(__name__)
+
+
+class IdempotencyConflict(Exception):
+    """Raised when a key is reused for a different request, or cannot be replayed."""
+
+
+class RunRecord:
+    """Events of one keyed agent run, shared by every request using the key.
+
+    The run itself executes in a background task that does not depend on
+    any client connection, so a retried request can attach to it while it
+    is still running, or replay it once it has finished.
+
+    A run that produces more than `max_events` events is no longer
+    replayable, and only the events that attached requests have yet to
+    read are kept from then on.
+    """
+
+    def __init__(self, fingerprint: str, max_events: int = 5000):
+        self.fingerprint = fingerprint
+        self.max_events = max_events
+        self.events: deque[Event] = deque()
+        self.done = False
+        self.error: Optional[str] = None
+        self.replayable = True
+        self.finished_at: Optional[float] = None
+        # Number of events dropped from the front of `events`.
+        self._offset = 0
+        self._released = False
+        # Position of the next event each attached request will read.
+        self._readers: dict[object, int] = {}
+        self._changed = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _trim(self):
+        keep = 0 if self._released else self.max_events
+        floor = self._offset + len(self.events) - keep
+        if self._readers:
+            floor = min(floor, min(self._readers.values()))
+        while self._offset < floor:
+            self.events.popleft()
+            self._offset += 1
+
+    def append(self, event: Event):
+        self.events.append(event)
+        if len(self.events) > self.max_events:
+            # Too large to keep around for replays.
+            self.replayable = False
+        if not self.replayable:
+            self._trim()
+        self._notify()
+
+    def start(self,
+              events: AsyncIterator[Event],
+              on_done: Optional[Callable[[], None]] = None):
+        self._task = asyncio.create_task(self._run(events, on_done))
+
+    async def _run(self,
+                   events: AsyncIterator[Event],
+                   on_done: Optional[Callable[[], None]]):
+        try:
+            async for event in events:
+                self.append(event)
+        except Exception as e:
+            logger.exception("Error in idempotent agent run: %s", e)
+            self.error = str(e)
+        finally:
+            self.finish()
+            if on_done:
+                on_done()
+
+    def fail(self, error: str):
+        self.error = error
+        self.finish()
+
+    def finish(self):
+        self.done = True
+        self.finished_at = time.monotonic()
+        self._notify()
+
+    def release_events(self):
+        if not self.replayable:
+            self._released = True
+            self._trim()
+
+    def can_replay(self) -> bool:
+        return self.replayable
+
+    def subscribe(
+        self, after_event_id: Optional[str] = None
+    ) -> AsyncIterator[Event]:
+        """Yields every event of the run, waiting for new ones until it ends.
+
+        With `after_event_id`, events up to and including that one are
+        skipped, for a client resuming with Last-Event-ID. Raises
+        IdempotencyConflict right away when the run cannot be replayed.
+        """
+        if not self.can_replay():
+            raise IdempotencyConflict("Run result is too large to replay")
+        start = self._offset
+        if after_event_id is not None:
+            start = next(
+                (start + i + 1 for i, event in enumerate(self.events)
+                 if event.id == after_event_id),
+                start,
+            )
+        # Registered now, so nothing this request will read is trimmed
+        # before it starts iterating.
+        reader = object()
+        self._readers[reader] = start
+        return self._follow(reader, start)
+
+    async def _follow(self, reader: object,
+                      position: int) -> AsyncGenerator[Event, None]:
+        try:
+            while True:
+                changed = self._changed
+                while position < self._offset + len(self.events):
+                    yield self.events[position - self._offset]
+                    position += 1
+                    self._readers[reader] = position
+                if self.done:
+                    break
+                await changed.wait()
+        finally:
+            del self._readers[reader]
+            if not self.replayable:
+                self._trim()
+        if self.error is not None:
+            raise RuntimeError(self.error)
+
+
+class IdempotencyStore:
+    """Bounded map from idempotency keys to run records.
+
+    Finished records are kept for `ttl_seconds` and at most `max_entries`
+    of them, oldest dropped first. Records of runs still in progress are
+    never dropped.
+    """
+
+    def __init__(self,
+                 max_entries: int = 256,
+                 ttl_seconds: float = 600.0,
+                 max_events_per_run: int = 5000):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_events_per_run = max_events_per_run
+        self._records: OrderedDict[tuple, RunRecord] = OrderedDict()
+
+    def _evict(self):
+        expired_before = time.monotonic() - self.ttl_seconds
+        finished = [
+            key for key, record in self._records.items() if record.done
+        ]
+        excess = len(self._records) - self.max_entries
+        for key in finished:
+            record = self._records[key]
+            if excess > 0 or record.finished_at < expired_before:
+                del self._records[key]
+                excess -= 1
+
+    def get_or_reserve(
+        self, scope: tuple, key: str, fingerprint: str
+    ) -> tuple[RunRecord, bool]:
+        """Returns the record for a key and whether it was just created.
+
+        A new record is reserved synchronously, before the caller awaits
+        anything, so concurrent requests with one key share a single run.
+        """
+        self._evict()
+        record_key = (*scope, key)
+        record = self._records.get(record_key)
+        if record is not None:
+            if record.fingerprint != fingerprint:
+                raise IdempotencyConflict(
+                    "Idempotency-Key was already used for a different request")
+            self._records.move_to_end(record_key)
+            return record, False
+        record = RunRecord(fingerprint, self.max_events_per_run)
+        self._records[record_key] = record
+        return record, True
+
+    def get(self, scope: tuple, key: str, fingerprint: str) -> Optional[RunRecord]:
+        """Returns the record for a key, if its request matches."""
+        self._evict()
+        record = self._records.get((*scope, key))
+        if record is not None and record.fingerprint != fingerprint:
+            raise IdempotencyConflict(
+                "Idempotency-Key was already used for a different request")
+        return record
+
+    def discard(self, scope: tuple, key: str, record: Optional[RunRecord] = None):
+        """Drops a key's record; with `record`, only if it is still that one."""
+        record_key = (*scope, key)
+        if record is None or self._records.get(record_key) is record:
+            self._records.pop(record_key, None)
+
+    def start(self,
+              scope: tuple,
+              key: str,
+              record: RunRecord,
+              events: AsyncIterator[Event],
+              on_done: Optional[Callable[[], None]] = None):
+        def done():
+            record.release_events()
+            if record.error is not None:
+                # A retry with the key should run again, not replay the error.
+                self.discard(scope, key, record)
+            if on_done:
+                on_done()
+
+        record.start(events, on_done=done)
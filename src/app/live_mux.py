@@ -0,0 +1,237 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Several live agent sessions multiplexed over one websocket.
+
+Every message is a JSON object tagged with a client-chosen `channel` id.
+
+Client to server:
+    {"type": "open", "channel": "c1", "app_name": ..., "user_id": ...,
+     "session_id": ..., "priority": "interactive"}
+    {"type": "send", "channel": "c1", "request": <LiveRequest>}
+    {"type": "credit", "channel": "c1", "credits": 16}
+    {"type": "close", "channel": "c1"}
+
+Server to client:
+    {"type": "opened", "channel": "c1", "credits": 32}
+    {"type": "event", "channel": "c1", "event": <Event>}
+    {"type": "error", "channel": "c1", "error": "..."}
+    {"type": "closed", "channel": "c1", "reason": "..."}
+
+Each channel starts with `initial_credits`; every event sent uses one and
+the channel's run is paused at zero until the client grants more. Frames
+ready on several channels are written round-robin, one per channel per
+turn, so a chatty session cannot starve the others.
+"""
+
+import asyncio
+from collections import deque
+import json
+import logging
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+from fastapi import WebSocket
+from google.adk.agents.live_request_queue import LiveRequest, LiveRequestQueue
+from google.adk.events.event import Event
+from pydantic import ValidationError
+
+logger = logging.getLogger(__name__)
+
+# Opens the live run of one channel: (app_name, user_id, session_id,
+# priority, live_request_queue) -> events. Raising closes the channel.
+OpenChannel = Callable[
+    [str, str, str, Optional[str], LiveRequestQueue],
+    Awaitable[AsyncIterator[Event]],
+]
+
+
+class _Channel:
+
+    def __init__(self, channel_id: str, credits: int):
+        self.id = channel_id
+        self.credits = credits
+        self.credit_available = asyncio.Event()
+        if credits > 0:
+            self.credit_available.set()
+        self.live_request_queue = LiveRequestQueue()
+        self.frames: deque[str] = deque()
+        self.task: Optional[asyncio.Task] = None
+
+    def grant(self, credits: int):
+        self.credits += credits
+        if self.credits > 0:
+            self.credit_available.set()
+
+    async def take_credit(self):
+        await self.credit_available.wait()
+        self.credits -= 1
+        if self.credits <= 0:
+            self.credit_available.clear()
+
+
+class LiveMultiplexer:
+    """Serves the channels of one multiplexed live websocket."""
+
+    def __init__(self,
+                 websocket: WebSocket,
+                 open_channel: OpenChannel,
+                 max_channels: int = 16,
+                 initial_credits: int = 32):
+        self.websocket = websocket
+        self.open_channel = open_channel
+        self.max_channels = max_channels
+        self.initial_credits = initial_credits
+        self._channels: dict[str, _Channel] = {}
+        # Channels with frames to write, in round-robin order. A channel is
+        # in here exactly when its `frames` is not empty.
+        self._ready: deque[_Channel] = deque()
+        self._wakeup = asyncio.Event()
+        # Frames that belong to no open channel, e.g. protocol errors.
+        self._control: deque[str] = deque()
+
+    def _enqueue(self, channel: _Channel, frame: str):
+        if not channel.frames:
+            self._ready.append(channel)
+        channel.frames.append(frame)
+        self._wakeup.set()
+
+    def _send_control(self, frame: dict):
+        self._control.append(json.dumps(frame))
+        self._wakeup.set()
+
+    async def _write_frames(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self._control or self._ready:
+                if self._control:
+                    await self.websocket.send_text(self._control.popleft())
+                    continue
+                channel = self._ready.popleft()
+                frame = channel.frames.popleft()
+                if channel.frames:
+                    self._ready.append(channel)
+                await self.websocket.send_text(frame)
+
+    async def _run_channel(self, channel: _Channel, message: dict):
+        tag = json.dumps(channel.id)
+        reason = "completed"
+        try:
+            events = await self.open_channel(
+                message["app_name"],
+                message["user_id"],
+                message["session_id"],
+                message.get("priority"),
+                channel.live_request_queue,
+            )
+            self._enqueue(channel, json.dumps({
+                "type": "opened", "channel": channel.id,
+                "credits": channel.credits,
+            }))
+            async for event in events:
+                await channel.take_credit()
+                payload = event.model_dump_json(exclude_none=True, by_alias=True)
+                # The event is already JSON; splice it in instead of re-encoding.
+                self._enqueue(
+                    channel, f'{{"type":"event","channel":{tag},"event":{payload}}}')
+        except asyncio.CancelledError:
+            reason = "closed"
+            raise
+        except Exception as e:
+            logger.exception("Error in live channel %s: %s", channel.id, e)
+            reason = "error"
+            self._enqueue(channel, json.dumps(
+                {"type": "error", "channel": channel.id, "error": str(e)}))
+        finally:
+            channel.live_request_queue.close()
+            if self._channels.get(channel.id) is channel:
+                del self._channels[channel.id]
+                self._enqueue(channel, json.dumps(
+                    {"type": "closed", "channel": channel.id, "reason": reason}))
+
+    def _open(self, channel_id: str, message: dict):
+        if channel_id in self._channels:
+            raise ValueError(f"Channel already open: {channel_id}")
+        if len(self._channels) >= self.max_channels:
+            raise ValueError(f"Too many channels, at most {self.max_channels}")
+        missing = [
+            key for key in ("app_name", "user_id", "session_id")
+            if not message.get(key)
+        ]
+        if missing:
+            raise ValueError(f"Missing fields: {', '.join(missing)}")
+        channel = _Channel(channel_id, self.initial_credits)
+        self._channels[channel_id] = channel
+        channel.task = asyncio.create_task(self._run_channel(channel, message))
+
+    def _handle(self, message: dict):
+        kind = message.get("type")
+        channel_id = message.get("channel")
+        if not isinstance(channel_id, str):
+            raise ValueError("Message has no channel id")
+        if kind == "open":
+            self._open(channel_id, message)
+            return
+        channel = self._channels.get(channel_id)
+        if channel is None:
+            raise ValueError(f"Unknown channel: {channel_id}")
+        if kind == "send":
+            channel.live_request_queue.send(
+                LiveRequest.model_validate(message.get("request") or {}))
+        elif kind == "credit":
+            credits = message.get("credits")
+            if (not isinstance(credits, int) or isinstance(credits, bool)
+                    or credits <= 0):
+                raise ValueError(
+                    f"credits must be a positive integer, got {credits!r}")
+            channel.grant(credits)
+        elif kind == "close":
+            del self._channels[channel_id]
+            channel.task.cancel()
+            self._enqueue(channel, json.dumps(
+                {"type": "closed", "channel": channel_id, "reason": "closed"}))
+        else:
+            raise ValueError(f"Unknown message type: {kind}")
+
+    async def _read_messages(self):
+        while True:
+            data = await self.websocket.receive_text()
+            message = None
+            try:
+                message = json.loads(data)
+                if not isinstance(message, dict):
+                    raise ValueError("Message must be a JSON object")
+                self._handle(message)
+            except (ValueError, ValidationError) as e:
+                channel_id = message.get("channel") if isinstance(message, dict) else None
+                self._send_control(
+                    {"type": "error", "channel": channel_id, "error": str(e)})
+
+    async def serve(self):
+        """Serves the connection until the client disconnects."""
+        writer = asyncio.create_task(self._write_frames())
+        reader = asyncio.create_task(self._read_messages())
+        try:
+            done, _ = await asyncio.wait(
+                [writer, reader], return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+        finally:
+            writer.cancel()
+            reader.cancel()
+            channels = list(self._channels.values())
+            self._channels.clear()
+            for channel in channels:
+                channel.task.cancel()
+            await asyncio.gather(
+                *(channel.task for channel in channels), return_exceptions=True)
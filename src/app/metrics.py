@@ -0,0 +1,260 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Prometheus metrics for agent runs"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+import time
+from typing import Callable, Iterator, Optional
+
+from opentelemetry.context import Context
+from opentelemetry.sdk.trace import ReadableSpan, Span, SpanProcessor
+from prometheus_client import (
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# Set by the run endpoints so spans ending inside a run can be attributed
+# to the app without a lookup.
+current_app_name: ContextVar[str] = ContextVar("current_app_name", default="unknown")
+
+STAGE_SESSION_FETCH = "session_fetch"
+STAGE_RUNNER_LOOKUP = "runner_lookup"
+STAGE_LLM_CALL = "llm_call"
+STAGE_TOOL_CALL = "tool_call"
+STAGE_SERIALIZATION = "serialization"
+
+# Serialization and lookups take microseconds, LLM calls tens of seconds.
+_STAGE_BUCKETS = (
+    0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0,
+)
+_RUN_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+
+class _SessionCacheCollector:
+    """Exposes CachedSessionService counters at scrape time."""
+
+    def __init__(self, stats: Callable[[], dict]):
+        self._stats = stats
+
+    def collect(self):
+        stats = self._stats()
+        for name in ("hits", "misses", "coalesced", "evictions"):
+            counter = CounterMetricFamily(
+                f"agent_session_cache_{name}", f"Session cache {name}.")
+            counter.add_metric([], stats[name])
+            yield counter
+        size = GaugeMetricFamily("agent_session_cache_size", "Cached sessions.")
+        size.add_metric([], stats["size"])
+        yield size
+
+
+class ServerMetrics:
+    """Metrics of one FastAPI agent server, in their own registry."""
+
+    def __init__(self):
+        self.registry = CollectorRegistry(auto_describe=True)
+        self.stage_seconds = Histogram(
+            "agent_stage_duration_seconds",
+            "Time spent per stage of an agent run.",
+            ["app_name", "stage"],
+            buckets=_STAGE_BUCKETS,
+            registry=self.registry,
+        )
+        self.run_seconds = Histogram(
+            "agent_run_duration_seconds",
+            "End-to-end duration of an agent run.",
+            ["app_name", "endpoint"],
+            buckets=_RUN_BUCKETS,
+            registry=self.registry,
+        )
+        self.time_to_first_event_seconds = Histogram(
+            "agent_time_to_first_event_seconds",
+            "Time from request to the first event sent to the client.",
+            ["app_name", "endpoint"],
+            buckets=_RUN_BUCKETS,
+            registry=self.registry,
+        )
+        self.runs = Counter(
+            "agent_runs",
+            "Finished agent runs.",
+            ["app_name", "endpoint", "status"],
+            registry=self.registry,
+        )
+        self.events = Counter(
+            "agent_events",
+            "Events sent to clients.",
+            ["app_name", "endpoint"],
+            registry=self.registry,
+        )
+        self.runs_in_flight = Gauge(
+            "agent_runs_in_flight",
+            "Agent runs currently in progress.",
+            ["app_name", "endpoint"],
+            registry=self.registry,
+        )
+        self.admission_queue_depth = Gauge(
+            "agent_admission_queue_depth",
+            "Agent runs waiting for a slot.",
+            ["lane"],
+            registry=self.registry,
+        )
+        self.admission_wait_seconds = Histogram(
+            "agent_admission_wait_seconds",
+            "Time agent runs waited for a slot.",
+            ["app_name", "lane"],
+            buckets=_STAGE_BUCKETS,
+            registry=self.registry,
+        )
+        self.admission_rejections = Counter(
+            "agent_admission_rejections",
+            "Agent runs rejected with 429.",
+            ["app_name", "lane", "reason"],
+            registry=self.registry,
+        )
+
+    def register_session_cache(self, stats: Callable[[], dict]):
+        self.registry.register(_SessionCacheCollector(stats))
+
+    def observe_stage(self, app_name: str, stage: str, seconds: float):
+        self.stage_seconds.labels(app_name, stage).observe(seconds)
+
+    @contextmanager
+    def stage(self, app_name: str, stage: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_stage(app_name, stage, time.perf_counter() - started)
+
+    def render(self) -> bytes:
+        return generate_latest(self.registry)
+
+
+class RunTracker:
+    """Tracks one agent run: in-flight gauge, first event, events, outcome."""
+
+    def __init__(self, metrics: ServerMetrics, app_name: str, endpoint: str):
+        self.metrics = metrics
+        self.app_name = app_name
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.first_event_at: Optional[float] = None
+        self.event_count = 0
+        self.status = "ok"
+        self.finished = False
+
+    def __enter__(self) -> "RunTracker":
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.status = "error"
+        self.finish()
+
+    def start(self):
+        self.metrics.runs_in_flight.labels(self.app_name, self.endpoint).inc()
+
+    @contextmanager
+    def before_streaming(self) -> Iterator["RunTracker"]:
+        """Starts tracking a streamed run while its response is prepared.
+
+        Finishes the run only if preparing it fails; otherwise the stream
+        finishes it, within `streaming()`, or the response once it is sent
+        if the stream never started.
+        """
+        self.start()
+        try:
+            yield self
+        except BaseException:
+            self.status = "error"
+            self.finish()
+            raise
+
+    @contextmanager
+    def streaming(self) -> Iterator["RunTracker"]:
+        try:
+            yield self
+        except BaseException:
+            self.status = "error"
+            raise
+        finally:
+            self.finish()
+
+    def finish(self, status: Optional[str] = None):
+        """Records the run's outcome; only the first call counts.
+
+        `status` overrides the tracked one, e.g. for a stream the client
+        left before it started.
+        """
+        if self.finished:
+            return
+        self.finished = True
+        if status is not None:
+            self.status = status
+        labels = (self.app_name, self.endpoint)
+        self.metrics.runs_in_flight.labels(*labels).dec()
+        self.metrics.run_seconds.labels(*labels).observe(
+            time.perf_counter() - self.started)
+        self.metrics.runs.labels(*labels, self.status).inc()
+        if self.event_count:
+            self.metrics.events.labels(*labels).inc(self.event_count)
+
+    def on_event(self):
+        self.event_count += 1
+        if self.first_event_at is None:
+            self.first_event_at = time.perf_counter()
+            self.metrics.time_to_first_event_seconds.labels(
+                self.app_name, self.endpoint
+            ).observe(self.first_event_at - self.started)
+
+
+class StageMetricsSpanProcessor(SpanProcessor):
+    """Records LLM and tool call durations from ADK's spans as they end.
+
+    Runs synchronously in the span's own context, which is what lets it read
+    `current_app_name`; it only observes a histogram.
+    """
+
+    def __init__(self, metrics: ServerMetrics):
+        self.metrics = metrics
+
+    def on_start(self, span: Span, parent_context: Optional[Context] = None):
+        pass
+
+    def on_end(self, span: ReadableSpan):
+        name = span.name
+        if name == "call_llm":
+            stage = STAGE_LLM_CALL
+        elif name.startswith("execute_tool") and name != "execute_tool (merged)":
+            stage = STAGE_TOOL_CALL
+        else:
+            return
+        if span.start_time and span.end_time:
+            self.metrics.observe_stage(
+                current_app_name.get(), stage,
+                (span.end_time - span.start_time) / 1e9,
+            )
+
+    def shutdown(self):
+        pass
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return True
@@ -0,0 +1,75 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Newline-delimited JSON streaming with per-event compression"""
+
+from typing import Optional
+import zlib
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available.
+    brotli = None
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Picks "br", "gzip" or None (identity) from an Accept-Encoding header."""
+    if not accept_encoding:
+        return None
+    weights = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[coding.strip().lower()] = weight
+    candidates = ["br", "gzip"] if brotli is not None else ["gzip"]
+    best = max(candidates, key=lambda c: weights.get(c, weights.get("*", 0.0)))
+    return best if weights.get(best, weights.get("*", 0.0)) > 0 else None
+
+
+class StreamCompressor:
+    """Compresses a stream chunk by chunk, flushing after every chunk.
+
+    Flushing keeps each event decodable by the client as soon as it is
+    sent, at a small cost in compression ratio.
+    """
+
+    def __init__(self, encoding: Optional[str]):
+        self.encoding = encoding
+        if encoding == "gzip":
+            self._gzip = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        elif encoding == "br":
+            self._brotli = brotli.Compressor(quality=4)
+        elif encoding is not None:
+            raise ValueError(f"Unsupported encoding: {encoding}")
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == "gzip":
+            return self._gzip.compress(data) + self._gzip.flush(zlib.Z_SYNC_FLUSH)
+        if self.encoding == "br":
+            return self._brotli.process(data) + self._brotli.flush()
+        return data
+
+    def finish(self) -> bytes:
+        if self.encoding == "gzip":
+            return self._gzip.flush(zlib.Z_FINISH)
+        if self.encoding == "br":
+            return self._brotli.finish()
+        return b""
@@ -1,7 +1,19 @@
+import asyncio
+import logging
+from typing import Any
+
 from fastapi import APIRouter, Body
-from src.app.utils.remote_agent import get_remote_agent
+from fastapi.responses import StreamingResponse
+from google.adk.sessions import Session
+from src.app.agent_runtime_client import AgentEngineRuntime
+from src.app.sse import SseEncoder
+from src.app.utils.remote_agent import (
+    get_reasoning_engine_resource_path,
+    remote_agents,
+)
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 
 
@@ -10,9 +22,13 @@ router = APIRouter()
 def root():
     return {"message": "Welcome to the Agent Engine Service API!"}
 
+@router.get("/debug/remote_agents")
+def get_remote_agent_stats() -> dict[str, Any]:
+    return remote_agents.stats()
+
 @router.post("/create_session")
 async def create_session(user_id: str = Body(..., embed=True), reasoning_engine_id: str = Body(..., embed=True)):
-    remote_agent = get_remote_agent(reasoning_engine_id)
+    remote_agent = await remote_agents.get(reasoning_engine_id)
     remote_session = remote_agent.create_session(user_id=user_id)
     return remote_session
 
@@ -23,10 +39,23 @@ async def chat_with_agent(
     message: str = Body(..., embed=True),
     reasoning_engine_id: str = Body(..., embed=True)
 ):
-    remote_agent = get_remote_agent(reasoning_engine_id)
-    response = remote_agent.stream_query(
-        user_id=user_id,
-        session_id=session_id,
-        message=message,
+    # Streamed on the async REST API, so no thread is held per chat. When
+    # the client disconnects the response task is cancelled, which closes
+    # the upstream stream and ends the remote query.
+    runtime = AgentEngineRuntime(
+        Session(app_name=reasoning_engine_id, user_id=user_id, id=session_id),
+        get_reasoning_engine_resource_path(reasoning_engine_id),
     )
-    return {"response": response}
\ No newline at end of file
+
+    async def event_generator():
+        encoder = SseEncoder()
+        try:
+            async for event in runtime.stream_query(message):
+                yield encoder.encode(event)
+        except asyncio.CancelledError:
+            logger.info("Client left chat %s; cancelled the remote query", session_id)
+            raise
+        if runtime.last_error:
+            yield SseEncoder.encode_error(runtime.last_error)
+
+    return StreamingResponse(event_generator(), media_type="text/event-stream")
@@ -0,0 +1,182 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Read-through session cache"""
+
+import asyncio
+from collections import OrderedDict
+import time
+from typing import Any, Optional
+from typing_extensions import override
+
+from google.adk.events.event import Event
+from google.adk.sessions import BaseSessionService, Session
+from google.adk.sessions.base_session_service import (
+    GetSessionConfig,
+    ListSessionsResponse,
+)
+
+_SessionKey = tuple[str, str, str]
+
+
+class CachedSessionService(BaseSessionService):
+    """Session service that keeps recently loaded sessions in process memory.
+
+    Wraps another session service. Full `get_session` reads are served from
+    an LRU cache bounded by `max_size` entries, each valid for `ttl_seconds`.
+    Concurrent misses for the same session share a single backend call.
+    Entries are dropped whenever an event is appended to, or the session is
+    deleted through, this service.
+    """
+
+    def __init__(self,
+                 backend: BaseSessionService,
+                 ttl_seconds: float = 30.0,
+                 max_size: int = 1024):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self._entries: OrderedDict[_SessionKey, tuple[float, Session]] = OrderedDict()
+        self._loading: dict[_SessionKey, asyncio.Task] = {}
+        # Bumped on every invalidation, so a load that started before an
+        # append does not put a stale session back into the cache.
+        self._generations: dict[_SessionKey, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def stats(self) -> dict[str, Any]:
+        """Returns cache counters and the current hit ratio."""
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "hit_ratio": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+        }
+
+    def invalidate(self, app_name: str, user_id: str, session_id: str):
+        key = (app_name, user_id, session_id)
+        self._entries.pop(key, None)
+        if key in self._loading:
+            self._generations[key] = self._generations.get(key, 0) + 1
+
+    def _put(self, key: _SessionKey, session: Session):
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, session)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _get_fresh(self, key: _SessionKey) -> Optional[Session]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, session = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            self.evictions += 1
+            return None
+        self._entries.move_to_end(key)
+        return session
+
+    async def _load(self, key: _SessionKey) -> Optional[Session]:
+        generation = self._generations.get(key, 0)
+        try:
+            session = await self.backend.get_session(
+                app_name=key[0], user_id=key[1], session_id=key[2]
+            )
+            if session is not None and self._generations.get(key, 0) == generation:
+                self._put(key, session)
+            return session
+        finally:
+            self._loading.pop(key, None)
+            self._generations.pop(key, None)
+
+    @override
+    async def get_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        config: Optional[GetSessionConfig] = None,
+    ) -> Optional[Session]:
+        # Partial reads are not cached; they go straight to the backend.
+        if config is not None or self.max_size <= 0:
+            return await self.backend.get_session(
+                app_name=app_name, user_id=user_id, session_id=session_id,
+                config=config
+            )
+        key = (app_name, user_id, session_id)
+        session = self._get_fresh(key)
+        if session is not None:
+            self.hits += 1
+        else:
+            task = self._loading.get(key)
+            if task is None:
+                self.misses += 1
+                task = asyncio.create_task(self._load(key))
+                self._loading[key] = task
+            else:
+                self.coalesced += 1
+            # Shield the shared load so one cancelled caller does not cancel
+            # it for everyone else waiting on the same session.
+            session = await asyncio.shield(task)
+        # Callers (e.g. the Runner) mutate the session they get back, so they
+        # never receive the cached instance itself.
+        return session.model_copy(deep=True) if session is not None else None
+
+    @override
+    async def create_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        state: Optional[dict[str, Any]] = None,
+        session_id: Optional[str] = None,
+    ) -> Session:
+        session = await self.backend.create_session(
+            app_name=app_name, user_id=user_id, state=state, session_id=session_id
+        )
+        self.invalidate(app_name, user_id, session.id)
+        return session
+
+    @override
+    async def list_sessions(
+        self, *, app_name: str, user_id: str
+    ) -> ListSessionsResponse:
+        return await self.backend.list_sessions(app_name=app_name, user_id=user_id)
+
+    @override
+    async def delete_session(
+        self, *, app_name: str, user_id: str, session_id: str
+    ) -> None:
+        self.invalidate(app_name, user_id, session_id)
+        await self.backend.delete_session(
+            app_name=app_name, user_id=user_id, session_id=session_id
+        )
+
+    @override
+    async def append_event(self, session: Session, event: Event) -> Event:
+        if event.partial:
+            return event
+        try:
+            return await self.backend.append_event(session=session, event=event)
+        finally:
+            self.invalidate(session.app_name, session.user_id, session.id)
@@ -0,0 +1,110 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Session service backends selected by URI"""
+
+import importlib.util
+import logging
+import os
+from typing import Any, Optional
+
+from google.adk.sessions import (
+    BaseSessionService,
+    DatabaseSessionService,
+    InMemorySessionService,
+    VertexAiSessionService,
+)
+
+logger = logging.getLogger(__name__)
+
+# Connection pool settings for the SQL backends. Every session read or write
+# checks a connection out of the pool instead of reconnecting.
+DB_POOL_SIZE = int(os.environ.get("SESSION_DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.environ.get("SESSION_DB_MAX_OVERFLOW", "20"))
+DB_POOL_RECYCLE_SECONDS = 1800
+# psycopg 3 turns a query into a server-side prepared statement after it has
+# been executed this many times on a connection.
+PG_PREPARE_THRESHOLD = 1
+
+
+def _sqlite_engine_kwargs(uri: str) -> dict[str, Any]:
+    kwargs: dict[str, Any] = {
+        # sqlite3 keeps its own per-connection cache of prepared statements.
+        "connect_args": {"check_same_thread": False, "cached_statements": 256},
+    }
+    if uri.rstrip("/") not in ("sqlite:", "sqlite://") and ":memory:" not in uri:
+        # File databases get a real pool; in-memory ones must stay on the
+        # single connection SQLAlchemy gives them.
+        kwargs["pool_size"] = DB_POOL_SIZE
+        kwargs["max_overflow"] = DB_MAX_OVERFLOW
+    return kwargs
+
+
+def _postgres_uri_and_engine_kwargs(uri: str) -> tuple[str, dict[str, Any]]:
+    kwargs: dict[str, Any] = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_pre_ping": True,
+        "pool_recycle": DB_POOL_RECYCLE_SECONDS,
+    }
+    scheme = uri.split("://", 1)[0]
+    if scheme == "postgresql" and importlib.util.find_spec("psycopg"):
+        # No driver given: prefer psycopg 3, which supports server-side
+        # prepared statements (psycopg2 only interpolates client-side).
+        uri = "postgresql+psycopg://" + uri.split("://", 1)[1]
+        scheme = "postgresql+psycopg"
+    if scheme == "postgresql+psycopg":
+        kwargs["connect_args"] = {"prepare_threshold": PG_PREPARE_THRESHOLD}
+    return uri, kwargs
+
+
+def build_session_service(
+    session_service_uri: Optional[str] = None,
+) -> BaseSessionService:
+    """Builds the session service for a URI.
+
+    Supported URIs:
+      memory://                       process-local, for tests and dev
+      sqlite:///path/to/sessions.db   local SQLite file
+      postgresql://user:pw@host/db    PostgreSQL (optionally +driver)
+      agentengine://<engine id>       Vertex AI Agent Engine sessions
+
+    With no URI, SESSION_SERVICE_URI is used, and failing that the Agent
+    Engine given by AGENT_ENGINE_ID.
+    """
+    uri = session_service_uri or os.environ.get("SESSION_SERVICE_URI", "")
+    if not uri:
+        uri = f"agentengine://{os.environ['AGENT_ENGINE_ID']}"
+
+    scheme = uri.split("://", 1)[0]
+    if scheme == "memory":
+        logger.info("Using in-memory session service")
+        return InMemorySessionService()
+    if scheme == "agentengine":
+        agent_engine_id = uri.split("://", 1)[1]
+        if not agent_engine_id:
+            raise ValueError("agentengine:// URI must include an engine id")
+        logger.info("Using Agent Engine session service: %s", agent_engine_id)
+        return VertexAiSessionService(
+            project=os.environ["GOOGLE_CLOUD_PROJECT"],
+            location=os.environ.get("GOOGLE_CLOUD_LOCATION", "global"),
+            agent_engine_id=agent_engine_id,
+        )
+    if scheme.startswith("sqlite"):
+        logger.info("Using SQLite session service")
+        return DatabaseSessionService(db_url=uri, **_sqlite_engine_kwargs(uri))
+    if scheme.startswith("postgresql"):
+        db_url, kwargs = _postgres_uri_and_engine_kwargs(uri)
+        logger.info("Using PostgreSQL session service")
+        return DatabaseSessionService(db_url=db_url, **kwargs)
+    raise ValueError(f"Unsupported session service URI: {uri}")
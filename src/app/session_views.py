@@ -0,0 +1,242 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Paginated session listing and projected session reads"""
+
+import asyncio
+import base64
+from datetime import datetime
+import json
+from typing import Any, Optional
+
+from google.adk.events.event import Event
+from google.adk.sessions import BaseSessionService, DatabaseSessionService, Session
+from google.adk.sessions.base_session_service import GetSessionConfig
+from google.genai import types
+from pydantic import BaseModel, ConfigDict, alias_generators
+from sqlalchemy import and_, literal, or_
+
+from src.app.session_cache import CachedSessionService
+
+MAX_PAGE_SIZE = 1000
+
+
+class SessionSummary(BaseModel):
+    """A session without its events or state, for listings."""
+
+    model_config = ConfigDict(
+        alias_generator=alias_generators.to_camel,
+        populate_by_name=True,
+    )
+
+    id: str
+    app_name: str
+    user_id: str
+    last_update_time: float
+
+
+class SessionPage(BaseModel):
+    sessions: list[Session]
+    next_page_token: Optional[str] = None
+
+
+def listed(session: Session) -> Session:
+    """The projection of a session in listings: no events and no state.
+
+    ADK's own backends already list sessions this way, but not all of
+    them; applying it everywhere gives listings one shape on any backend.
+    """
+    if not session.events and not session.state:
+        return session
+    return session.model_copy(update={"events": [], "state": {}})
+
+
+def _encode_page_token(session: Session) -> str:
+    cursor = json.dumps([session.last_update_time, session.id])
+    return base64.urlsafe_b64encode(cursor.encode()).decode()
+
+
+def _decode_page_token(page_token: str) -> tuple[float, str]:
+    try:
+        last_update_time, session_id = json.loads(
+            base64.urlsafe_b64decode(page_token.encode()))
+        return float(last_update_time), str(session_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid page token") from e
+
+
+def _list_database_page(
+    service: DatabaseSessionService,
+    app_name: str,
+    user_id: str,
+    limit: int,
+    cursor: Optional[tuple[float, str]],
+) -> list[Session]:
+    from google.adk.sessions.database_session_service import StorageSession
+
+    with service.database_session_factory() as db:
+        query = (
+            db.query(StorageSession.id, StorageSession.update_time)
+            .filter(StorageSession.app_name == app_name)
+            .filter(StorageSession.user_id == user_id)
+        )
+        if cursor is not None:
+            after_time = datetime.fromtimestamp(cursor[0])
+            if service.db_engine.dialect.name == "sqlite":
+                # SQLite keeps the text func.now() wrote, which has no
+                # fraction for whole seconds; compare text with text.
+                after_time = literal(str(after_time))
+            query = query.filter(or_(
+                StorageSession.update_time < after_time,
+                and_(StorageSession.update_time == after_time,
+                     StorageSession.id > cursor[1]),
+            ))
+        rows = (
+            query.order_by(StorageSession.update_time.desc(), StorageSession.id)
+            .limit(limit)
+            .all()
+        )
+    return [
+        Session(app_name=app_name, user_id=user_id, id=row.id,
+                last_update_time=row.update_time.timestamp())
+        for row in rows
+    ]
+
+
+async def list_session_page(
+    service: BaseSessionService,
+    *,
+    app_name: str,
+    user_id: str,
+    page_size: int,
+    page_token: Optional[str] = None,
+) -> SessionPage:
+    """Lists sessions, most recently updated first, one page at a time.
+
+    The page token is a cursor (last update time and id of the last session
+    returned), so pages stay consistent while sessions are added. SQL
+    backends run it as a keyset query; other backends page in memory.
+    Sessions are `listed`, without events or state, on every backend.
+    """
+    page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+    cursor = _decode_page_token(page_token) if page_token else None
+    backend = service.backend if isinstance(service, CachedSessionService) else service
+    if isinstance(backend, DatabaseSessionService):
+        # One extra row tells whether there is a next page.
+        sessions = await asyncio.to_thread(
+            _list_database_page, backend, app_name, user_id, page_size + 1, cursor)
+    else:
+        response = await service.list_sessions(app_name=app_name, user_id=user_id)
+        sessions = sorted(
+            response.sessions, key=lambda s: (-s.last_update_time, s.id))
+        if cursor is not None:
+            sessions = [
+                s for s in sessions
+                if (-s.last_update_time, s.id) > (-cursor[0], cursor[1])
+            ]
+        sessions = sessions[:page_size + 1]
+    next_page_token = None
+    if len(sessions) > page_size:
+        sessions = sessions[:page_size]
+        next_page_token = _encode_page_token(sessions[-1])
+    return SessionPage(sessions=[listed(session) for session in sessions],
+                       next_page_token=next_page_token)
+
+
+def summarize(session: Session) -> SessionSummary:
+    return SessionSummary(
+        id=session.id,
+        app_name=session.app_name,
+        user_id=session.user_id,
+        last_update_time=session.last_update_time,
+    )
+
+
+def session_config(
+    events_after: Optional[float], limit: Optional[int]
+) -> Optional[GetSessionConfig]:
+    """Builds the config that pushes an event window down to the backend."""
+    if events_after is None and not limit:
+        return None
+    return GetSessionConfig(num_recent_events=limit, after_timestamp=events_after)
+
+
+def window_events(
+    events: list[Event], events_after: Optional[float], limit: Optional[int]
+) -> list[Event]:
+    """Returns the last `limit` events strictly after `events_after`.
+
+    Backends disagree on whether `after_timestamp` is inclusive and on the
+    order they apply the two filters in, so the window is re-applied here.
+    """
+    if events_after is not None:
+        events = [event for event in events if event.timestamp > events_after]
+    if limit:
+        events = events[-limit:]
+    return events
+
+
+def resume_events(
+    events: list[Event], last_event_id: str, new_message: Optional[types.Content]
+) -> Optional[list[Event]]:
+    """Returns the stored events of a run that a client lost after an event.
+
+    The run is the invocation of the event with `last_event_id`. Partial
+    events are not stored, so when that id is not found the run is the last
+    one started by `new_message`, returned whole. None if neither is found:
+    the run never started.
+    """
+    start = next(
+        (i for i, event in enumerate(events) if event.id == last_event_id), None)
+    if start is None and new_message is not None:
+        start = next(
+            (i for i in reversed(range(len(events)))
+             if events[i].author == "user" and events[i].content == new_message),
+            None,
+        )
+    if start is None:
+        return None
+    invocation_id = events[start].invocation_id
+    return [
+        event for event in events[start + 1:]
+        if event.invocation_id == invocation_id
+    ]
+
+
+def _field_name(model: type[BaseModel], name: str) -> str:
+    for field_name, field in model.model_fields.items():
+        if name in (field_name, field.alias):
+            return field_name
+    raise ValueError(f"Unknown field: {name}")
+
+
+def projection(fields: str) -> dict[str, Any]:
+    """Parses "id,lastUpdateTime,events.author" into a pydantic include.
+
+    Names may be given as field names or their camelCase aliases; dotted
+    names select fields of each event.
+    """
+    include: dict[str, Any] = {}
+    event_include: dict[str, Any] = {}
+    for name in filter(None, (name.strip() for name in fields.split(","))):
+        top, _, sub = name.partition(".")
+        top = _field_name(Session, top)
+        if sub:
+            if top != "events":
+                raise ValueError(f"Only events fields can be selected: {name}")
+            event_include[_field_name(Event, sub)] = True
+        else:
+            include[top] = True
+    if event_include and "events" not in include:
+        include["events"] = {"__all__": event_include}
+    return include
@@ -0,0 +1,188 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Server-Sent Events encoding for agent runs"""
+
+import asyncio
+import json
+import logging
+from typing import AsyncGenerator, AsyncIterator, Optional, Union
+
+from google.adk.events.event import Event
+from google.genai import types
+
+logger = logging.getLogger(__name__)
+
+_END_OF_STREAM = object()
+_NON_TEXT_PART_FIELDS = (
+    "inline_data",
+    "file_data",
+    "function_call",
+    "function_response",
+    "executable_code",
+    "code_execution_result",
+)
+
+
+class SseEncoder:
+    """Serializes each event exactly once into an SSE frame.
+
+    Payloads are logged at DEBUG level, and only every `log_every`-th one at
+    INFO level. Logged payloads are cut to `log_max_chars`.
+    """
+
+    def __init__(self, log_every: int = 100, log_max_chars: int = 512):
+        self.log_every = log_every
+        self.log_max_chars = log_max_chars
+        self._count = 0
+
+    def _log(self, payload: str):
+        self._count += 1
+        if logger.isEnabledFor(logging.DEBUG):
+            level = logging.DEBUG
+        elif (self.log_every > 0 and self._count % self.log_every == 1
+                and logger.isEnabledFor(logging.INFO)):
+            level = logging.INFO
+        else:
+            return
+        if len(payload) > self.log_max_chars:
+            payload = (f"{payload[:self.log_max_chars]}... "
+                       f"({len(payload)} chars)")
+        logger.log(level, "Generated event %s in agent run streaming: %s",
+                   self._count, payload)
+
+    def serialize(self, event: Event) -> str:
+        """Returns the event's JSON, logging it as configured."""
+        payload = event.model_dump_json(exclude_none=True, by_alias=True)
+        self._log(payload)
+        return payload
+
+    def encode(self, event: Event) -> str:
+        # The id lets a client that lost the stream say where it stopped
+        # (Last-Event-ID).
+        return f"id: {event.id}\ndata: {self.serialize(event)}\n\n"
+
+    @staticmethod
+    def encode_error(error: Union[Exception, str]) -> str:
+        return f"data: {json.dumps({'error': str(error)})}\n\n"
+
+
+def _text_delta(event: Event) -> Optional[types.Part]:
+    """Returns the only part of a partial, text-only event, if it is one."""
+    if not event.partial or not event.content or not event.content.parts:
+        return None
+    if len(event.content.parts) != 1:
+        return None
+    part = event.content.parts[0]
+    if part.text is None or any(
+        getattr(part, field) is not None for field in _NON_TEXT_PART_FIELDS
+    ):
+        return None
+    return part
+
+
+def _can_merge(first: Event, event: Event) -> bool:
+    return (
+        event.author == first.author
+        and event.invocation_id == first.invocation_id
+        and event.branch == first.branch
+        and event.content.role == first.content.role
+        and bool(event.content.parts[0].thought) == bool(first.content.parts[0].thought)
+    )
+
+
+def _merge(events: list[Event]) -> Event:
+    if len(events) == 1:
+        return events[0]
+    first = events[0]
+    part = first.content.parts[0]
+    text = "".join(event.content.parts[0].text for event in events)
+    return first.model_copy(update={
+        "content": types.Content(
+            role=first.content.role,
+            parts=[types.Part(text=text, thought=part.thought)],
+        ),
+    })
+
+
+async def _pump(events: AsyncIterator[Event], queue: asyncio.Queue):
+    try:
+        async for event in events:
+            await queue.put(event)
+        await queue.put(_END_OF_STREAM)
+    except Exception as e:  # handed to the consumer to re-raise
+        await queue.put(e)
+
+
+async def coalesce_partial_text(
+    events: AsyncIterator[Event],
+    window_seconds: float,
+) -> AsyncGenerator[Event, None]:
+    """Merges consecutive partial text events arriving within a time window.
+
+    A run of partial, text-only events from the same author is held for at
+    most `window_seconds` after its first event and then sent as one event.
+    Every other event flushes the held text first and passes through as is.
+
+    The agent run is driven by a single producer task: ADK keeps tracing
+    context in context variables across the generator's yields, so it must
+    not be resumed from a different task each time.
+    """
+    if window_seconds <= 0:
+        async for event in events:
+            yield event
+        return
+
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=64)
+    producer = asyncio.create_task(_pump(events, queue))
+    held: list[Event] = []
+    deadline = 0.0
+    try:
+        while True:
+            if held:
+                try:
+                    item = await asyncio.wait_for(
+                        queue.get(), max(0.0, deadline - loop.time()))
+                except asyncio.TimeoutError:
+                    yield _merge(held)
+                    held = []
+                    continue
+            else:
+                item = await queue.get()
+
+            if item is _END_OF_STREAM:
+                break
+            if isinstance(item, Exception):
+                # The run failed; send what was held, then surface the error.
+                if held:
+                    yield _merge(held)
+                    held = []
+                raise item
+            if _text_delta(item) is not None:
+                if held and _can_merge(held[0], item):
+                    held.append(item)
+                    continue
+                if held:
+                    yield _merge(held)
+                held = [item]
+                deadline = loop.time() + window_seconds
+                continue
+            if held:
+                yield _merge(held)
+                held = []
+            yield item
+        if held:
+            yield _merge(held)
+    finally:
+        producer.cancel()
@@ -0,0 +1,415 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Multi-process server: N workers behind a session-affinity router.
+
+    python -m src.app.supervisor --workers 8 --port 8080
+
+Each worker is a uvicorn server on a unix socket. The router listens on
+the public port and sends every request for a session to the same worker,
+picked by hashing its session_id, so the worker's session cache, runners
+and live connections stay warm. Requests without a session are spread
+round-robin. Sessions created without an id get one from the router, so
+the create lands on the worker that will serve the session. Trace lookups
+under /debug/trace go to every worker, since each keeps its own spans.
+
+Workers share state through the filesystem: sessions default to a SQLite
+file and artifacts to a directory in the socket dir (see build_session_
+service and build_artifact_service), so any worker can read what another
+wrote. Their session caches are off unless SESSION_CACHE_TTL_SECONDS is
+set, since /run_live_mux may append to a session from another worker.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import re
+import signal
+import tempfile
+from typing import MutableMapping, Optional
+import uuid
+from urllib.parse import parse_qs
+import zlib
+
+import httpx
+import uvicorn
+import websockets
+from websockets.asyncio.client import unix_connect
+
+logger = logging.getLogger(__name__)
+
+_SESSION_PATH_RE = re.compile(r"^/apps/[^/]+/users/[^/]+/sessions/([^/]+)")
+_CREATE_SESSION_PATH_RE = re.compile(r"^/apps/[^/]+/users/[^/]+/sessions/?$")
+# Bodies up to this size are inspected for a session_id.
+_MAX_ROUTED_BODY_BYTES = 1024 * 1024
+_HOP_BY_HOP_HEADERS = {
+    b"connection", b"keep-alive", b"proxy-authenticate", b"proxy-authorization",
+    b"te", b"trailers", b"transfer-encoding", b"upgrade", b"host",
+}
+WORKER_HEADER = b"x-worker"
+# Each worker records its own spans, so lookups are asked of all of them.
+_FAN_OUT_PATH_PREFIX = "/debug/trace"
+
+
+def _run_worker(app: str, factory: bool, socket_path: str, log_level: str):
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)  # left by a worker that died
+    uvicorn.run(app, factory=factory, uds=socket_path, log_level=log_level)
+
+
+class Router:
+    """ASGI app forwarding HTTP and websocket traffic to worker sockets."""
+
+    def __init__(self, socket_paths: list[str]):
+        self.socket_paths = socket_paths
+        self._clients = [
+            httpx.AsyncClient(
+                transport=httpx.AsyncHTTPTransport(uds=path),
+                base_url="http://worker",
+                timeout=httpx.Timeout(None, connect=10.0),
+            )
+            for path in socket_paths
+        ]
+        self._round_robin = itertools.cycle(range(len(socket_paths)))
+
+    def _worker_for(self, session_id: Optional[str]) -> int:
+        if not session_id:
+            return next(self._round_robin)
+        return zlib.crc32(session_id.encode()) % len(self.socket_paths)
+
+    def _pick(self, scope, body: bytes = b"") -> int:
+        headers = dict(scope["headers"])
+        if headers.get(WORKER_HEADER, b"").isdigit():
+            # Lets operators address one worker, e.g. to scrape /metrics.
+            return int(headers[WORKER_HEADER]) % len(self.socket_paths)
+        if match := _SESSION_PATH_RE.match(scope["path"]):
+            return self._worker_for(match.group(1))
+        query = parse_qs(scope.get("query_string", b"").decode())
+        if "session_id" in query:
+            return self._worker_for(query["session_id"][0])
+        if body and len(body) <= _MAX_ROUTED_BODY_BYTES and body[:1] == b"{":
+            try:
+                session_id = json.loads(body).get("session_id")
+            except ValueError:
+                session_id = None
+            if isinstance(session_id, str):
+                return self._worker_for(session_id)
+        if "user_id" in query:
+            # Multiplexed live sockets carry many sessions; keep a user's
+            # connections together at least.
+            return self._worker_for(query["user_id"][0])
+        return self._worker_for(None)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            await self._proxy_http(scope, receive, send)
+        elif scope["type"] == "websocket":
+            await self._proxy_websocket(scope, receive, send)
+        elif scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                for client in self._clients:
+                    await client.aclose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _proxy_http(self, scope, receive, send):
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        body = b"".join(chunks)
+        path = scope["path"]
+        if scope["method"] == "POST" and _CREATE_SESSION_PATH_RE.match(path):
+            # Name the session here so it is created where it will be served.
+            path = path.rstrip("/") + "/" + str(uuid.uuid4())
+        headers = [
+            (name, value) for name, value in scope["headers"]
+            if name not in _HOP_BY_HOP_HEADERS
+        ]
+        if scope.get("client"):
+            headers.append((b"x-forwarded-for", scope["client"][0].encode()))
+        if (path.startswith(_FAN_OUT_PATH_PREFIX)
+                and WORKER_HEADER not in dict(scope["headers"])):
+            await self._fan_out(scope, path, headers, body, send)
+            return
+        worker = self._pick(dict(scope, path=path), body)
+        client = self._clients[worker]
+        request = client.build_request(
+            scope["method"],
+            httpx.URL(path=path, query=scope.get("query_string", b"")),
+            headers=headers,
+            content=body,
+        )
+        try:
+            response = await client.send(request, stream=True)
+        except httpx.TransportError as e:
+            logger.error("Worker %s unavailable: %s", worker, e)
+            await send({"type": "http.response.start", "status": 502, "headers": []})
+            await send({"type": "http.response.body", "body": b"Worker unavailable"})
+            return
+
+        async def stream_response():
+            await send({
+                "type": "http.response.start",
+                "status": response.status_code,
+                "headers": [
+                    (name, value) for name, value in response.headers.raw
+                    if name.lower() not in _HOP_BY_HOP_HEADERS
+                ] + [(b"x-served-by", str(worker).encode())],
+            })
+            # Raw bytes: compressed streams pass through as they are.
+            async for chunk in response.aiter_raw():
+                await send({"type": "http.response.body", "body": chunk,
+                            "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+
+        async def wait_for_disconnect():
+            while (await receive())["type"] != "http.disconnect":
+                pass
+
+        streaming = asyncio.create_task(stream_response())
+        disconnected = asyncio.create_task(wait_for_disconnect())
+        try:
+            # A client that goes away cancels the upstream request, which
+            # in turn stops the worker's agent run.
+            await asyncio.wait(
+                [streaming, disconnected], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            streaming.cancel()
+            disconnected.cancel()
+            await response.aclose()
+        if streaming.done() and not streaming.cancelled() and streaming.exception():
+            raise streaming.exception()
+
+    async def _fan_out(self, scope, path: str, headers, body: bytes, send):
+        """Sends a request to every worker; answers with the first non-404."""
+
+        async def ask(worker: int) -> Optional[tuple[httpx.Response, bytes]]:
+            client = self._clients[worker]
+            request = client.build_request(
+                scope["method"],
+                httpx.URL(path=path, query=scope.get("query_string", b"")),
+                headers=headers,
+                content=body,
+            )
+            try:
+                response = await client.send(request, stream=True)
+                try:
+                    # Raw bytes, so they match the worker's headers.
+                    content = b"".join([chunk async for chunk in response.aiter_raw()])
+                finally:
+                    await response.aclose()
+            except httpx.TransportError as e:
+                logger.error("Worker %s unavailable: %s", worker, e)
+                return None
+            return response, content
+
+        answers = await asyncio.gather(
+            *(ask(worker) for worker in range(len(self._clients))))
+        answered = [
+            (worker, answer) for worker, answer in enumerate(answers)
+            if answer is not None
+        ]
+        if not answered:
+            await send({"type": "http.response.start", "status": 502, "headers": []})
+            await send({"type": "http.response.body", "body": b"Worker unavailable"})
+            return
+        worker, (response, content) = next(
+            ((worker, answer) for worker, answer in answered
+             if answer[0].status_code != 404),
+            answered[0],
+        )
+        await send({
+            "type": "http.response.start",
+            "status": response.status_code,
+            "headers": [
+                (name, value) for name, value in response.headers.raw
+                if name.lower() not in _HOP_BY_HOP_HEADERS
+            ] + [(b"x-served-by", str(worker).encode())],
+        })
+        await send({"type": "http.response.body", "body": content})
+
+    async def _proxy_websocket(self, scope, receive, send):
+        if (await receive())["type"] != "websocket.connect":
+            return
+        worker = self._pick(scope)
+        query = scope.get("query_string", b"").decode()
+        uri = "ws://worker" + scope["path"] + (f"?{query}" if query else "")
+        try:
+            upstream = await unix_connect(self.socket_paths[worker], uri)
+        except (OSError, websockets.WebSocketException) as e:
+            logger.error("Worker %s websocket failed: %s", worker, e)
+            await send({"type": "websocket.close", "code": 1011})
+            return
+        await send({"type": "websocket.accept"})
+
+        async def client_to_worker():
+            while True:
+                message = await receive()
+                if message["type"] == "websocket.disconnect":
+                    return
+                data = message.get("text")
+                await upstream.send(data if data is not None else message.get("bytes"))
+
+        async def worker_to_client():
+            try:
+                async for data in upstream:
+                    key = "text" if isinstance(data, str) else "bytes"
+                    await send({"type": "websocket.send", key: data})
+            except websockets.ConnectionClosed:
+                pass
+            close = upstream.close_code or 1000
+            await send({"type": "websocket.close", "code": close,
+                        "reason": upstream.close_reason or ""})
+
+        tasks = [
+            asyncio.create_task(client_to_worker()),
+            asyncio.create_task(worker_to_client()),
+        ]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await upstream.close()
+
+
+class _RouterServer(uvicorn.Server):
+
+    @contextlib.contextmanager
+    def capture_signals(self):
+        # uvicorn re-raises the signal once serving stops, which would kill
+        # the supervisor before it stops its workers.
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, self.handle_exit)
+        yield
+
+
+def _start_worker(index: int, args, socket_path: str) -> multiprocessing.Process:
+    process = multiprocessing.get_context("spawn").Process(
+        target=_run_worker,
+        args=(args.app, args.factory, socket_path, args.log_level),
+        name=f"agent-worker-{index}",
+        daemon=True,
+    )
+    process.start()
+    return process
+
+
+async def _supervise(args, socket_paths: list[str]):
+    processes = [
+        _start_worker(index, args, path) for index, path in enumerate(socket_paths)
+    ]
+    router = _RouterServer(uvicorn.Config(
+        Router(socket_paths), host=args.host, port=args.port,
+        log_level=args.log_level))
+
+    async def restart_dead_workers():
+        while True:
+            await asyncio.sleep(1.0)
+            for index, process in enumerate(processes):
+                if not process.is_alive():
+                    logger.warning("Worker %s exited with %s; restarting",
+                                   index, process.exitcode)
+                    processes[index] = _start_worker(index, args, socket_paths[index])
+
+    monitor = asyncio.create_task(restart_dead_workers())
+    try:
+        # Open the public port once the workers listen.
+        deadline = asyncio.get_running_loop().time() + args.startup_timeout
+        while not all(os.path.exists(path) for path in socket_paths):
+            if asyncio.get_running_loop().time() > deadline:
+                logger.warning("Workers not ready after %ss", args.startup_timeout)
+                break
+            await asyncio.sleep(0.2)
+        await router.serve()
+    finally:
+        monitor.cancel()
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join(timeout=10)
+
+
+def set_shared_defaults(environ: MutableMapping[str, str], socket_dir: str):
+    """Points workers at storage they can share, unless already configured.
+
+    Workers inherit these; per-process defaults would not be shared. Sessions
+    default to SQLite only without AGENT_ENGINE_ID, which selects Agent
+    Engine sessions in the workers.
+    """
+    if "SESSION_SERVICE_URI" not in environ and "AGENT_ENGINE_ID" not in environ:
+        environ["SESSION_SERVICE_URI"] = (
+            f"sqlite:///{os.path.join(socket_dir, 'sessions.db')}")
+    environ.setdefault(
+        "ARTIFACT_SERVICE_URI", f"file://{os.path.join(socket_dir, 'artifacts')}")
+    # Multiplexed live sockets are routed by user, so another worker may
+    # append to a session; a cached copy would then fail the next run as
+    # stale.
+    environ.setdefault("SESSION_CACHE_TTL_SECONDS", "0")
+    if environ.get("SESSION_SERVICE_URI", "").startswith("memory://"):
+        logger.warning("memory:// sessions are not shared between workers")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--app", default="src.app.fast_api_app:app_from_env",
+                        help="Worker ASGI app as module:attribute.")
+    parser.add_argument("--factory", action=argparse.BooleanOptionalAction,
+                        default=True, help="The app attribute is a factory.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", "8080")))
+    parser.add_argument("--socket-dir", default=None,
+                        help="Directory for worker sockets and shared state.")
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--startup-timeout", type=float, default=60.0,
+                        help="Seconds to wait for workers before serving.")
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level.upper())
+
+    socket_dir = args.socket_dir or tempfile.mkdtemp(prefix="agent-workers-")
+    os.makedirs(socket_dir, exist_ok=True)
+    set_shared_defaults(os.environ, socket_dir)
+    socket_paths = [
+        os.path.join(socket_dir, f"worker-{index}.sock")
+        for index in range(args.workers)
+    ]
+    for path in socket_paths:
+        if os.path.exists(path):
+            os.unlink(path)  # left over from an earlier run
+    logger.info("Starting %s workers in %s", args.workers, socket_dir)
+    try:
+        asyncio.run(_supervise(args, socket_paths))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
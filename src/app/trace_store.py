@@ -0,0 +1,186 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Bounded in-memory span store for the debug trace endpoints"""
+
+from collections import OrderedDict
+import threading
+import time
+import typing
+from typing import Any, Optional
+
+from opentelemetry.sdk.trace import export
+from opentelemetry.sdk.trace import ReadableSpan
+
+EVENT_ID_ATTRIBUTE = "gcp.vertex.agent.event_id"
+
+
+def format_trace_id(trace_id: int) -> str:
+    return format(trace_id, "032x")
+
+
+def _is_stored_span(name: str) -> bool:
+    return (
+        name == "invocation"
+        or name == "call_llm"
+        or name == "send_data"
+        or name.startswith("tool_response")
+        or name.startswith("execute_tool")
+    )
+
+
+def _estimate_size(attributes: dict[str, Any]) -> int:
+    # LLM request/response payloads dominate, and they are strings.
+    return sum(len(key) + len(str(value)) for key, value in attributes.items())
+
+
+class SpanStore:
+    """Ring buffer of span records indexed by event id and trace id.
+
+    Records are evicted oldest first once they are older than
+    `max_age_seconds` or the total estimated size exceeds `max_bytes`.
+    Writes come from the span processor's export thread and reads from
+    request handlers, so all access goes through a lock.
+    """
+
+    def __init__(self,
+                 max_bytes: int = 64 * 1024 * 1024,
+                 max_age_seconds: float = 3600.0):
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self._lock = threading.Lock()
+        self._records: OrderedDict[tuple[int, int], dict[str, Any]] = OrderedDict()
+        self._by_event_id: dict[str, tuple[int, int]] = {}
+        self._by_trace_id: dict[int, list[tuple[int, int]]] = {}
+        self._size_bytes = 0
+
+    def add(self, span: ReadableSpan):
+        context = span.get_span_context()
+        attributes = dict(span.attributes or {})
+        attributes["trace_id"] = context.trace_id
+        attributes["span_id"] = context.span_id
+        start_time = span.start_time or 0
+        end_time = span.end_time or start_time
+        record = {
+            "name": span.name,
+            "trace_id": context.trace_id,
+            "span_id": context.span_id,
+            "parent_span_id": span.parent.span_id if span.parent else None,
+            "start_time": start_time,
+            "end_time": end_time,
+            "duration_ms": (end_time - start_time) / 1e6,
+            "attributes": attributes,
+            "stored_at": time.monotonic(),
+            "size_bytes": _estimate_size(attributes),
+        }
+        key = (context.trace_id, context.span_id)
+        with self._lock:
+            if key in self._records:
+                self._remove(key)
+            self._records[key] = record
+            self._size_bytes += record["size_bytes"]
+            self._by_trace_id.setdefault(context.trace_id, []).append(key)
+            if event_id := attributes.get(EVENT_ID_ATTRIBUTE):
+                self._by_event_id[str(event_id)] = key
+            self._evict()
+
+    def _remove(self, key: tuple[int, int]):
+        record = self._records.pop(key)
+        self._size_bytes -= record["size_bytes"]
+        trace_keys = self._by_trace_id.get(key[0])
+        if trace_keys is not None:
+            trace_keys.remove(key)
+            if not trace_keys:
+                del self._by_trace_id[key[0]]
+        event_id = record["attributes"].get(EVENT_ID_ATTRIBUTE)
+        if event_id is not None and self._by_event_id.get(str(event_id)) == key:
+            del self._by_event_id[str(event_id)]
+
+    def _evict(self):
+        oldest_allowed = time.monotonic() - self.max_age_seconds
+        while self._records:
+            key, record = next(iter(self._records.items()))
+            if (self._size_bytes <= self.max_bytes
+                    and record["stored_at"] >= oldest_allowed):
+                break
+            self._remove(key)
+
+    def get_event_attributes(self, event_id: str) -> Optional[dict[str, Any]]:
+        """Returns the span attributes recorded for an event."""
+        with self._lock:
+            self._evict()
+            key = self._by_event_id.get(event_id)
+            return dict(self._records[key]["attributes"]) if key else None
+
+    def get_trace(self, trace_id: int) -> list[dict[str, Any]]:
+        """Returns all stored spans of a trace, ordered by start time."""
+        with self._lock:
+            self._evict()
+            spans = [self._records[key] for key in self._by_trace_id.get(trace_id, [])]
+        return sorted(
+            (_public_record(span) for span in spans),
+            key=lambda span: span["start_time"],
+        )
+
+    def slowest_traces(self, limit: int = 10) -> list[dict[str, Any]]:
+        """Summarizes the slowest stored traces, slowest first."""
+        with self._lock:
+            self._evict()
+            summaries = []
+            for trace_id, keys in self._by_trace_id.items():
+                spans = [self._records[key] for key in keys]
+                start_time = min(span["start_time"] for span in spans)
+                end_time = max(span["end_time"] for span in spans)
+                summaries.append({
+                    "trace_id": format_trace_id(trace_id),
+                    "start_time": start_time,
+                    "duration_ms": (end_time - start_time) / 1e6,
+                    "span_count": len(spans),
+                    "llm_calls": sum(span["name"] == "call_llm" for span in spans),
+                })
+        summaries.sort(key=lambda summary: summary["duration_ms"], reverse=True)
+        return summaries[:limit]
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "spans": len(self._records),
+                "traces": len(self._by_trace_id),
+                "size_bytes": self._size_bytes,
+                "max_bytes": self.max_bytes,
+                "max_age_seconds": self.max_age_seconds,
+            }
+
+
+def _public_record(record: dict[str, Any]) -> dict[str, Any]:
+    public = {k: v for k, v in record.items() if k not in ("stored_at", "size_bytes")}
+    public["trace_id"] = format_trace_id(record["trace_id"])
+    return public
+
+
+class ApiServerSpanExporter(export.SpanExporter):
+    """Writes agent spans (invocations, LLM and tool calls) to a SpanStore."""
+
+    def __init__(self, span_store: SpanStore):
+        self.span_store = span_store
+
+    def export(
+        self, spans: typing.Sequence[ReadableSpan]
+    ) -> export.SpanExportResult:
+        for span in spans:
+            if _is_stored_span(span.name):
+                self.span_store.add(span)
+        return export.SpanExportResult.SUCCESS
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return True
@@ -1,12 +1,110 @@
+import asyncio
+import logging
 import os
+import time
+from typing import Any, Callable, Optional
+
 from vertexai import agent_engines
 
 GOOGLE_CLOUD_PROJECT = os.environ["GOOGLE_CLOUD_PROJECT"]
 GOOGLE_CLOUD_LOCATION = os.environ["GOOGLE_CLOUD_LOCATION"]
 
+logger = logging.getLogger(__name__)
+
 def get_reasoning_engine_resource_path(reasoning_engine_id: str) -> str:
     return f"projects/{GOOGLE_CLOUD_PROJECT}/locations/{GOOGLE_CLOUD_LOCATION}/reasoningEngines/{reasoning_engine_id}"
 
 def get_remote_agent(reasoning_engine_id: str):
     resource_path = get_reasoning_engine_resource_path(reasoning_engine_id)
-    return agent_engines.get(resource_path)
\ No newline at end of file
+    return agent_engines.get(resource_path)
+
+
+class RemoteAgentRegistry:
+    """Caches remote agent handles per reasoning engine id.
+
+    A handle is served from memory for `ttl_seconds`. Hits on a handle
+    older than `refresh_after_seconds` refresh it in the background, so
+    engines in regular use never wait on a lookup. Concurrent misses for
+    the same id share one lookup, run in a worker thread because
+    `agent_engines.get` blocks.
+    """
+
+    def __init__(self,
+                 ttl_seconds: float = 600.0,
+                 refresh_after_seconds: float = 300.0,
+                 loader: Callable[[str], Any] = get_remote_agent):
+        self.ttl_seconds = ttl_seconds
+        self.refresh_after_seconds = refresh_after_seconds
+        self._loader = loader
+        self._entries: dict[str, tuple[float, Any]] = {}
+        self._loading: dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.refreshes = 0
+        self.refresh_failures = 0
+
+    def stats(self) -> dict[str, Any]:
+        """Returns registry counters and the current hit ratio."""
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "size": len(self._entries),
+            "ttl_seconds": self.ttl_seconds,
+            "refresh_after_seconds": self.refresh_after_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "refreshes": self.refreshes,
+            "refresh_failures": self.refresh_failures,
+            "hit_ratio": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+        }
+
+    def invalidate(self, reasoning_engine_id: str):
+        self._entries.pop(reasoning_engine_id, None)
+
+    async def _load(self, reasoning_engine_id: str, stale: Optional[Any]) -> Any:
+        try:
+            handle = await asyncio.to_thread(self._loader, reasoning_engine_id)
+        except Exception:
+            if stale is None:
+                raise
+            # A failed refresh keeps serving the handle until it expires.
+            self.refresh_failures += 1
+            logger.exception("Refreshing remote agent %s failed", reasoning_engine_id)
+            return stale
+        else:
+            self._entries[reasoning_engine_id] = (time.monotonic(), handle)
+            return handle
+        finally:
+            self._loading.pop(reasoning_engine_id, None)
+
+    def _start_load(self, reasoning_engine_id: str, stale: Optional[Any] = None) -> asyncio.Task:
+        task = asyncio.create_task(self._load(reasoning_engine_id, stale))
+        self._loading[reasoning_engine_id] = task
+        return task
+
+    async def get(self, reasoning_engine_id: str) -> Any:
+        entry = self._entries.get(reasoning_engine_id)
+        if entry is not None:
+            loaded_at, handle = entry
+            age = time.monotonic() - loaded_at
+            if age < self.ttl_seconds:
+                self.hits += 1
+                if (age >= self.refresh_after_seconds
+                        and reasoning_engine_id not in self._loading):
+                    self.refreshes += 1
+                    self._start_load(reasoning_engine_id, stale=handle)
+                return handle
+            del self._entries[reasoning_engine_id]
+        task = self._loading.get(reasoning_engine_id)
+        if task is None:
+            self.misses += 1
+            task = self._start_load(reasoning_engine_id)
+        else:
+            self.coalesced += 1
+        # Shield the shared lookup so one cancelled caller does not cancel
+        # it for everyone else waiting on the same engine.
+        return await asyncio.shield(task)
+
+
+remote_agents = RemoteAgentRegistry()
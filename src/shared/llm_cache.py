@@ -0,0 +1,403 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Disk cache of model responses for deterministic model calls"""
+
+import asyncio
+from collections import defaultdict
+from contextvars import ContextVar
+from enum import Enum
+from functools import cache
+import hashlib
+import inspect
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Optional, Union
+
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models import LlmRequest, LlmResponse
+from google.genai import Client as GenaiClient
+from google.genai.chats import Chats
+from google.genai.types import (
+    FinishReason,
+    GenerateContentConfig,
+    GenerateContentResponse,
+)
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), "llm_cache")
+# Bumped when the key or the stored format changes.
+_KEY_VERSION = 1
+# Config fields that do not change what the model answers.
+_IGNORED_CONFIG_FIELDS = {"http_options", "labels"}
+
+# (model, key) of the request a before_model_callback missed, for the
+# after_model_callback of the same model call to store its response.
+_pending: ContextVar[Optional[tuple[str, str]]] = ContextVar(
+    "llm_cache_pending", default=None)
+
+ModelCallback = Callable[..., Any]
+
+
+def _canonical(value: Any) -> Any:
+    """json.dumps default: a stable form for pydantic values and bytes."""
+    if isinstance(value, BaseModel):
+        return value.model_dump(exclude_none=True)
+    if isinstance(value, type) and issubclass(value, BaseModel):
+        return value.model_json_schema()
+    if isinstance(value, (bytes, bytearray)):
+        # Images and other blobs: their digest identifies them.
+        return {"sha256": hashlib.sha256(value).hexdigest()}
+    if isinstance(value, Enum):
+        return value.value
+    return repr(value)
+
+
+def _strip_call_ids(value: Any) -> Any:
+    """Drops function call ids, which are new on every run."""
+    if isinstance(value, dict):
+        stripped = {}
+        for key, item in value.items():
+            if key in ("function_call", "function_response") and isinstance(item, dict):
+                item = {k: v for k, v in item.items() if k != "id"}
+            stripped[key] = _strip_call_ids(item)
+        return stripped
+    if isinstance(value, list):
+        return [_strip_call_ids(item) for item in value]
+    return value
+
+
+def _dump(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.model_dump(exclude_none=True)
+    if isinstance(value, (list, tuple)):
+        return [_dump(item) for item in value]
+    return value
+
+
+def request_key(model: str, contents: Any,
+                config: Optional[GenerateContentConfig]) -> str:
+    """sha256 of the model, system instruction, contents and config."""
+    config_dict = (
+        config.model_dump(exclude_none=True, exclude=_IGNORED_CONFIG_FIELDS)
+        if config else {}
+    )
+    system_instruction = config_dict.pop("system_instruction", None)
+    canonical = json.dumps(
+        _strip_call_ids({
+            "version": _KEY_VERSION,
+            "model": model,
+            "system_instruction": _dump(system_instruction),
+            "contents": _dump(contents),
+            "config": config_dict,
+        }),
+        sort_keys=True,
+        separators=(",", ":"),
+        default=_canonical,
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class _DiskStore:
+    """JSON entries in `root/ab/abcdef....json`, each with an expiry time."""
+
+    def __init__(self, root: str, ttl_seconds: float):
+        self.root = root
+        self.ttl_seconds = ttl_seconds
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> Optional[dict]:
+        path = self._path(key)
+        try:
+            with open(path) as entry_file:
+                entry = json.load(entry_file)
+        except (OSError, ValueError):
+            return None
+        if entry["expires"] < time.time():
+            self._unlink(path)
+            return None
+        return entry["value"]
+
+    def put(self, key: str, value: dict):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        entry = {"expires": time.time() + self.ttl_seconds, "value": value}
+        # Write then rename, so readers never see half an entry.
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as entry_file:
+                json.dump(entry, entry_file)
+            os.replace(temp_path, path)
+        except BaseException:
+            self._unlink(temp_path)
+            raise
+
+    def purge_expired(self) -> int:
+        """Deletes expired entries; returns how many."""
+        removed = 0
+        now = time.time()
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                path = os.path.join(directory, name)
+                try:
+                    # Entries are written once, so mtime + ttl is their expiry.
+                    if os.path.getmtime(path) + self.ttl_seconds < now:
+                        os.unlink(path)
+                        removed += 1
+                except OSError:
+                    pass
+        return removed
+
+    @staticmethod
+    def _unlink(path: str):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+class LlmCache:
+    """Caches responses of model calls that are meant to be deterministic.
+
+    A call is cached only when its temperature is at most
+    `max_temperature`; the key covers the model, system instruction,
+    contents and generation config (see request_key). Entries live on disk
+    for `ttl_seconds`, so processes sharing `cache_dir` share them.
+
+    Plugs into ADK agents through model callbacks (model_callbacks) and
+    into direct google.genai calls through wrap_client.
+    """
+
+    def __init__(self,
+                 cache_dir: Optional[str] = None,
+                 ttl_seconds: float = 24 * 3600.0,
+                 max_temperature: float = 0.1,
+                 purge_interval_seconds: float = 3600.0):
+        self.cache_dir = cache_dir or DEFAULT_CACHE_DIR
+        self.max_temperature = max_temperature
+        self.purge_interval_seconds = purge_interval_seconds
+        self._store = _DiskStore(self.cache_dir, ttl_seconds)
+        self._last_purge = 0.0
+        self._lock = threading.Lock()
+        self._counts: defaultdict[str, defaultdict[str, int]] = defaultdict(
+            lambda: defaultdict(int))
+
+    def _count(self, model: str, outcome: str):
+        with self._lock:
+            self._counts[model][outcome] += 1
+
+    def cacheable(self, config: Optional[GenerateContentConfig]) -> bool:
+        return (config is not None
+                and config.temperature is not None
+                and config.temperature <= self.max_temperature)
+
+    def lookup(self, model: str, contents: Any,
+               config: Optional[GenerateContentConfig]) -> tuple[Optional[str], Optional[dict]]:
+        """Returns (key, stored value); key is None for uncacheable calls."""
+        if not self.cacheable(config):
+            self._count(model, "uncacheable")
+            return None, None
+        key = request_key(model, contents, config)
+        value = self._store.get(key)
+        self._count(model, "hits" if value is not None else "misses")
+        return key, value
+
+    def store(self, model: str, key: str, value: dict):
+        self._store.put(key, value)
+        self._count(model, "stores")
+        if time.time() - self._last_purge > self.purge_interval_seconds:
+            self._last_purge = time.time()
+            removed = self._store.purge_expired()
+            if removed:
+                logger.info("Purged %s expired LLM cache entries", removed)
+
+    def stats(self) -> dict[str, Any]:
+        """Hits, misses and hit rate, in total and per model."""
+        with self._lock:
+            by_model = {model: dict(counts) for model, counts in self._counts.items()}
+        total: defaultdict[str, int] = defaultdict(int)
+        for counts in by_model.values():
+            for outcome, count in counts.items():
+                total[outcome] += count
+        for counts in [total, *by_model.values()]:
+            lookups = counts.get("hits", 0) + counts.get("misses", 0)
+            counts["hit_rate"] = counts.get("hits", 0) / lookups if lookups else 0.0
+        return {**total, "by_model": by_model}
+
+    # ADK model callbacks.
+
+    async def before_model_callback(self, callback_context: CallbackContext,
+                                    llm_request: LlmRequest) -> Optional[LlmResponse]:
+        """Answers from the cache, or remembers the key for the response."""
+        model = llm_request.model or ""
+        key, value = await asyncio.to_thread(
+            self.lookup, model, llm_request.contents, llm_request.config)
+        _pending.set((model, key) if key is not None and value is None else None)
+        if value is None:
+            return None
+        response = LlmResponse.model_validate(value)
+        response.custom_metadata = {**(response.custom_metadata or {}),
+                                    "llm_cache": "hit"}
+        return response
+
+    async def after_model_callback(self, callback_context: CallbackContext,
+                                   llm_response: LlmResponse) -> Optional[LlmResponse]:
+        """Stores the response of a call the before callback missed."""
+        pending = _pending.get()
+        if pending is None or llm_response.partial:
+            return None
+        _pending.set(None)
+        if (llm_response.error_code or llm_response.interrupted
+                or not llm_response.content or not llm_response.content.parts):
+            return None
+        value = _strip_call_ids(llm_response.model_dump(
+            mode="json", exclude_none=True))
+        await asyncio.to_thread(self.store, *pending, value)
+        return None
+
+    def model_callbacks(
+        self,
+        before_model_callback: Optional[ModelCallback] = None,
+        after_model_callback: Optional[ModelCallback] = None,
+    ) -> dict[str, list[ModelCallback]]:
+        """Agent keyword arguments that add the cache to an agent's callbacks.
+
+        `before_model_callback` runs first, so what it adds to the request
+        is part of the key. ADK skips after-model callbacks when a before
+        callback answers, so on a hit `after_model_callback` is called here
+        with the cached response, keeping its side effects.
+
+            LlmAgent(..., **llm_cache.model_callbacks(
+                after_model_callback=save_analysis))
+        """
+
+        async def before(callback_context: CallbackContext,
+                         llm_request: LlmRequest) -> Optional[LlmResponse]:
+            if before_model_callback:
+                response = before_model_callback(
+                    callback_context=callback_context, llm_request=llm_request)
+                if inspect.isawaitable(response):
+                    response = await response
+                if response:
+                    return response
+            response = await self.before_model_callback(callback_context, llm_request)
+            if response and after_model_callback:
+                replaced = after_model_callback(
+                    callback_context=callback_context, llm_response=response)
+                if inspect.isawaitable(replaced):
+                    replaced = await replaced
+                response = replaced or response
+            return response
+
+        after_callbacks: list[ModelCallback] = [self.after_model_callback]
+        if after_model_callback:
+            after_callbacks.append(after_model_callback)
+        return {
+            "before_model_callback": [before],
+            "after_model_callback": after_callbacks,
+        }
+
+    # Direct google.genai calls.
+
+    def wrap_client(self, client: GenaiClient) -> "CachedGenaiClient":
+        return CachedGenaiClient(client, self)
+
+
+def _response_schema(config: Optional[GenerateContentConfig]) -> Any:
+    return config.response_schema if config else None
+
+
+def _parse(response: GenerateContentResponse, schema: Any):
+    """Restores `parsed`, which is not stored, from the response text."""
+    if schema is None or not response.text:
+        return
+    try:
+        if isinstance(schema, type) and issubclass(schema, BaseModel):
+            response.parsed = schema.model_validate_json(response.text)
+        else:
+            response.parsed = json.loads(response.text)
+    except ValueError:
+        pass
+
+
+class _CachedModels:
+    """client.models with a cached generate_content."""
+
+    def __init__(self, models, cache: LlmCache):
+        self._models = models
+        self._cache = cache
+
+    def generate_content(
+        self,
+        *,
+        model: str,
+        contents: Any,
+        config: Optional[Union[GenerateContentConfig, dict]] = None,
+    ) -> GenerateContentResponse:
+        if isinstance(config, dict):
+            config = GenerateContentConfig.model_validate(config)
+        key, value = self._cache.lookup(model, contents, config)
+        if value is not None:
+            response = GenerateContentResponse.model_validate(value)
+            _parse(response, _response_schema(config))
+            return response
+        response = self._models.generate_content(
+            model=model, contents=contents, config=config)
+        candidate = response.candidates[0] if response.candidates else None
+        if (key is not None and candidate is not None and candidate.content
+                and candidate.finish_reason in (None, FinishReason.STOP)
+                # Callers retry unparsable answers; do not pin one.
+                and (_response_schema(config) is None or response.parsed is not None)):
+            self._cache.store(model, key, response.model_dump(
+                mode="json", exclude_none=True, exclude={"parsed"}))
+        return response
+
+    def __getattr__(self, name: str):
+        return getattr(self._models, name)
+
+
+class CachedGenaiClient:
+    """A google.genai Client whose generate_content calls are cached.
+
+    Covers client.models.generate_content and chats created from this
+    client; everything else goes to the wrapped client unchanged.
+    """
+
+    def __init__(self, client: GenaiClient, cache: LlmCache):
+        self._client = client
+        self.models = _CachedModels(client.models, cache)
+
+    @property
+    def chats(self) -> Chats:
+        return Chats(modules=self.models)  # type: ignore[arg-type]
+
+    def __getattr__(self, name: str):
+        return getattr(self._client, name)
+
+
+@cache
+def default_llm_cache() -> LlmCache:
+    """The process-wide cache, configured by LLM_CACHE_* variables."""
+    return LlmCache(
+        cache_dir=os.environ.get("LLM_CACHE_DIR") or None,
+        ttl_seconds=float(os.environ.get("LLM_CACHE_TTL_SECONDS", str(24 * 3600))),
+        max_temperature=float(os.environ.get("LLM_CACHE_MAX_TEMPERATURE", "0.1")),
+    )
@@ -0,0 +1,484 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Vector-indexed memory service"""
+
+import asyncio
+from collections import OrderedDict
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+from typing import Awaitable, Callable, Optional
+from urllib.parse import quote
+import zlib
+
+from google.adk.memory import BaseMemoryService
+from google.adk.memory.base_memory_service import SearchMemoryResponse
+from google.adk.memory.memory_entry import MemoryEntry
+from google.adk.sessions import Session
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Embeds a batch of texts into an (n, dim) float array.
+EmbedFn = Callable[[list[str]], Awaitable[np.ndarray]]
+
+_WORD_RE = re.compile(r"[A-Za-z0-9]+")
+
+
+def hashing_embed_fn(dim: int = 512) -> EmbedFn:
+    """Returns an embed_fn that hashes words into `dim` signed buckets.
+
+    Needs no model and is stable across processes (crc32, not hash()), so
+    snapshots stay valid. It matches shared words, not meaning; use
+    genai_embed_fn for semantic search.
+    """
+
+    async def embed(texts: list[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in _WORD_RE.findall(text.lower()):
+                h = zlib.crc32(word.encode())
+                vectors[row, h % dim] += 1.0 if h & 0x80000000 else -1.0
+        return vectors
+
+    return embed
+
+
+def genai_embed_fn(model: str = "text-embedding-004",
+                   batch_size: int = 100) -> EmbedFn:
+    """Returns an embed_fn backed by a Gemini embedding model."""
+    from google import genai
+
+    client = genai.Client()
+
+    async def embed(texts: list[str]) -> np.ndarray:
+        vectors = []
+        for start in range(0, len(texts), batch_size):
+            response = await client.aio.models.embed_content(
+                model=model, contents=texts[start:start + batch_size])
+            vectors.extend(embedding.values for embedding in response.embeddings)
+        return np.asarray(vectors, dtype=np.float32)
+
+    return embed
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _event_text(event) -> str:
+    return " ".join(part.text for part in event.content.parts if part.text)
+
+
+def _kmeans(vectors: np.ndarray, k: int, iterations: int = 6,
+            sample_size: int = 16384) -> np.ndarray:
+    """Spherical k-means over a sample; returns (k, dim) unit centroids."""
+    rng = np.random.default_rng(0)
+    if len(vectors) > sample_size:
+        vectors = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+    centroids = vectors[rng.choice(len(vectors), k, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        empty = ~sums.any(axis=1)
+        sums[empty] = centroids[empty]
+        centroids = _normalize(sums)
+    return centroids
+
+
+def _plan_ivf(vectors: np.ndarray, rows: np.ndarray
+              ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Clusters `rows` of `vectors`; returns (centroids, order, bounds).
+
+    `rows[order]` lists the rows cluster by cluster, and cluster c spans
+    positions bounds[c]:bounds[c + 1]. Pure, so it can run in a thread.
+    """
+    vectors = vectors[rows]
+    clusters = max(1, int(np.sqrt(len(rows))))
+    centroids = _kmeans(vectors, clusters)
+    assignment = np.argmax(vectors @ centroids.T, axis=1)
+    order = np.argsort(assignment, kind="stable")
+    bounds = np.searchsorted(assignment[order], np.arange(clusters + 1))
+    return centroids, order, bounds
+
+
+class _Ivf:
+    """Inverted file over rows [0, size) sorted by cluster."""
+
+    def __init__(self, centroids: np.ndarray, bounds: np.ndarray, size: int):
+        self.centroids = centroids
+        self.bounds = bounds
+        self.size = size
+
+
+class _UserMemory:
+    """Memories of one app and user, as rows of a contiguous unit-vector matrix.
+
+    Rows are only ever appended; removed rows are tombstoned and dropped
+    when the matrix is compacted. Above the IVF threshold, compaction also
+    sorts the rows by k-means cluster so a search scans only the `nprobe`
+    closest clusters plus the rows appended since.
+    """
+
+    def __init__(self, dim: int, capacity: int = 1024):
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.added_at = np.zeros(capacity, dtype=np.float64)
+        self.keys: list[Optional[tuple[str, str]]] = []
+        self.entries: list[Optional[MemoryEntry]] = []
+        self.row_of: dict[tuple[str, str], int] = {}
+        self.session_keys: dict[str, set[tuple[str, str]]] = {}
+        self.size = 0
+        self.live = 0
+        self.ivf: Optional[_Ivf] = None
+        self.compacting = False
+        self.last_used = time.monotonic()
+
+    @property
+    def dim(self) -> int:
+        return self.vectors.shape[1]
+
+    def _grow(self, needed: int):
+        capacity = len(self.vectors)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        for name in ("vectors", "alive", "added_at"):
+            old = getattr(self, name)
+            new = np.zeros((capacity, *old.shape[1:]), dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    def add(self, keys: list[tuple[str, str]], vectors: np.ndarray,
+            entries: list[MemoryEntry], added_at: float):
+        for key in keys:
+            self.remove(key)
+        start, end = self.size, self.size + len(keys)
+        self._grow(end)
+        self.vectors[start:end] = vectors
+        self.alive[start:end] = True
+        self.added_at[start:end] = added_at
+        self.keys.extend(keys)
+        self.entries.extend(entries)
+        for row, key in enumerate(keys, start):
+            self.row_of[key] = row
+            self.session_keys.setdefault(key[0], set()).add(key)
+        self.size = end
+        self.live += len(keys)
+
+    def remove(self, key: tuple[str, str]):
+        row = self.row_of.pop(key, None)
+        if row is not None:
+            session_keys = self.session_keys[key[0]]
+            session_keys.discard(key)
+            if not session_keys:
+                del self.session_keys[key[0]]
+            self.alive[row] = False
+            self.entries[row] = None
+            self.keys[row] = None
+            self.live -= 1
+
+    def expire(self, before: float):
+        rows = np.flatnonzero(self.alive[:self.size] & (self.added_at[:self.size] < before))
+        for row in rows:
+            self.remove(self.keys[row])
+
+    def trim(self, max_entries: int):
+        """Drops the oldest memories beyond `max_entries`."""
+        excess = self.live - max_entries
+        if excess <= 0:
+            return
+        rows = np.flatnonzero(self.alive[:self.size])
+        oldest = rows[np.argsort(self.added_at[rows], kind="stable")[:excess]]
+        for row in oldest:
+            self.remove(self.keys[row])
+
+    def compact(self, size: int, rows: np.ndarray,
+                ivf: Optional[tuple[np.ndarray, np.ndarray, np.ndarray]]):
+        """Drops tombstones, keeping `rows` (alive rows below `size`) first.
+
+        With an IVF plan from _plan_ivf those rows are put in cluster order.
+        Rows appended after `size`, or removed since `rows` was taken, are
+        kept as tail rows or tombstones.
+        """
+        if ivf is not None:
+            centroids, order, bounds = ivf
+            rows = rows[order]
+        tail = size + np.flatnonzero(self.alive[size:self.size])
+        keep = np.concatenate([rows, tail])
+        capacity = max(1024, 2 * len(keep))
+        for name in ("vectors", "alive", "added_at"):
+            old = getattr(self, name)
+            new = np.zeros((capacity, *old.shape[1:]), dtype=old.dtype)
+            new[:len(keep)] = old[keep]
+            setattr(self, name, new)
+        self.keys = [self.keys[row] for row in keep]
+        self.entries = [self.entries[row] for row in keep]
+        self.row_of = {key: row for row, key in enumerate(self.keys) if key is not None}
+        self.size = len(keep)
+        self.live = len(self.row_of)
+        self.ivf = _Ivf(centroids, bounds, len(rows)) if ivf is not None else None
+
+    def needs_compaction(self, ivf_threshold: int) -> bool:
+        dead = self.size - self.live
+        if dead > max(1024, self.size // 4):
+            return True
+        if self.ivf is None:
+            return self.live >= ivf_threshold
+        # Rows appended since the IVF was built are scanned linearly.
+        return self.size - self.ivf.size > max(1024, self.ivf.size // 4)
+
+    def search(self, queries: np.ndarray, top_k: int,
+               nprobe: int) -> tuple[np.ndarray, np.ndarray]:
+        """Returns (rows, scores) of the top_k rows for each unit query."""
+        if self.ivf is None:
+            segments = [(0, self.size)]
+            candidate_sets = None
+        else:
+            probes = np.argsort(-(queries @ self.ivf.centroids.T), axis=1)[:, :nprobe]
+            candidate_sets = [set(p.tolist()) for p in probes]
+            clusters = sorted(set().union(*candidate_sets))
+            segments = [
+                (int(self.ivf.bounds[c]), int(self.ivf.bounds[c + 1]))
+                for c in clusters
+            ] + [(self.ivf.size, self.size)]
+        row_ids = np.concatenate([np.arange(a, b) for a, b in segments])
+        scores = np.concatenate(
+            [queries @ self.vectors[a:b].T for a, b in segments], axis=1)
+        scores[:, ~self.alive[row_ids]] = -np.inf
+        if candidate_sets is not None and len(queries) > 1:
+            # Batched queries share the scan; keep each to its own clusters.
+            cluster_of = np.concatenate([
+                np.full(b - a, c) for c, (a, b) in zip(clusters, segments)
+            ] + [np.full(self.size - self.ivf.size, -1)])
+            for i, wanted in enumerate(candidate_sets):
+                outside = ~np.isin(cluster_of, list(wanted) + [-1])
+                scores[i, outside] = -np.inf
+        k = min(top_k, scores.shape[1])
+        if k == 0:
+            empty = np.empty((len(queries), 0))
+            return empty.astype(np.int64), empty
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        return row_ids[top], np.take_along_axis(top_scores, order, axis=1)
+
+    def snapshot(self) -> dict:
+        rows = np.flatnonzero(self.alive[:self.size])
+        return {
+            "vectors": self.vectors[rows],
+            "added_at": self.added_at[rows],
+            "meta": json.dumps({
+                "keys": [self.keys[row] for row in rows],
+                "entries": [
+                    self.entries[row].model_dump(mode="json") for row in rows
+                ],
+            }),
+        }
+
+    @classmethod
+    def restore(cls, data) -> "_UserMemory":
+        vectors = data["vectors"]
+        meta = json.loads(str(data["meta"]))
+        memory = cls(vectors.shape[1], capacity=max(1024, len(vectors)))
+        memory.add(
+            [tuple(key) for key in meta["keys"]],
+            vectors,
+            [MemoryEntry.model_validate(entry) for entry in meta["entries"]],
+            0.0,
+        )
+        memory.added_at[:len(vectors)] = data["added_at"]
+        return memory
+
+
+class VectorMemoryService(BaseMemoryService):
+    """Memory service with cosine top-k search over per-user vector matrices.
+
+    Each (app, user) has its memories in one contiguous float32 matrix of
+    unit vectors, so a search is a single matrix product; past
+    `ivf_threshold` memories it probes an IVF index instead. Memories older
+    than `ttl_seconds` and beyond `max_entries_per_user` are dropped, and at
+    most `max_users` users are kept in memory, least recently used first.
+    With a `snapshot_dir`, evicted users are saved to disk and loaded back
+    on their next use.
+    """
+
+    def __init__(self,
+                 embed_fn: Optional[EmbedFn] = None,
+                 top_k: int = 10,
+                 min_score: float = 0.0,
+                 ivf_threshold: int = 20000,
+                 nprobe: int = 8,
+                 max_entries_per_user: int = 500_000,
+                 ttl_seconds: Optional[float] = None,
+                 max_users: int = 1000,
+                 snapshot_dir: Optional[str] = None):
+        self.embed_fn = embed_fn or hashing_embed_fn()
+        self.top_k = top_k
+        self.min_score = min_score
+        self.ivf_threshold = ivf_threshold
+        self.nprobe = nprobe
+        self.max_entries_per_user = max_entries_per_user
+        self.ttl_seconds = ttl_seconds
+        self.max_users = max_users
+        self.snapshot_dir = snapshot_dir
+        self._users: OrderedDict[tuple[str, str], _UserMemory] = OrderedDict()
+
+    def _snapshot_path(self, user_key: tuple[str, str]) -> str:
+        app_name, user_id = user_key
+        return os.path.join(
+            self.snapshot_dir, quote(app_name, safe=""), quote(user_id, safe="") + ".npz")
+
+    def _write_snapshot(self, path: str, data: dict):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, **data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    async def _load(self, user_key: tuple[str, str]) -> Optional[_UserMemory]:
+        memory = self._users.get(user_key)
+        if memory is None and self.snapshot_dir:
+            path = self._snapshot_path(user_key)
+            if os.path.exists(path):
+                def read():
+                    with np.load(path) as data:
+                        return _UserMemory.restore(data)
+                memory = await asyncio.to_thread(read)
+                # Another call may have loaded or created it meanwhile.
+                memory = self._users.setdefault(user_key, memory)
+        if memory is None:
+            return None
+        self._users.move_to_end(user_key)
+        memory.last_used = time.monotonic()
+        if self.ttl_seconds is not None:
+            memory.expire(time.time() - self.ttl_seconds)
+        return memory
+
+    async def _evict_users(self):
+        while len(self._users) > self.max_users:
+            user_key, memory = self._users.popitem(last=False)
+            if self.snapshot_dir:
+                await asyncio.to_thread(
+                    self._write_snapshot, self._snapshot_path(user_key),
+                    memory.snapshot())
+
+    async def add_session_to_memory(self, session: Session):
+        user_key = (session.app_name, session.user_id)
+        events = [
+            event for event in session.events
+            if event.content and event.content.parts and _event_text(event)
+        ]
+        memory = await self._load(user_key)
+        existing = set(memory.row_of) if memory else set()
+        keys = [(session.id, event.id) for event in events]
+        # Sessions are added again as they grow; embed only the new events.
+        new = [(key, event) for key, event in zip(keys, events) if key not in existing]
+        if memory:
+            stale = memory.session_keys.get(session.id, set()) - set(keys)
+            for key in stale:
+                memory.remove(key)
+        if not new:
+            return
+        vectors = _normalize(await self.embed_fn([_event_text(e) for _, e in new]))
+        # Re-read: the user may have been created or evicted while embedding.
+        memory = await self._load(user_key)
+        if memory is None:
+            memory = self._users[user_key] = _UserMemory(vectors.shape[1])
+        memory.add(
+            [key for key, _ in new],
+            vectors,
+            [
+                MemoryEntry(
+                    content=event.content,
+                    author=event.author,
+                    timestamp=time.strftime(
+                        "%Y-%m-%dT%H:%M:%S", time.localtime(event.timestamp)),
+                )
+                for _, event in new
+            ],
+            time.time(),
+        )
+        memory.trim(self.max_entries_per_user)
+        await self._evict_users()
+        await self._maybe_compact(memory)
+
+    async def _maybe_compact(self, memory: _UserMemory):
+        if memory.compacting or not memory.needs_compaction(self.ivf_threshold):
+            return
+        memory.compacting = True
+        try:
+            size = memory.size
+            rows = np.flatnonzero(memory.alive[:size])
+            ivf = None
+            if len(rows) >= self.ivf_threshold:
+                # Clustering takes a while at this size; keep it off the loop.
+                # Rows below `size` are never written again, only tombstoned.
+                ivf = await asyncio.to_thread(_plan_ivf, memory.vectors, rows)
+            memory.compact(size, rows, ivf)
+        finally:
+            memory.compacting = False
+
+    async def search_memory_batch(
+        self, *, app_name: str, user_id: str, queries: list[str]
+    ) -> list[SearchMemoryResponse]:
+        """Searches several queries with one embedding call and matrix product."""
+        memory = await self._load((app_name, user_id))
+        if memory is None or not memory.live or not queries:
+            return [SearchMemoryResponse() for _ in queries]
+        vectors = _normalize(await self.embed_fn(queries))
+        rows, scores = memory.search(vectors, self.top_k, self.nprobe)
+        responses = []
+        for query_rows, query_scores in zip(rows, scores):
+            responses.append(SearchMemoryResponse(memories=[
+                memory.entries[row]
+                for row, score in zip(query_rows, query_scores)
+                if score > self.min_score and memory.entries[row] is not None
+            ]))
+        return responses
+
+    async def search_memory(
+        self, *, app_name: str, user_id: str, query: str
+    ) -> SearchMemoryResponse:
+        return (await self.search_memory_batch(
+            app_name=app_name, user_id=user_id, queries=[query]))[0]
+
+    async def save_snapshots(self):
+        """Writes every user in memory to the snapshot directory."""
+        if not self.snapshot_dir:
+            return
+        for user_key, memory in list(self._users.items()):
+            await asyncio.to_thread(
+                self._write_snapshot, self._snapshot_path(user_key),
+                memory.snapshot())
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self._users),
+            "memories": sum(memory.live for memory in self._users.values()),
+            "indexed_users": sum(
+                memory.ivf is not None for memory in self._users.values()),
+        }
@@ -0,0 +1,83 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Shared fixtures: the agent server over the benchmark's fake model"""
+
+import os
+
+# Read by the benchmark agent when it is first imported.
+os.environ.setdefault("BENCH_LATENCY_MS", "1")
+os.environ.setdefault("BENCH_TOKENS_PER_SECOND", "10000")
+os.environ.setdefault("BENCH_RESPONSE_TOKENS", "5")
+os.environ.setdefault("BENCH_TOOL_CALLS", "1")
+
+from fastapi.testclient import TestClient
+import pytest
+
+from benchmarks.server_load.server import AGENTS_DIR
+from src.app.fast_api_app import get_fast_api_app
+
+APP_NAME = "bench_agent"
+
+
+def run_request(session_id: str, text: str = "hello", streaming: bool = False) -> dict:
+    return {
+        "app_name": APP_NAME,
+        "user_id": "user",
+        "session_id": session_id,
+        "new_message": {"role": "user", "parts": [{"text": text}]},
+        "streaming": streaming,
+    }
+
+
+def sse_events(text: str) -> list[dict]:
+    """The id and data of each frame of an SSE response body."""
+    events = []
+    for frame in text.split("\n\n"):
+        event = {}
+        for line in frame.splitlines():
+            field, _, value = line.partition(": ")
+            event[field] = value
+        if "data" in event:
+            events.append(event)
+    return events
+
+
+@pytest.fixture
+def make_client(tmp_path):
+    """Builds a TestClient for get_fast_api_app with in-memory services."""
+    clients = []
+
+    def make(**kwargs) -> TestClient:
+        kwargs.setdefault("agent_dir", AGENTS_DIR)
+        kwargs.setdefault("session_service_uri", "memory://")
+        kwargs.setdefault("artifact_service_uri", "memory://")
+        client = TestClient(get_fast_api_app(**kwargs))
+        client.__enter__()
+        clients.append(client)
+        return client
+
+    yield make
+    for client in clients:
+        client.__exit__(None, None, None)
+
+
+@pytest.fixture
+def client(make_client) -> TestClient:
+    return make_client()
+
+
+@pytest.fixture
+def session_id(client) -> str:
+    response = client.post(f"/apps/{APP_NAME}/users/user/sessions")
+    return response.json()["id"]
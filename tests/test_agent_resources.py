@@ -0,0 +1,147 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for reconnecting agent toolsets without breaking runs"""
+
+import asyncio
+from contextlib import AsyncExitStack
+from types import SimpleNamespace
+
+from google.adk.agents import Agent
+from google.adk.tools.base_toolset import BaseToolset
+
+from src.app.agent_resources import AgentResourcePool
+
+
+class FakeToolset(BaseToolset):
+    def __init__(self):
+        super().__init__()
+        self.healthy = True
+        self.closes = 0
+
+    async def get_tools(self, readonly_context=None):
+        if not self.healthy:
+            raise ConnectionError("session lost")
+        return []
+
+    async def close(self):
+        self.closes += 1
+        self.healthy = True
+
+
+def _pool(module, drain_timeout_seconds=5.0) -> AgentResourcePool:
+    async def load_module(app_name):
+        return module
+
+    return AgentResourcePool(load_module, health_check_interval_seconds=0,
+                             drain_timeout_seconds=drain_timeout_seconds)
+
+
+async def _settle():
+    for _ in range(20):
+        await asyncio.sleep(0)
+
+
+def test_toolsets_close_after_runs_finish():
+    toolset = FakeToolset()
+    module = SimpleNamespace(
+        root_agent=Agent(name="agent", model="gemini-2.0-flash", tools=[toolset]))
+
+    async def run():
+        pool = _pool(module)
+        async with pool.lease("app"):
+            toolset.healthy = False
+            await pool.check_health()
+            await _settle()
+            assert toolset.closes == 0
+        await pool._resources["app"].reconnect_task
+        assert toolset.closes == 1
+        assert pool.stats()["app"]["healthy"]
+
+    asyncio.run(run())
+
+
+def test_reconnect_does_not_wait_for_runs_started_after_the_failure():
+    toolset = FakeToolset()
+    module = SimpleNamespace(
+        root_agent=Agent(name="agent", model="gemini-2.0-flash", tools=[toolset]))
+
+    async def run():
+        pool = _pool(module)
+        new_run_started = asyncio.Event()
+
+        async def new_run():
+            async with pool.lease("app"):
+                new_run_started.set()
+                await asyncio.sleep(3600)
+
+        async with pool.lease("app"):
+            toolset.healthy = False
+            await pool.check_health()
+            later = asyncio.create_task(new_run())
+            await new_run_started.wait()
+            await _settle()
+            assert toolset.closes == 0
+        # Only the run from before the failure held up the reconnect.
+        await asyncio.wait_for(pool._resources["app"].reconnect_task, 1.0)
+        assert toolset.closes == 1
+        assert pool.stats()["app"]["runs"] == 1
+        later.cancel()
+
+    asyncio.run(run())
+
+def test_rebuilt_agent_closes_old_resources_after_runs_finish():
+    toolsets = []
+
+    async def create_agent():
+        toolset = FakeToolset()
+        toolsets.append(toolset)
+        return (Agent(name="agent", model="gemini-2.0-flash", tools=[toolset]),
+                AsyncExitStack())
+
+    module = SimpleNamespace(create_agent=create_agent)
+
+    async def run():
+        module.root_agent = create_agent()
+        pool = _pool(module)
+        old_agent = await pool.get("app")
+        async with pool.lease("app"):
+            toolsets[0].healthy = False
+            await pool.check_health()
+            await pool._resources["app"].reconnect_task
+            assert await pool.get("app") is not old_agent
+            await _settle()
+            assert toolsets[0].closes == 0
+        await _settle()
+        assert toolsets[0].closes == 1
+        assert toolsets[1].closes == 0
+        await pool.close()
+        assert toolsets[1].closes == 1
+
+    asyncio.run(run())
+
+
+def test_drain_times_out():
+    toolset = FakeToolset()
+    module = SimpleNamespace(
+        root_agent=Agent(name="agent", model="gemini-2.0-flash", tools=[toolset]))
+
+    async def run():
+        pool = _pool(module, drain_timeout_seconds=0.01)
+        async with pool.lease("app"):
+            toolset.healthy = False
+            await pool.check_health()
+            await pool._resources["app"].reconnect_task
+            assert toolset.closes == 1
+
+    asyncio.run(run())
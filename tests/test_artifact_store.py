@@ -0,0 +1,158 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the tiered artifact store"""
+
+import asyncio
+import os
+
+from fastapi.testclient import TestClient
+from google.genai import types
+import pytest
+
+from src.app.artifact_store import (
+    BlobStore,
+    InvalidArtifactKey,
+    LocalBlobStore,
+    TieredArtifactService,
+    parse_byte_range,
+)
+from src.app.fast_api_app import get_fast_api_app
+
+
+@pytest.fixture
+def store_root(tmp_path):
+    root = tmp_path / "store"
+    root.mkdir()
+    return root
+
+
+@pytest.mark.parametrize("key", [
+    ("..", "..", "..", "victim"),
+    ("app", "user", "..", "victim"),
+    ("app", ".", "session", "victim"),
+    ("app", "user", "session", ".."),
+    ("app", "", "session", "victim"),
+])
+def test_local_store_rejects_traversal(store_root, key):
+    store = LocalBlobStore(str(store_root))
+    with pytest.raises(InvalidArtifactKey):
+        store.read_manifest(key)
+    with pytest.raises(InvalidArtifactKey):
+        store.update_manifest(key, lambda manifest: {"versions": []})
+    if key[3] != "..":
+        with pytest.raises(InvalidArtifactKey):
+            store.list_manifests(key[:3])
+
+
+def test_local_store_quotes_separators(store_root):
+    store = LocalBlobStore(str(store_root))
+    key = ("app", "user", "../..", "a/../../b")
+    store.update_manifest(key, lambda manifest: {"versions": []})
+    assert store.read_manifest(key) == {"versions": []}
+    assert store.list_manifests(key[:3]) == ["a/../../b"]
+    for dirpath, _, filenames in os.walk(store_root.parent):
+        for name in filenames:
+            assert os.path.realpath(dirpath).startswith(os.path.realpath(store_root))
+
+
+def test_local_store_refuses_symlink_out_of_root(store_root, tmp_path):
+    outside = tmp_path / "outside"
+    outside.mkdir()
+    (store_root / "manifests").mkdir(exist_ok=True)
+    os.symlink(outside, store_root / "manifests" / "app")
+    store = LocalBlobStore(str(store_root))
+    with pytest.raises(InvalidArtifactKey):
+        store.update_manifest(("app", "u", "s", "f"), lambda manifest: {"versions": []})
+    assert not list(outside.iterdir())
+
+
+def test_artifact_endpoints_reject_traversal(tmp_path):
+    # manifests/../../../victim.json from the store root.
+    victim = tmp_path / "victim.json"
+    victim.write_text("{}")
+    app = get_fast_api_app(
+        agent_dir=str(tmp_path),
+        session_service_uri="memory://",
+        artifact_service_uri=f"file://{tmp_path}/x/store",
+    )
+    client = TestClient(app)
+    url = "/apps/%2E%2E/users/%2E%2E/sessions/%2E%2E/artifacts/victim"
+    assert client.delete(url).status_code == 400
+    assert client.get(url).status_code == 400
+    assert victim.exists()
+
+
+def test_blob_store_is_abstract():
+    with pytest.raises(TypeError):
+        BlobStore()
+
+
+def test_round_trip(store_root):
+    service = TieredArtifactService(LocalBlobStore(str(store_root)))
+    part = types.Part.from_bytes(data=b"hello", mime_type="text/plain")
+
+    async def run():
+        await service.save_artifact(app_name="a", user_id="u", session_id="s",
+                                    filename="f.txt", artifact=part)
+        return await service.load_artifact(app_name="a", user_id="u",
+                                           session_id="s", filename="f.txt")
+
+    assert asyncio.run(run()).inline_data.data == b"hello"
+
+
+
+@pytest.mark.parametrize("session_id", [":user", "user", "%3Auser"])
+def test_session_cannot_reach_user_artifacts(store_root, session_id):
+    service = TieredArtifactService(LocalBlobStore(str(store_root)))
+    key = dict(app_name="a", user_id="u")
+
+    async def run():
+        await service.save_artifact(**key, session_id="s", filename="user:profile",
+                                    artifact=types.Part(text="user"))
+        await service.save_artifact(**key, session_id=session_id,
+                                    filename="user:profile",
+                                    artifact=types.Part(text="session"))
+        await service.save_artifact(**key, session_id=session_id,
+                                    filename="notes", artifact=types.Part(text="x"))
+        return (
+            await service.list_versions(**key, session_id="s",
+                                        filename="user:profile"),
+            await service.list_artifact_keys(**key, session_id="s"),
+            await service.list_artifact_keys(**key, session_id=session_id),
+        )
+
+    versions, user_keys, session_keys = asyncio.run(run())
+    # Both saves are versions of the one user-scoped artifact...
+    assert versions == [0, 1]
+    # ...and the session's own files stay out of other sessions' listings.
+    assert user_keys == ["user:profile"]
+    assert session_keys == ["notes", "user:profile"]
+
+@pytest.mark.parametrize("header,expected", [
+    (None, None),
+    ("bytes=0-4", (0, 5)),
+    ("bytes=5-", (5, 10)),
+    ("bytes=-3", (7, 10)),
+    ("bytes=-30", (0, 10)),
+    ("bytes=0-1,4-5", None),
+    ("bytes=x-y", None),
+])
+def test_parse_byte_range(header, expected):
+    assert parse_byte_range(header, 10) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=-0", "bytes=10-", "bytes=5-2"])
+def test_parse_byte_range_unsatisfiable(header):
+    with pytest.raises(ValueError):
+        parse_byte_range(header, 10)
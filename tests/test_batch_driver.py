@@ -0,0 +1,127 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the batch driver's checkpoints"""
+
+import asyncio
+import json
+
+from google.adk.events import Event
+from google.adk.sessions import Session
+from google.genai import types
+
+from src.app.agent_runtime_client import (AgentRuntime, BatchDriver,
+                                          batch_item_key)
+from tests.conftest import APP_NAME
+
+
+class _FakeRuntime(AgentRuntime):
+    """Answers every message with its upper-case text, or fails on "fail"."""
+
+    def __init__(self, session: Session, calls: list[str], failing: set[str]):
+        super().__init__(session)
+        self.calls = calls
+        self.failing = failing
+
+    async def stream_query(self, message: str):
+        self.calls.append(message)
+        self.last_error = None
+        if message in self.failing:
+            self.last_error = "RuntimeError: agent failed"
+            return
+        yield Event(author="agent", content=types.Content(
+            role="model", parts=[types.Part(text=message.upper())]))
+
+    def is_streaming(self) -> bool:
+        return False
+
+
+def _items(messages):
+    return [(Session(app_name=APP_NAME, user_id="user", id=f"s{i}"), message)
+            for i, message in enumerate(messages)]
+
+
+def _run(tmp_path, items, calls, failing=(), **kwargs):
+    driver = BatchDriver(
+        output_path=str(tmp_path / "results.jsonl"),
+        checkpoint_path=str(tmp_path / "results.checkpoint"),
+        concurrency=2,
+        runtime_factory=lambda session: _FakeRuntime(session, calls, set(failing)),
+        **kwargs)
+    return asyncio.run(driver.run(items))
+
+
+def _results(tmp_path):
+    with open(tmp_path / "results.jsonl", encoding="utf-8") as results:
+        return [json.loads(line) for line in results]
+
+
+def test_writes_results_and_checkpoint(tmp_path):
+    items = _items(["a", "b", "c"])
+    calls = []
+    stats = _run(tmp_path, items, calls)
+    assert stats["succeeded"] == 3 and stats["skipped"] == 0
+    results = {r["key"]: r for r in _results(tmp_path)}
+    for session, message in items:
+        result = results[batch_item_key(session, message)]
+        assert result["response"] == message.upper()
+        assert result["session_id"] == session.id
+    with open(tmp_path / "results.checkpoint", encoding="utf-8") as checkpoint:
+        entries = [json.loads(line) for line in checkpoint]
+    assert {e["key"] for e in entries} == set(results)
+    assert all(e["ok"] for e in entries)
+
+
+def test_rerun_skips_checkpointed_items(tmp_path):
+    items = _items(["a", "b", "c"])
+    _run(tmp_path, items[:2], [])
+    calls = []
+    stats = _run(tmp_path, items, calls)
+    assert calls == ["c"]
+    assert stats["skipped"] == 2 and stats["completed"] == 1
+    assert len(_results(tmp_path)) == 3
+
+
+def test_rerun_retries_failed_items(tmp_path):
+    items = _items(["a", "fail"])
+    stats = _run(tmp_path, items, [], failing={"fail"})
+    assert stats["failed"] == 1 and stats["errors"] == {"RuntimeError": 1}
+    calls = []
+    stats = _run(tmp_path, items, calls)
+    assert calls == ["fail"]
+    assert stats["succeeded"] == 1 and stats["skipped"] == 1
+    calls = []
+    _run(tmp_path, items, calls)
+    assert calls == []
+
+
+def test_rerun_keeps_failed_items_without_retry_errors(tmp_path):
+    items = _items(["a", "fail"])
+    _run(tmp_path, items, [], failing={"fail"})
+    calls = []
+    stats = _run(tmp_path, items, calls, retry_errors=False)
+    assert calls == []
+    assert stats["skipped"] == 2
+
+
+def test_ignores_torn_checkpoint_line(tmp_path):
+    items = _items(["a", "b"])
+    _run(tmp_path, items[:1], [])
+    with open(tmp_path / "results.checkpoint", "a", encoding="utf-8") as checkpoint:
+        checkpoint.write('{"key": "')
+    calls = []
+    _run(tmp_path, items, calls)
+    assert calls == ["b"]
+    calls = []
+    _run(tmp_path, items, calls)
+    assert calls == []
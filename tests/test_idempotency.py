@@ -0,0 +1,101 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for Idempotency-Key handling of agent runs"""
+
+import asyncio
+import functools
+
+from google.adk.events import Event
+import pytest
+
+from src.app import fast_api_app
+from src.app.idempotency import IdempotencyConflict, IdempotencyStore, RunRecord
+from tests.conftest import APP_NAME, run_request, sse_events
+
+
+async def _events(count: int, fail: bool = False):
+    for _ in range(count):
+        yield Event(author="agent")
+        await asyncio.sleep(0)
+    if fail:
+        raise RuntimeError("model failed")
+
+
+def test_record_bounds_events_while_running():
+    async def run():
+        record = RunRecord("fp", max_events=3)
+        follower = record.subscribe()
+        record.start(_events(10))
+        received = [event async for event in follower]
+        return record, received
+
+    record, received = asyncio.run(run())
+    assert len(received) == 10
+    assert len(record.events) == 3
+    assert not record.can_replay()
+    with pytest.raises(IdempotencyConflict):
+        record.subscribe()
+
+
+def test_failed_run_is_dropped():
+    async def run():
+        store = IdempotencyStore()
+        record, _ = store.get_or_reserve(("app", "user"), "key", "fp")
+        store.start(("app", "user"), "key", record, _events(2, fail=True))
+        with pytest.raises(RuntimeError):
+            async for _ in record.subscribe():
+                pass
+        return store.get_or_reserve(("app", "user"), "key", "fp")
+
+    record, created = asyncio.run(run())
+    assert created
+
+
+def test_retry_replays_without_running_again(client, session_id):
+    headers = {"Idempotency-Key": "k1"}
+    first = client.post("/run", json=run_request(session_id), headers=headers)
+    second = client.post("/run", json=run_request(session_id), headers=headers)
+    assert first.status_code == second.status_code == 200
+    assert [e["id"] for e in first.json()] == [e["id"] for e in second.json()]
+    session = client.get(f"/apps/{APP_NAME}/users/user/sessions/{session_id}").json()
+    assert len(session["events"]) == 1 + len(first.json())
+
+
+def test_key_reused_for_other_request_conflicts(client, session_id):
+    headers = {"Idempotency-Key": "k1"}
+    client.post("/run", json=run_request(session_id), headers=headers)
+    response = client.post(
+        "/run", json=run_request(session_id, "other"), headers=headers)
+    assert response.status_code == 409
+
+
+@pytest.mark.parametrize("endpoint", ["/run", "/run_sse"])
+def test_unreplayable_retry_conflicts(make_client, monkeypatch, endpoint):
+    monkeypatch.setattr(fast_api_app, "IdempotencyStore",
+                        functools.partial(IdempotencyStore, max_events_per_run=1))
+    client = make_client()
+    session_id = client.post(f"/apps/{APP_NAME}/users/user/sessions").json()["id"]
+    headers = {"Idempotency-Key": "k1"}
+    first = client.post(endpoint, json=run_request(session_id), headers=headers)
+    assert first.status_code == 200
+    second = client.post(endpoint, json=run_request(session_id), headers=headers)
+    assert second.status_code == 409
+
+
+def test_sse_retry_replays_same_ids(client, session_id):
+    headers = {"Idempotency-Key": "k1"}
+    request = run_request(session_id, streaming=True)
+    first = sse_events(client.post("/run_sse", json=request, headers=headers).text)
+    second = sse_events(client.post("/run_sse", json=request, headers=headers).text)
+    assert [e["id"] for e in first] == [e["id"] for e in second]
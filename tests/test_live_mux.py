@@ -0,0 +1,35 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the multiplexed live websocket"""
+
+import pytest
+
+from tests.conftest import APP_NAME
+
+
+@pytest.mark.parametrize("credits", [None, "many", 1.5, True, -1, 0])
+def test_bad_credit_is_an_error_for_its_channel(client, session_id, credits):
+    with client.websocket_connect("/run_live_mux") as websocket:
+        websocket.send_json({"type": "open", "channel": "c1", "app_name": APP_NAME,
+                             "user_id": "user", "session_id": session_id})
+        assert websocket.receive_json()["type"] == "opened"
+        websocket.send_json({"type": "credit", "channel": "c1", "credits": credits})
+        error = websocket.receive_json()
+        assert error["type"] == "error"
+        assert error["channel"] == "c1"
+        # The connection and the channel are still usable.
+        websocket.send_json({"type": "credit", "channel": "c1", "credits": 4})
+        websocket.send_json({"type": "close", "channel": "c1"})
+        assert websocket.receive_json() == {
+            "type": "closed", "channel": "c1", "reason": "closed"}
@@ -0,0 +1,99 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the run metrics of the agent server"""
+
+import asyncio
+import json
+
+from prometheus_client.parser import text_string_to_metric_families
+import pytest
+
+from src.app.session_cache import CachedSessionService
+from tests.conftest import run_request
+
+SESSION_FETCH_SECONDS = 0.2
+
+
+def _samples(client) -> dict:
+    samples = {}
+    for family in text_string_to_metric_families(client.get("/metrics").text):
+        for sample in family.samples:
+            labels = tuple(sorted(sample.labels.items()))
+            samples[(sample.name, labels)] = sample.value
+    return samples
+
+
+def _value(samples: dict, name: str, **labels) -> float:
+    return samples.get((name, tuple(sorted(labels.items()))), 0.0)
+
+
+@pytest.mark.parametrize("endpoint", ["run", "run_sse", "run_ndjson"])
+def test_run_timing_includes_session_fetch(client, session_id, monkeypatch, endpoint):
+    get_session = CachedSessionService.get_session
+
+    async def slow_get_session(self, **kwargs):
+        await asyncio.sleep(SESSION_FETCH_SECONDS)
+        return await get_session(self, **kwargs)
+
+    monkeypatch.setattr(CachedSessionService, "get_session", slow_get_session)
+    response = client.post(f"/{endpoint}", json=run_request(session_id))
+    assert response.status_code == 200
+    samples = _samples(client)
+    labels = {"app_name": "bench_agent", "endpoint": endpoint}
+    assert _value(samples, "agent_run_duration_seconds_sum", **labels) >= SESSION_FETCH_SECONDS
+    assert (_value(samples, "agent_time_to_first_event_seconds_sum", **labels)
+            >= SESSION_FETCH_SECONDS)
+    assert _value(samples, "agent_runs_in_flight", **labels) == 0
+
+
+@pytest.mark.parametrize("endpoint", ["run", "run_sse", "run_ndjson"])
+def test_rejected_run_is_counted_once(client, endpoint):
+    response = client.post(f"/{endpoint}", json=run_request("missing"))
+    assert response.status_code == 404
+    samples = _samples(client)
+    labels = {"app_name": "bench_agent", "endpoint": endpoint}
+    assert _value(samples, "agent_runs_total", status="error", **labels) == 1
+    assert _value(samples, "agent_runs_in_flight", **labels) == 0
+
+
+@pytest.mark.parametrize("endpoint", ["run_sse", "run_ndjson"])
+def test_client_leaving_before_the_stream_starts(client, session_id, endpoint):
+    body = json.dumps(run_request(session_id)).encode()
+    received = []
+
+    async def receive():
+        # The request body, then a client that has already gone.
+        received.append(None)
+        if len(received) == 1:
+            return {"type": "http.request", "body": body}
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        # Suspends, so the disconnect lands before the stream is pulled.
+        await asyncio.sleep(0)
+
+    async def request():
+        await client.app({
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+            "method": "POST", "scheme": "http", "path": f"/{endpoint}",
+            "raw_path": f"/{endpoint}".encode(), "query_string": b"",
+            "root_path": "", "server": ("testserver", 80),
+            "headers": [(b"content-type", b"application/json")],
+        }, receive, send)
+
+    client.portal.call(request)
+    samples = _samples(client)
+    labels = {"app_name": "bench_agent", "endpoint": endpoint}
+    assert _value(samples, "agent_runs_in_flight", **labels) == 0
+    assert _value(samples, "agent_runs_total", status="error", **labels) == 1
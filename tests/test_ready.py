@@ -0,0 +1,88 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for agent preloading and /ready"""
+
+import signal
+import time
+
+from src.app import fast_api_app
+
+# Fails its first `failures` imports, counted in a file next to it.
+FLAKY_AGENT = """
+from pathlib import Path
+
+from google.adk.agents import Agent
+
+_attempts = Path(__file__).with_name("attempts")
+attempt = int(_attempts.read_text()) + 1 if _attempts.exists() else 1
+_attempts.write_text(str(attempt))
+if attempt <= {failures}:
+    raise RuntimeError(f"backend down on attempt {{attempt}}")
+
+root_agent = Agent(name="flaky_agent", model="gemini-2.0-flash")
+"""
+
+
+def _agents_dir(tmp_path, failures: int) -> str:
+    # Named after the test, so each test imports its own agent module.
+    agents_dir = tmp_path / f"agents_{tmp_path.name}"
+    agent_dir = agents_dir / "flaky_agent"
+    agent_dir.mkdir(parents=True)
+    (agent_dir / "__init__.py").write_text("from . import agent\n")
+    (agent_dir / "agent.py").write_text(FLAKY_AGENT.format(failures=failures))
+    return str(agents_dir)
+
+
+def _wait_for(client, predicate, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        response = client.get("/ready")
+        if predicate(response) or time.monotonic() > deadline:
+            return response
+        time.sleep(0.02)
+
+
+def test_preload_is_retried_until_ready(make_client, tmp_path):
+    client = make_client(agent_dir=_agents_dir(tmp_path, failures=2),
+                         preload_apps=["flaky_agent"],
+                         preload_retry_delay_seconds=0.01)
+    response = _wait_for(client, lambda r: r.status_code == 200)
+    assert response.status_code == 200
+    assert response.json()["apps"] == ["flaky_agent"]
+
+
+def test_failed_preload_is_reported(make_client, tmp_path):
+    client = make_client(agent_dir=_agents_dir(tmp_path, failures=100),
+                         preload_apps=["flaky_agent"],
+                         preload_max_attempts=3,
+                         preload_retry_delay_seconds=0.01)
+    response = _wait_for(
+        client, lambda r: r.json()["detail"]["status"] == "failed")
+    assert response.status_code == 503
+    detail = response.json()["detail"]
+    assert detail["status"] == "failed"
+    assert detail["attempts"] == 3
+    assert "backend down on attempt 3" in detail["errors"]["flaky_agent"]
+
+
+def test_failed_preload_can_stop_the_server(make_client, tmp_path, monkeypatch):
+    signals = []
+    monkeypatch.setattr(fast_api_app.os, "kill",
+                        lambda pid, sig: signals.append(sig))
+    client = make_client(agent_dir=_agents_dir(tmp_path, failures=100),
+                         preload_apps=["flaky_agent"],
+                         preload_max_attempts=1,
+                         exit_on_preload_failure=True)
+    _wait_for(client, lambda r: r.json()["detail"]["status"] == "failed")
+    assert signals == [signal.SIGTERM]
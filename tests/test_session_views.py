@@ -0,0 +1,50 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for paginated session listings"""
+
+import asyncio
+
+import pytest
+
+from src.app.session_services import build_session_service
+from src.app.session_views import list_session_page
+
+
+@pytest.mark.parametrize("uri", ["memory://", "sqlite:///{tmp_path}/sessions.db"])
+def test_pages_have_the_same_shape_on_every_backend(tmp_path, uri):
+    service = build_session_service(uri.format(tmp_path=tmp_path))
+
+    async def run():
+        for index in range(5):
+            await service.create_session(
+                app_name="app", user_id="user", state={"index": index})
+        pages, token = [], None
+        while True:
+            page = await list_session_page(
+                service, app_name="app", user_id="user", page_size=2,
+                page_token=token)
+            pages.append(page.sessions)
+            token = page.next_page_token
+            if not token:
+                return pages
+
+    pages = asyncio.run(run())
+    assert [len(page) for page in pages] == [2, 2, 1]
+    sessions = [session for page in pages for session in page]
+    assert len({session.id for session in sessions}) == 5
+    for session in sessions:
+        assert session.state == {}
+        assert session.events == []
+    times = [session.last_update_time for session in sessions]
+    assert times == sorted(times, reverse=True)
@@ -0,0 +1,142 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for resuming /run_sse streams with Last-Event-ID"""
+
+import asyncio
+
+from google.adk.events import Event
+from google.adk.sessions import Session
+from google.genai import types
+import httpx
+import pytest
+
+from benchmarks.server_load.server import AGENTS_DIR
+from src.app.agent_runtime_client import FastAPIEngineRuntime
+from src.app.fast_api_app import get_fast_api_app
+from src.app.session_views import resume_events
+from tests.conftest import APP_NAME, run_request, sse_events
+
+
+def _content(text: str) -> types.Content:
+    return types.Content(role="user", parts=[types.Part(text=text)])
+
+
+def _session_events() -> list[Event]:
+    return [
+        Event(author="user", invocation_id="i1", content=_content("first")),
+        Event(author="agent", invocation_id="i1"),
+        Event(author="user", invocation_id="i2", content=_content("second")),
+        Event(author="agent", invocation_id="i2"),
+        Event(author="agent", invocation_id="i2"),
+    ]
+
+
+def test_resume_after_a_stored_event():
+    events = _session_events()
+    assert resume_events(events, events[3].id, None) == events[4:]
+    assert resume_events(events, events[1].id, None) == []
+
+
+def test_resume_after_an_unstored_event_replays_the_run():
+    events = _session_events()
+    assert resume_events(events, "partial", _content("second")) == events[3:]
+    assert resume_events(events, "partial", _content("never sent")) is None
+
+
+def test_resume_from_run_record(client, session_id):
+    headers = {"Idempotency-Key": "k1"}
+    request = run_request(session_id, streaming=True)
+    full = sse_events(client.post("/run_sse", json=request, headers=headers).text)
+    assert len(full) > 2
+    resumed = sse_events(client.post(
+        "/run_sse", json=request,
+        headers={**headers, "Last-Event-ID": full[1]["id"]}).text)
+    assert [e["id"] for e in resumed] == [e["id"] for e in full[2:]]
+
+
+def test_resume_from_session(client, session_id):
+    request = run_request(session_id)
+    full = sse_events(client.post("/run_sse", json=request).text)
+    resumed = sse_events(client.post(
+        "/run_sse", json=request, headers={"Last-Event-ID": full[0]["id"]}).text)
+    assert [e["id"] for e in resumed] == [e["id"] for e in full[1:]]
+    session = client.get(f"/apps/{APP_NAME}/users/user/sessions/{session_id}").json()
+    assert len(session["events"]) == 1 + len(full)
+
+
+class _DroppingTransport(httpx.AsyncBaseTransport):
+    """Breaks the first /run_sse response after `drop_after` SSE frames.
+
+    ASGITransport hands over the body in one chunk, so it is split into
+    frames here to cut the stream at an event boundary.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, drop_after: int):
+        self.transport = transport
+        self.drop_after = drop_after
+        self.requests: list[httpx.Request] = []
+        self.dropped = False
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        response = await self.transport.handle_async_request(request)
+        if self.dropped or request.url.path != "/run_sse":
+            return response
+        self.dropped = True
+        frames = (await response.aread()).split(b"\n\n")[:self.drop_after]
+
+        class Dropping(httpx.AsyncByteStream):
+            async def __aiter__(self):
+                for frame in frames:
+                    yield frame + b"\n\n"
+                raise httpx.ReadError("connection lost")
+
+        return httpx.Response(response.status_code, headers=response.headers,
+                              stream=Dropping())
+
+
+@pytest.mark.parametrize("drop_after", [1, 3])
+def test_client_reconnects_without_rerunning(monkeypatch, drop_after):
+    monkeypatch.setattr(
+        "src.app.agent_runtime_client.RETRY_BASE_DELAY_SECONDS", 0.001)
+    app = get_fast_api_app(agent_dir=AGENTS_DIR, session_service_uri="memory://",
+                           artifact_service_uri="memory://")
+
+    async def run():
+        transport = _DroppingTransport(httpx.ASGITransport(app=app), drop_after)
+        async with httpx.AsyncClient(transport=transport,
+                                     base_url="http://server") as http_client:
+            created = await http_client.post(
+                f"/apps/{APP_NAME}/users/user/sessions")
+            session = Session(app_name=APP_NAME, user_id="user",
+                              id=created.json()["id"])
+            runtime = FastAPIEngineRuntime(session, "http://server",
+                                           http_client=http_client)
+            events = [event async for event in runtime.stream_query(
+                "hello", partial_events=True)]
+            stored = await http_client.get(
+                f"/apps/{APP_NAME}/users/user/sessions/{session.id}")
+            return runtime, transport, events, stored.json()["events"]
+
+    runtime, transport, events, stored = asyncio.run(run())
+    assert runtime.last_error is None
+    # create session, the dropped run, the resumed run, get session
+    assert len(transport.requests) == 4
+    resumed = transport.requests[2]
+    assert resumed.headers["Last-Event-ID"]
+    assert resumed.headers["Idempotency-Key"] == (
+        transport.requests[1].headers["Idempotency-Key"])
+    assert len({event.id for event in events}) == len(events)
+    final = [event for event in events if not event.partial]
+    assert [event.id for event in final] == [event["id"] for event in stored[1:]]
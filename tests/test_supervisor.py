@@ -0,0 +1,114 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the supervisor's worker configuration and routing"""
+
+import asyncio
+
+from fastapi import FastAPI, HTTPException
+from google.adk.events import Event, EventActions
+import httpx
+
+from src.app.session_cache import CachedSessionService
+from src.app.session_services import build_session_service
+from src.app.supervisor import Router, set_shared_defaults
+from tests.conftest import APP_NAME
+
+
+def test_defaults_to_shared_sqlite_and_files():
+    environ = {}
+    set_shared_defaults(environ, "/run/agents")
+    assert environ == {
+        "SESSION_SERVICE_URI": "sqlite:////run/agents/sessions.db",
+        "ARTIFACT_SERVICE_URI": "file:///run/agents/artifacts",
+        "SESSION_CACHE_TTL_SECONDS": "0",
+    }
+
+
+def test_agent_engine_id_keeps_agent_engine_sessions():
+    environ = {"AGENT_ENGINE_ID": "123"}
+    set_shared_defaults(environ, "/run/agents")
+    assert "SESSION_SERVICE_URI" not in environ
+
+
+def test_configured_uris_are_kept():
+    environ = {
+        "SESSION_SERVICE_URI": "postgresql://db/sessions",
+        "ARTIFACT_SERVICE_URI": "gs://bucket",
+        "AGENT_ENGINE_ID": "123",
+    }
+    set_shared_defaults(environ, "/run/agents")
+    assert environ["SESSION_SERVICE_URI"] == "postgresql://db/sessions"
+    assert environ["ARTIFACT_SERVICE_URI"] == "gs://bucket"
+
+
+def test_workers_see_each_others_session_updates(tmp_path):
+    """A run on one worker after another appended to the session (as
+    /run_live_mux does) must not fail on a cached, stale session."""
+    environ = {}
+    set_shared_defaults(environ, str(tmp_path))
+
+    def worker() -> CachedSessionService:
+        return CachedSessionService(
+            build_session_service(environ["SESSION_SERVICE_URI"]),
+            ttl_seconds=float(environ["SESSION_CACHE_TTL_SECONDS"]))
+
+    def update(key: str) -> Event:
+        return Event(author="user", actions=EventActions(state_delta={key: 1}))
+
+    async def run():
+        first, second = worker(), worker()
+        session = await first.create_session(app_name=APP_NAME, user_id="user")
+        key = dict(app_name=APP_NAME, user_id="user", session_id=session.id)
+        await first.get_session(**key)
+        # SQLite keeps update times to the second.
+        await asyncio.sleep(1.1)
+        await second.append_event(await second.get_session(**key), update("a"))
+        await first.append_event(await first.get_session(**key), update("b"))
+        return await second.get_session(**key)
+
+    session = asyncio.run(run())
+    assert session.state == {"a": 1, "b": 1}
+
+
+def _trace_worker(event_ids: set[str]) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/debug/trace/{event_id}")
+    def get_trace_dict(event_id: str):
+        if event_id not in event_ids:
+            raise HTTPException(status_code=404, detail="Trace not found")
+        return {"event_id": event_id}
+
+    return app
+
+
+def test_trace_lookups_reach_the_worker_holding_the_trace():
+    router = Router(["/nonexistent/worker-0.sock", "/nonexistent/worker-1.sock"])
+    router._clients = [
+        httpx.AsyncClient(transport=httpx.ASGITransport(app=_trace_worker(ids)),
+                          base_url="http://worker")
+        for ids in ({"a"}, {"b"})
+    ]
+
+    async def get_all(paths):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=router),
+                                     base_url="http://router") as client:
+            return [await client.get(path) for path in paths]
+
+    found = asyncio.run(get_all(["/debug/trace/b"] * 4 + ["/debug/trace/a"]))
+    assert [r.status_code for r in found] == [200] * 5
+    assert [r.headers["x-served-by"] for r in found] == ["1"] * 4 + ["0"]
+    assert found[0].json() == {"event_id": "b"}
+    [missing] = asyncio.run(get_all(["/debug/trace/c"]))
+    assert missing.status_code == 404